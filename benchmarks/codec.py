@@ -0,0 +1,74 @@
+"""Wire codec throughput
+
+Run from the repository root::
+
+    python -m benchmarks.codec
+
+Compares the JSON path used before codecs were negotiated (a JSON string
+nested in the message), the JSON codec and the binary codec on world state
+payloads of growing size.
+"""
+import json
+from timeit import repeat
+
+from the_game.codec import BinaryCodec, JsonCodec
+from the_game.messaging import Message, MessageType
+
+ENTITY_COUNTS = (2, 10, 100, 1_000, 10_000)
+
+
+def state(n_entities: int) -> dict:
+    """A keyframe payload with `n_entities` entities"""
+    return {
+        "seq": 1,
+        "base": None,
+        "entities": [[i, 3, i % 1024, i // 1024] for i in range(n_entities)],
+        "removed": [],
+    }
+
+
+def best(stmt, number: int) -> float:
+    """Best time per call in microseconds"""
+    return min(repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    """Benchmark entrypoint"""
+    codecs = {"nested json": None, "json": JsonCodec(), "binary": BinaryCodec()}
+    print(
+        f"{'entities':>8} {'codec':>12} {'bytes':>9} "
+        f"{'encode us':>10} {'decode us':>10} {'MB/s out':>9}"
+    )
+    for n_entities in ENTITY_COUNTS:
+        payload = state(n_entities)
+        number = max(10, 20_000 // n_entities)
+        for name, codec in codecs.items():
+            if codec is None:
+                message = Message(MessageType.MOVE, json.dumps(payload))
+
+                def encode():
+                    return Message(MessageType.MOVE, json.dumps(payload)).serialize()
+
+                def decode():
+                    return json.loads(Message.deserialize(data)["content"])
+
+            else:
+                message = Message(MessageType.MOVE, payload)
+
+                def encode():
+                    return codec.encode(message)
+
+                def decode():
+                    return codec.decode(data)
+
+            data = encode()
+            assert decode() == payload or decode() == message
+            encode_us = best(encode, number)
+            print(
+                f"{n_entities:>8} {name:>12} {len(data):>9} {encode_us:>10.1f} "
+                f"{best(decode, number):>10.1f} {len(data) / encode_us:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Distance field computation from the 16x12 game grid up to 1024x1024
+
+Run from the repository root::
+
+    python -m benchmarks.distances
+
+Compares a plain Python breadth-first search over a deque with the frontier
+based `distance_field`, and reports the cost of a `FieldCache` hit.
+"""
+from collections import deque
+from timeit import repeat
+
+import numpy as np
+
+from the_game.distances import UNREACHABLE, FieldCache, distance_field
+
+SIZES = ((16, 12), (64, 64), (256, 256), (1024, 1024))
+OBSTACLE_DENSITY = 0.2
+
+
+def python_bfs(passable: np.ndarray, x: int, y: int) -> np.ndarray:
+    """Reference breadth-first search, one cell at a time"""
+    height, width = passable.shape
+    open_cells = passable.tolist()
+    dist = [[UNREACHABLE] * width for _ in range(height)]
+    dist[y][x] = 0
+    q = deque([(x, y)])
+    while q:
+        x, y = q.popleft()
+        d = dist[y][x] + 1
+        for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if 0 <= nx < width and 0 <= ny < height and open_cells[ny][nx] and dist[ny][nx] == UNREACHABLE:
+                dist[ny][nx] = d
+                q.append((nx, ny))
+    return np.array(dist, dtype=np.int32)
+
+
+def best(stmt, number: int) -> float:
+    """Best time per call in milliseconds"""
+    return min(repeat(stmt, number=number, repeat=3)) / number * 1e3
+
+
+def main():
+    """Benchmark entrypoint"""
+    rng = np.random.default_rng(0)
+    print(f"{'grid':>10} {'python ms':>10} {'numpy ms':>9} {'limit=8 ms':>11} {'cached us':>10}")
+    for width, height in SIZES:
+        passable = rng.random((height, width)) > OBSTACLE_DENSITY
+        x, y = width // 2, height // 2
+        assert (python_bfs(passable, x, y) == distance_field(passable, x, y)).all()
+
+        number = max(1, 100_000 // (width * height))
+        cache = FieldCache()
+        cache.get(passable, 0, x, y)
+        print(
+            f"{width:>5}x{height:<4} "
+            f"{best(lambda: python_bfs(passable, x, y), number):>10.2f} "
+            f"{best(lambda: distance_field(passable, x, y), number):>9.2f} "
+            f"{best(lambda: distance_field(passable, x, y, 8), number):>11.3f} "
+            f"{best(lambda: cache.get(passable, 0, x, y), 1000) * 1e3:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
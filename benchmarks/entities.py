@@ -0,0 +1,67 @@
+"""Entity store lookups versus a list of objects
+
+Run from the repository root::
+
+    python -m benchmarks.entities
+
+Worlds are filled with random entities. "what is at (x, y)" and a blocked-move
+check are timed against the store's occupancy grid and, for comparison, a scan
+of a plain list of objects, which is how `Game.objects` used to be searched.
+"""
+from time import perf_counter
+
+import numpy as np
+
+from the_game.entities import EMPTY, EntityStore
+
+LOOKUPS = 1_000
+
+
+def fill(store: EntityStore, n: int, rng: np.random.Generator):
+    """Add n entities on distinct random cells"""
+    cells = rng.choice(store.width * store.height, n, replace=False)
+    ys, xs = np.divmod(cells, store.width)
+    store.add_many(rng.integers(1, 5, n), xs, ys)
+
+
+def main():
+    """Benchmark entrypoint"""
+    rng = np.random.default_rng(0)
+    print(
+        f"{'entities':>9} {'world':>10} {'add_many ms':>12} "
+        f"{'at() us':>8} {'move us':>8} {'list scan us':>13}"
+    )
+    for n, size in ((1_000, 256), (10_000, 512), (100_000, 1024), (500_000, 2048)):
+        store = EntityStore(size, size)
+        start = perf_counter()
+        fill(store, n, rng)
+        added = perf_counter() - start
+
+        points = rng.integers(0, size, (LOOKUPS, 2)).tolist()
+        start = perf_counter()
+        for x, y in points:
+            store.at(x, y)
+        at = (perf_counter() - start) / LOOKUPS
+
+        slot = int(store.slots()[0])
+        start = perf_counter()
+        for x, y in points:
+            if store.at(x, y) == EMPTY:
+                store.place(slot, x, y)
+        moved = (perf_counter() - start) / LOOKUPS
+
+        objects = list(zip(store.xs.tolist(), store.ys.tolist()))
+        scans = points[:10]
+        start = perf_counter()
+        for point in scans:
+            any(obj == tuple(point) for obj in objects)
+        scanned = (perf_counter() - start) / len(scans)
+
+        print(
+            f"{n:>9} {f'{size}x{size}':>10} {added * 1e3:>12.1f} "
+            f"{at * 1e6:>8.2f} {moved * 1e6:>8.2f} {scanned * 1e6:>13.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
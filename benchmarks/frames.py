@@ -0,0 +1,131 @@
+"""Client frame time with full redraws versus dirty rectangles
+
+Run from the repository root::
+
+    python -m benchmarks.frames
+
+Uses the SDL dummy video driver, so no window is opened. Every frame the
+player moves one cell.
+
+- full redraw: blits every tile, draws every object and flips the whole
+  screen, the way the client drew before it cached the background
+- dirty rects: restores and redraws only the damaged areas
+- scrolling: a 4096x4096 world where the player walks diagonally, so the
+  camera scrolls every frame and chunks are rendered and evicted as it goes
+"""
+import os
+from time import perf_counter
+
+import numpy as np
+import pygame
+
+from the_game import client
+from the_game.game_elements import MAX_SPACES, X_SPACES, Y_SPACES, ObjectType
+
+FRAMES = 600
+# standalone copies of the tiles, which is how the tileset used to store them
+tile_copies: list[pygame.Surface] = []
+
+
+def setup(width: int, height: int):
+    """Prepare the tilemap and a keyframe with stones and trees"""
+    client.tileset.rescale(client.SCALE)
+    client.build_tilemap(width, height)
+    rng = np.random.default_rng(0)
+    client.tilemap.map = rng.choice((12, 15, 23), size=(height, width))
+    tile_copies[:] = [tile.copy() for tile in client.tileset.tiles]
+
+    client.player_id = 0
+    entities = [[0, ObjectType.HUNTER, 0, 0], [1, ObjectType.PREY, X_SPACES - 1, 0]]
+    for entity_id in range(2, 10):
+        x, y = entity_id, 2 + entity_id % (Y_SPACES - 2)
+        entities.append([entity_id, ObjectType.STONE + entity_id % 2, x, y])
+    client.apply_state({"seq": 1, "base": None, "entities": entities, "removed": []})
+
+
+def move(frame: int, x: int, y: int):
+    """Move the player to (x, y)"""
+    payload = {
+        "seq": frame + 2,
+        "base": frame + 1,
+        "entities": [[0, ObjectType.HUNTER, x, y]],
+        "removed": [],
+    }
+    assert client.apply_state(payload)
+
+
+def along_top(frame: int) -> tuple[int, int]:
+    """Walk back and forth along the top rows"""
+    return frame % X_SPACES, frame // X_SPACES % 2
+
+
+def diagonal(frame: int) -> tuple[int, int]:
+    """Walk diagonally, one step at a time"""
+    return (frame + 1) // 2, frame // 2
+
+
+def full_redraw(screen: pygame.Surface):
+    """One frame the way the client drew before dirty rectangles"""
+    size = client.tilemap.tile_size
+    m, n = client.tilemap.map.shape
+    for i in range(m):
+        for j in range(n):
+            tile = tile_copies[client.tilemap.map[i, j]]
+            screen.blit(tile, (j * size, i * size))
+    client.draw_objects(screen)
+    pygame.display.flip()
+
+
+def dirty_redraw(screen: pygame.Surface):
+    """One frame with the rendered chunks and dirty rectangles"""
+    dirty = client.draw_game(screen)
+    if dirty:
+        pygame.display.update(dirty)
+
+
+def run(screen: pygame.Surface, size: int, path, draw) -> np.ndarray:
+    """Frame times in milliseconds"""
+    setup(*size)
+    client.draw_game(screen)
+    times = []
+    for frame in range(FRAMES):
+        start = perf_counter()
+        move(frame, *path(frame))
+        draw(screen)
+        times.append(perf_counter() - start)
+    return np.array(times) * 1e3
+
+
+def main():
+    """Benchmark entrypoint"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+    screen = pygame.display.set_mode(client.SCREEN_SIZE)
+    game_area = pygame.Rect(client.GAME_AREA)
+
+    cases = (
+        ("full redraw", (X_SPACES, Y_SPACES), along_top, full_redraw),
+        ("dirty rects", (X_SPACES, Y_SPACES), along_top, dirty_redraw),
+        ("scrolling", (MAX_SPACES, MAX_SPACES), diagonal, dirty_redraw),
+    )
+    print(
+        f"{'path':>12} {'world':>10} {'mean ms':>8} {'p50 ms':>7} {'p99 ms':>7}  tilemap"
+    )
+    for name, size, path, draw in cases:
+        times = run(screen, size, path, draw)
+        pixels = pygame.surfarray.array3d(screen.subsurface(game_area))
+        if name == "full redraw":
+            expected = pixels
+        elif name == "dirty rects":
+            assert (pixels == expected).all(), "dirty rects drew a different frame"
+
+        p50, p99 = np.percentile(times, (50, 99))
+        world = "x".join(map(str, size))
+        print(
+            f"{name:>12} {world:>10} {times.mean():>8.3f} {p50:>7.3f} {p99:>7.3f}  "
+            f"{client.tilemap}"
+        )
+
+
+if __name__ == "__main__":
+    main()
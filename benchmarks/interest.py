@@ -0,0 +1,110 @@
+"""State payload size and cost with and without interest management
+
+Run from the repository root::
+
+    python -m benchmarks.interest
+
+Matches of 8 players are played on worlds up to 1024x1024 with a tenth of the
+cells covered by stones and trees. Every client acknowledges every update, and
+keyframes are due every `state.KEYFRAME_INTERVAL` moves. For each world:
+
+- READY: bytes of the state in the READY message of a client;
+- bytes/update: mean bytes of the updates a client is sent per move;
+- ms/move: time to build and encode the updates of all clients per move.
+
+"full" is what the server sends without interest management, one payload
+encoded per move and shared by every client. "radius" is `interest.View` with
+an area of interest of `RADIUS` cells around each player.
+"""
+import random
+from time import perf_counter
+from uuid import uuid4
+
+from the_game.codec import BinaryCodec
+from the_game.game_elements import Direction, Game, Layout, ObjectType, Rules
+from the_game.interest import View
+from the_game.messaging import Message, MessageType
+from the_game.state import WorldState
+
+PLAYERS = 8
+MOVES = 256
+RADIUS = 16
+DENSITY = 0.05
+
+
+def play(size: int, radius: int | None) -> tuple[int, float, float]:
+    """Return READY bytes, mean bytes per update and seconds per move"""
+    rng = random.Random(0)
+    game = Game(
+        size,
+        size,
+        Layout({ObjectType.STONE: DENSITY, ObjectType.TREE: DENSITY}),
+        Rules(PLAYERS),
+    )
+    player_ids = [uuid4() for _ in range(PLAYERS)]
+    for player_id in player_ids:
+        game.init_player(player_id)
+    game.initialize(seed=0)
+    state = WorldState()
+    state.load(game)
+    codec = BinaryCodec()
+    views = {player_id: View(radius) for player_id in player_ids} if radius else {}
+
+    def updates() -> list[bytes]:
+        if not views:
+            # acknowledged alike, shared by all
+            return [codec.encode(Message(MessageType.MOVE, state.delta(since)))] * PLAYERS
+        data = []
+        for player_id, view in views.items():
+            player = state.entities[state.entity_id(player_id)]
+            data.append(
+                codec.encode(Message(MessageType.MOVE, view.payload(state, player[1:])))
+            )
+            view.ack(state.seq)
+        return data
+
+    since = None
+    ready = len(updates()[0])
+    since = state.seq
+    sent = 0
+    elapsed = 0.0
+    for _ in range(MOVES):
+        player = game.scheduler.order[game.scheduler.current]
+        moved = []
+        for direction in rng.sample(list(Direction), len(Direction)):
+            try:
+                moved = game.move_player(player, direction)
+            except RuntimeError:
+                continue
+            break
+        for obj in moved:
+            state.track(obj)
+        state.commit()
+
+        start = perf_counter()
+        data = updates()
+        elapsed += perf_counter() - start
+        since = state.seq
+        sent += sum(map(len, data))
+    return ready, sent / MOVES / PLAYERS, elapsed / MOVES
+
+
+def main():
+    """Benchmark entrypoint"""
+    print(
+        f"{'world':>10} {'entities':>9} {'mode':>10} {'READY bytes':>12} "
+        f"{'bytes/update':>13} {'ms/move':>8}"
+    )
+    for size in (64, 256, 1024):
+        entities = int(2 * DENSITY * size * size) + PLAYERS
+        for radius in (None, RADIUS):
+            ready, per_update, per_move = play(size, radius)
+            mode = "full" if radius is None else f"radius {radius}"
+            print(
+                f"{f'{size}x{size}':>10} {entities:>9} {mode:>10} {ready:>12} "
+                f"{per_update:>13.0f} {per_move * 1e3:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
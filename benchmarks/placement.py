@@ -0,0 +1,68 @@
+"""Object placement on large maps
+
+Run from the repository root::
+
+    python -m benchmarks.placement
+
+Times scattering obstacles over a 1000x1000 map with `placement.scatter`, and
+with the list-based placement `Game.initialize` used before, which picks
+a cell with `random.choice` and removes it from a list of every cell.
+"""
+import random
+from itertools import product
+from time import perf_counter
+from uuid import uuid4
+
+import numpy as np
+
+from the_game.game_elements import Game, Layout, ObjectType
+from the_game.placement import exclude_around, scatter
+
+SIZE = 1000
+# the list-based placement is quadratic, only time it up to this many objects
+LIST_LIMIT = 1_000
+
+
+def list_placement(n: int):
+    """Place n objects the way `Game.initialize` used to"""
+    available_spaces = list(product(range(SIZE), range(SIZE)))
+    for _ in range(n):
+        position = random.choice(available_spaces)
+        available_spaces.remove(position)
+
+
+def main():
+    """Benchmark entrypoint"""
+    rng = np.random.default_rng(0)
+    free = exclude_around(
+        np.ones((SIZE, SIZE), dtype=bool), [(100, 500), (900, 500)], 20
+    )
+    print(f"{SIZE}x{SIZE} cells")
+    print(f"{'objects':>8} {'scatter ms':>11} {'initialize ms':>14} {'list ms':>9}")
+    for n in (100, 1_000, 10_000, 100_000, 500_000):
+        start = perf_counter()
+        scatter(free, {ObjectType.STONE: n // 2, ObjectType.TREE: n - n // 2}, rng)
+        scattered = perf_counter() - start
+
+        game = Game(
+            SIZE,
+            SIZE,
+            Layout({ObjectType.STONE: n // 2, ObjectType.TREE: n - n // 2}, 20),
+        )
+        game.init_player(uuid4())
+        game.init_player(uuid4())
+        start = perf_counter()
+        game.initialize(seed=0)
+        initialized = perf_counter() - start
+
+        listed = ""
+        if n <= LIST_LIMIT:
+            start = perf_counter()
+            list_placement(n)
+            listed = f"{(perf_counter() - start) * 1e3:.0f}"
+
+        print(f"{n:>8} {scattered * 1e3:>11.1f} {initialized * 1e3:>14.1f} {listed:>9}")
+
+
+if __name__ == "__main__":
+    main()
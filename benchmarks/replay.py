@@ -0,0 +1,76 @@
+"""Replay recording and seeking
+
+Run from the repository root::
+
+    python -m benchmarks.replay
+
+Random round-robin moves of a 64x64 game are recorded, and the time per move
+is compared with the time `Game.move_player` takes. Then random turns are
+sought in the replay, which only reads the records after the nearest keyframe.
+"""
+import os
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from uuid import UUID
+
+import numpy as np
+
+from the_game.game_elements import Game
+from the_game.replay import DIRECTIONS, ReplayReader, ReplayWriter
+from the_game.simulation import HUNTER, PREY
+
+SIZE = 64
+SEEKS = 1000
+
+
+def main():
+    """Benchmark entrypoint"""
+    rng = np.random.default_rng(0)
+    print(
+        f"{'turns':>9} {'move µs':>8} {'record µs':>10} {'MiB':>6} "
+        f"{'open ms':>8} {'seek µs':>8}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for turns in (1_000, 10_000, 100_000, 1_000_000):
+            game = Game(SIZE, SIZE)
+            game.init_player(UUID(int=HUNTER))
+            game.init_player(UUID(int=PREY))
+            game.initialize(0)
+            players = [player.id for player in game.players]
+            moves = rng.integers(len(DIRECTIONS), size=turns).tolist()
+            path = Path(directory, f"{turns}.elvr")
+            writer = ReplayWriter(path, game)
+
+            moving = recording = 0.0
+            for turn, move in enumerate(moves):
+                player_id = players[turn % 2]
+                direction = DIRECTIONS[move]
+                start = perf_counter()
+                moved = game.move_player(player_id, direction)
+                moved_at = perf_counter()
+                writer.move(player_id, direction, moved)
+                recording += perf_counter() - moved_at
+                moving += moved_at - start
+            writer.close()
+
+            start = perf_counter()
+            reader = ReplayReader(path)
+            opened = perf_counter() - start
+            targets = rng.integers(turns, size=SEEKS).tolist()
+            start = perf_counter()
+            for turn in targets:
+                reader.seek(turn)
+            seeking = (perf_counter() - start) / SEEKS
+            reader.close()
+
+            print(
+                f"{turns:>9,} {moving / turns * 1e6:>8.1f} "
+                f"{recording / turns * 1e6:>10.1f} "
+                f"{os.path.getsize(path) / 2**20:>6.1f} {opened * 1e3:>8.2f} "
+                f"{seeking * 1e6:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
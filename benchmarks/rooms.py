@@ -0,0 +1,67 @@
+"""Rooms per process versus memory use
+
+Run from the repository root::
+
+    python -m benchmarks.rooms
+
+Every room is filled with two fake clients and its match is initialized, which
+is what the server holds for a running game.
+"""
+import gc
+import tracemalloc
+from time import perf_counter
+from uuid import uuid4
+
+from the_game.rooms import RoomManager
+
+
+class FakeClient:
+    """Stand-in for a websocket connection"""
+
+    __slots__ = ("id",)
+
+    def __init__(self):
+        self.id = uuid4()
+
+
+def fill(manager: RoomManager, n_rooms: int) -> list[FakeClient]:
+    """Create `n_rooms` running matches"""
+    clients = []
+    for _ in range(n_rooms):
+        for _ in range(2):
+            client = FakeClient()
+            room = manager.join(client)
+            clients.append(client)
+        room.game.initialize()
+    return clients
+
+
+def main():
+    """Benchmark entrypoint"""
+    print(f"{'rooms':>8} {'MiB':>9} {'KiB/room':>9} {'create us/room':>15} {'teardown us/room':>17}")
+    for n_rooms in (100, 1_000, 5_000, 10_000, 20_000):
+        gc.collect()
+        tracemalloc.start()
+        manager = RoomManager()
+
+        start = perf_counter()
+        clients = fill(manager, n_rooms)
+        created = perf_counter() - start
+
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = perf_counter()
+        for client in clients:
+            manager.leave(client)
+        torn_down = perf_counter() - start
+        assert len(manager) == 0
+
+        print(
+            f"{n_rooms:>8} {current / 2**20:>9.1f} {current / 2**10 / n_rooms:>9.2f} "
+            f"{created / n_rooms * 1e6:>15.1f} {torn_down / n_rooms * 1e6:>17.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
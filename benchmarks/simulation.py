@@ -0,0 +1,61 @@
+"""Batched simulation throughput
+
+Run from the repository root::
+
+    python -m benchmarks.simulation
+
+Batches of 64x64 games are stepped with random moves. For comparison, up to
+1000 of the same games are played by calling `Game.move_player` game by game.
+"""
+from time import perf_counter
+from uuid import UUID
+
+import numpy as np
+
+from the_game.game_elements import Game
+from the_game.simulation import DIRECTIONS, HUNTER, PREY, Batch, random_policy
+
+TURNS = 100
+SIZE = 64
+
+
+def new_games(n: int) -> list[Game]:
+    """Return n initialized two player games"""
+    games = []
+    for seed in range(n):
+        game = Game(SIZE, SIZE)
+        game.init_player(UUID(int=HUNTER))
+        game.init_player(UUID(int=PREY))
+        game.initialize(seed)
+        games.append(game)
+    return games
+
+
+def main():
+    """Benchmark entrypoint"""
+    rng = np.random.default_rng(0)
+    print(f"{'games':>7} {'batch turns/s':>14} {'loop turns/s':>13}")
+    for n in (1, 10, 100, 1_000, 10_000):
+        games = new_games(n)
+        batch = Batch.from_games(games)
+        moves = [random_policy(batch, rng) for _ in range(TURNS)]
+
+        start = perf_counter()
+        for turn in moves:
+            batch.step(turn)
+        stepped = perf_counter() - start
+
+        looped = "-"
+        if n <= 1_000:
+            start = perf_counter()
+            for turn in moves:
+                for game, move in zip(games, turn.tolist()):
+                    player = game.players[game.turns % 2]
+                    game.move_player(player.id, DIRECTIONS[move])
+            looped = f"{n * TURNS / (perf_counter() - start):,.0f}"
+
+        print(f"{n:>7} {n * TURNS / stepped:>14,.0f} {looped:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Room snapshot and restore times
+
+Run from the repository root::
+
+    python -m benchmarks.snapshots
+
+Running matches are snapshotted into a temporary directory and restored from
+it. The capture column is the time a full save spends copying the games on the
+event loop, and the longest block column the longest the event loop was kept
+from other tasks during it; the rest of a save, packing, compressing and
+writing, happens on the thread pool. An incremental save where 1% of the rooms
+changed is timed too.
+"""
+import asyncio
+import gc
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.rooms import fill
+from the_game.game_elements import Direction
+from the_game.rooms import RoomManager
+from the_game.snapshots import Snapshotter
+
+# Seconds the event loop is checked on during a save
+TICK = 0.001
+
+
+async def longest_block(task: asyncio.Task) -> float:
+    """Return the longest a sleep overslept until `task` is done"""
+    longest = 0.0
+    while not task.done():
+        start = perf_counter()
+        await asyncio.sleep(TICK)
+        longest = max(longest, perf_counter() - start - TICK)
+    return longest
+
+
+async def measure(n_rooms: int, directory: str) -> tuple[float, float, float, float, float]:
+    """Return the capture, longest block, full save, incremental save and restore seconds"""
+    manager = RoomManager()
+    fill(manager, n_rooms)
+    snapshotter = Snapshotter(directory, manager)
+    for room in manager.rooms.values():
+        # the map snapshots are reused from one save to the next
+        room.game.map.snapshot()
+    # a long running server doesn't have all of its rooms in the young generations
+    gc.collect()
+
+    start = perf_counter()
+    for room in manager.rooms.values():
+        room.game.capture()
+    captured = perf_counter() - start
+
+    start = perf_counter()
+    save = asyncio.create_task(snapshotter.save())
+    blocked = await longest_block(save)
+    saved = perf_counter() - start
+
+    for room in list(manager.rooms.values())[: max(n_rooms // 100, 1)]:
+        player = room.game.scheduler.order[room.game.scheduler.current]
+        room.game.move_player(player, Direction.UP)
+    start = perf_counter()
+    await snapshotter.save()
+    incremental = perf_counter() - start
+    snapshotter.close()
+
+    restorer = Snapshotter(directory, RoomManager())
+    start = perf_counter()
+    restored = restorer.load()
+    loaded = perf_counter() - start
+    restorer.close()
+    assert restored == n_rooms
+    return captured, blocked, saved, incremental, loaded
+
+
+def main():
+    """Benchmark entrypoint"""
+    print(
+        f"{'rooms':>7} {'capture ms':>11} {'longest block ms':>17} {'save ms':>8} "
+        f"{'1% save ms':>11} {'restore ms':>11} {'KiB/room':>9}"
+    )
+    for n_rooms in (100, 1_000, 5_000, 10_000):
+        with tempfile.TemporaryDirectory() as directory:
+            captured, blocked, saved, incremental, loaded = asyncio.run(
+                measure(n_rooms, directory)
+            )
+            size = sum(path.stat().st_size for path in Path(directory).iterdir())
+        print(
+            f"{n_rooms:>7} {captured * 1e3:>11.1f} {blocked * 1e3:>17.1f} {saved * 1e3:>8.1f} "
+            f"{incremental * 1e3:>11.1f} {loaded * 1e3:>11.1f} "
+            f"{size / n_rooms / 1024:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
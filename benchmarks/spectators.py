@@ -0,0 +1,139 @@
+"""Spectator fan-out cost per tick
+
+Run from the repository root::
+
+    python -m benchmarks.spectators
+
+A 64x64 match is watched by up to 10k fake spectators using the binary codec.
+Between ticks the player to move moves once, then the time to send every
+spectator its update is measured:
+
+- shared: `spectators.fan_out`, which encodes one update for all spectators
+  and queues it in their outboxes;
+- per spectator: every spectator's update encoded on its own, as the players'
+  updates would be without sharing;
+- 10% backed up: a random tenth of the spectators still have an update
+  queued each tick, so the others need deltas from older states.
+
+The fan-out runs on the event loop, so its time is latency added to the moves
+of the players of every match. The outboxes then frame and send the update for
+every connection, which isn't measured here.
+"""
+import random
+from time import perf_counter
+from uuid import uuid4
+
+from the_game import spectators
+from the_game.codec import BinaryCodec, codec_for
+from the_game.game_elements import Direction
+from the_game.messaging import Message, MessageType
+from the_game.rooms import RoomManager
+
+SIZE = 64
+TICKS = 50
+
+
+class FakeSpectator:
+    """Stand-in for a spectator connection"""
+
+    __slots__ = ("id", "subprotocol")
+
+    def __init__(self):
+        self.id = uuid4()
+        self.subprotocol = BinaryCodec.name
+
+
+class FakeOutbox:
+    """Stand-in for the outbox of a spectator which sends right away"""
+
+    __slots__ = ("closed", "backed_up")
+
+    def __init__(self):
+        self.closed = False
+        self.backed_up = False
+
+    @property
+    def depth(self) -> int:
+        """Return the number of queued messages"""
+        return int(self.backed_up)
+
+    def put(self, data, state: bool = False):
+        """Send a message"""
+
+
+def encode(codec, message: Message):
+    """Encode a message"""
+    return codec.encode(message)
+
+
+def per_spectator(room, outboxes):
+    """Encode and send every spectator its update on its own"""
+    seq = room.state.seq
+    for websocket, since in room.spectators.items():
+        box = outboxes[websocket]
+        if since == seq or box.depth:
+            continue
+        codec = codec_for(websocket.subprotocol)
+        box.put(codec.encode(Message(MessageType.MOVE, room.state.delta(since))), state=True)
+        room.spectators[websocket] = seq
+
+
+def shared(room, outboxes):
+    """Send the spectators their updates with `spectators.fan_out`"""
+    spectators.fan_out(room, encode, outboxes)
+
+
+def measure(n_spectators: int, fan_out, backed_up: float = 0.0) -> float:
+    """Return the mean seconds per tick to update `n_spectators`"""
+    rng = random.Random(0)
+    manager = RoomManager(SIZE, SIZE)
+    room = None
+    for _ in range(2):
+        room = manager.join(FakeSpectator())
+    room.game.initialize()
+    room.state.load(room.game)
+    outboxes = {FakeSpectator(): FakeOutbox() for _ in range(n_spectators)}
+    for viewer in outboxes:
+        manager.watch(viewer, room.id)
+
+    elapsed = 0.0
+    for _ in range(TICKS):
+        game = room.game
+        player = game.scheduler.order[game.scheduler.current]
+        moved = []
+        for direction in rng.sample(list(Direction), len(Direction)):
+            try:
+                moved = game.move_player(player, direction)
+            except RuntimeError:
+                continue
+            break
+        for obj in moved:
+            room.state.track(obj)
+        room.state.commit()
+        for box in outboxes.values():
+            box.backed_up = rng.random() < backed_up
+
+        start = perf_counter()
+        fan_out(room, outboxes)
+        elapsed += perf_counter() - start
+    return elapsed / TICKS
+
+
+def main():
+    """Benchmark entrypoint"""
+    print(
+        f"{'spectators':>11} {'shared ms':>10} {'per spectator ms':>17} "
+        f"{'10% backed up ms':>17} {'shared µs/spectator':>20}"
+    )
+    for n_spectators in (10, 100, 1_000, 10_000):
+        together = measure(n_spectators, shared)
+        alone = measure(n_spectators, per_spectator)
+        lagging = measure(n_spectators, shared, 0.1)
+        print(
+            f"{n_spectators:>11} {together * 1e3:>10.2f} {alone * 1e3:>17.2f} "
+            f"{lagging * 1e3:>17.2f} {together / n_spectators * 1e6:>20.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
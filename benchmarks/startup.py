@@ -0,0 +1,105 @@
+"""Client startup time and memory
+
+Run from the repository root::
+
+    python -m benchmarks.startup
+
+Each variant runs in a fresh interpreter and reports its wall time and peak
+resident memory:
+
+- import: `import the_game.client`, which no longer reads the tileset
+- copies: import, then load, rescale and copy every tile into its own surface,
+  the way `Tileset` used to at import time
+- atlas cold: import, then build the rescaled atlas with an empty cache
+- atlas warm: import, then load the rescaled atlas from the disk cache
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+VARIANTS = ("import", "copies", "atlas cold", "atlas warm")
+RUNS = 5
+
+
+def measure(variant: str, cache_dir: str):
+    """Run one variant in this process and print its measurements as JSON"""
+    start = perf_counter()
+
+    import pygame
+
+    from the_game import client
+
+    imported = perf_counter()
+    tileset = client.tileset
+    tileset.cache_dir = Path(cache_dir)
+    match variant:
+        case "copies":
+            image = pygame.transform.rotozoom(tileset.image, 0, client.SCALE)
+            tiles = []
+            for x in range(0, image.get_width(), tileset.size[0]):
+                for y in range(0, image.get_height(), tileset.size[1]):
+                    tile = pygame.Surface(tileset.size)
+                    tile.blit(image, (0, 0), (x, y, *tileset.size))
+                    tiles.append(tile)
+        case "atlas cold" | "atlas warm":
+            tileset.rescale(client.SCALE)
+            tiles = tileset.tiles
+        case _:
+            tiles = []
+    loaded = perf_counter()
+
+    print(
+        json.dumps(
+            {
+                "import_ms": (imported - start) * 1e3,
+                "tiles_ms": (loaded - imported) * 1e3,
+                "tiles": len(tiles),
+                "image_loaded": tileset._image is not None,
+                "maxrss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            }
+        )
+    )
+
+
+def run(variant: str, cache_dir: str) -> dict:
+    """Run one variant in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", variant, cache_dir],
+        check=True,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYGAME_HIDE_SUPPORT_PROMPT": "1"},
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    """Benchmark entrypoint"""
+    print(
+        f"{'variant':>10} {'import ms':>10} {'tiles ms':>9} {'tiles':>6} "
+        f"{'image read':>10} {'max RSS MiB':>11}"
+    )
+    for variant in VARIANTS:
+        results = []
+        for _ in range(RUNS):
+            with tempfile.TemporaryDirectory() as cache_dir:
+                if variant == "atlas warm":
+                    run("atlas cold", cache_dir)
+                results.append(run(variant, cache_dir))
+        best = min(results, key=lambda result: result["import_ms"] + result["tiles_ms"])
+        print(
+            f"{variant:>10} {best['import_ms']:>10.1f} {best['tiles_ms']:>9.1f} "
+            f"{best['tiles']:>6} {str(best['image_loaded']):>10} {best['maxrss_mib']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        measure(*sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,37 @@
+"""Terrain generation time
+
+Run from the repository root::
+
+    python -m benchmarks.terrain
+
+Times `terrain.generate`, which both the server and every client run when a
+match starts, and its connectivity repair on its own.
+"""
+from timeit import repeat
+
+from the_game.terrain import TerrainParams, generate, regions
+
+REPEAT = 5
+
+
+def main():
+    """Benchmark entrypoint"""
+    params = TerrainParams(seed=1)
+    print(f"{'grid':>10} {'generate ms':>12} {'regions ms':>11} {'obstacles':>10}")
+    for size in (16, 64, 256, 1024, 2048):
+        number = max(1, 256 // size)
+        generated = min(
+            repeat(lambda: generate(size, size, params), number=number, repeat=REPEAT)
+        )
+        terrain = generate(size, size, params)
+        labelled = min(
+            repeat(lambda: regions(~terrain.obstacles), number=number, repeat=REPEAT)
+        )
+        print(
+            f"{f'{size}x{size}':>10} {generated / number * 1e3:>12.2f} "
+            f"{labelled / number * 1e3:>11.2f} {terrain.obstacles.mean():>10.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
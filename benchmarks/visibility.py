@@ -0,0 +1,65 @@
+"""Field of view computation on a 1024x1024 map
+
+Run from the repository root::
+
+    python -m benchmarks.visibility
+
+Players stand on random free cells of generated 1024x1024 terrain. For every
+sight radius and number of players, `visibility.Sight` is timed:
+
+- batched: every field of view computed from scratch in one update;
+- one by one: the same fields computed with one update per player;
+- cached: an update in which nobody moved;
+- one moved: an update after a single player moved, as after a turn.
+"""
+from time import perf_counter
+
+import numpy as np
+
+from the_game.terrain import TerrainParams, generate
+from the_game.visibility import Sight
+
+SIZE = 1024
+
+
+def timed(function) -> float:
+    """Return the seconds a call takes"""
+    start = perf_counter()
+    function()
+    return perf_counter() - start
+
+
+def main():
+    """Benchmark entrypoint"""
+    rng = np.random.default_rng(0)
+    passable = ~generate(SIZE, SIZE, TerrainParams(seed=1)).obstacles
+    free = np.argwhere(passable)
+    print(
+        f"{'radius':>7} {'players':>8} {'batched ms':>11} {'one by one ms':>14} "
+        f"{'cached ms':>10} {'one moved ms':>13}"
+    )
+    for radius in (8, 16, 32):
+        for players in (1, 100, 1_000):
+            cells = free[rng.choice(len(free), players + 1, replace=False)].tolist()
+            positions = {i: (x, y) for i, (y, x) in enumerate(cells[:players])}
+
+            batched = timed(lambda: Sight(radius).update(passable, 0, positions))
+            sight = Sight(radius)
+            alone = timed(
+                lambda: [
+                    sight.update(passable, 0, {key: position})
+                    for key, position in positions.items()
+                ]
+            )
+            cached = timed(lambda: sight.update(passable, 0, positions))
+            y, x = cells[players]
+            positions[0] = (x, y)
+            moved = timed(lambda: sight.update(passable, 0, positions))
+            print(
+                f"{radius:>7} {players:>8} {batched * 1e3:>11.2f} {alone * 1e3:>14.2f} "
+                f"{cached * 1e3:>10.3f} {moved * 1e3:>13.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
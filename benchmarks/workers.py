@@ -0,0 +1,146 @@
+"""Multi-process server scaling
+
+Run from the repository root::
+
+    python -m benchmarks.workers
+    python -m benchmarks.workers --workers 1 2 4 8 --load-processes 8
+
+The server runs as a single process first, then behind the router of
+`the_game.workers` with 1, 2, 4... worker processes, up to one per core. A
+pool of load processes opens the connections: first every client connects and
+waits for its match to start, which measures connections per second including
+matchmaking and map generation. Then the synthetic clients of
+`the_game.loadtest` play, which measures moves per second.
+
+The load processes need cores too, so the numbers only scale while the machine
+has cores to spare for them. Now and then a player spawns boxed in and its
+match plays out on timeouts, which lowers the moves per second of that run;
+the timeouts column shows it.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import websockets
+
+from the_game import loadtest
+from the_game.terrain import TerrainParams, generate
+
+# clients per load process and moves per client
+CLIENTS = 100
+MOVES = 20
+# seconds a client waits for an answer, short so a stuck match doesn't stall
+# the whole run
+MOVE_TIMEOUT = 0.5
+
+
+def warm_up():
+    """Load process initializer
+
+    The first map a client regenerates takes long enough to stall its match.
+    """
+    generate(16, 12, TerrainParams())
+
+
+async def connect(uri: str, clients: int) -> tuple[int, float]:
+    """Connect clients until their matches start
+
+    Returns the number of clients which got a match and the seconds taken.
+    """
+
+    async def client():
+        async with websockets.connect(uri) as websocket:
+            await websocket.recv()
+
+    start = perf_counter()
+    results = await asyncio.gather(
+        *(client() for _ in range(clients)), return_exceptions=True
+    )
+    return sum(result is None for result in results), perf_counter() - start
+
+
+def connections(uri: str, clients: int) -> tuple[int, float]:
+    """Load process running `connect`"""
+    return asyncio.run(connect(uri, clients))
+
+
+def moves(uri: str, clients: int, n_moves: int) -> tuple[int, float, int]:
+    """Load process running a load test
+
+    Returns the moves answered, the seconds taken and the timeouts.
+    """
+    results = asyncio.run(loadtest.run(clients, n_moves, uri, timeout=MOVE_TIMEOUT))
+    return results["moves"], results["seconds"], results["timeouts"]
+
+
+def measure(
+    workers: int | None, pool: ProcessPoolExecutor, processes: int, clients: int
+) -> tuple[float, float, int]:
+    """Return connections and moves per second and timeouts of a server
+
+    Without `workers`, the plain single-process server is measured.
+    """
+    port = loadtest.free_port()
+    uri = f"ws://localhost:{port}"
+    command = [sys.executable, "-m", "the_game.server"]
+    if workers is not None:
+        command = [sys.executable, "-m", "the_game.workers", "--workers", str(workers)]
+    server = subprocess.Popen(
+        [*command, "--host", "localhost", "--port", str(port), "--log-every", "0"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(loadtest.wait_for_server(port))
+        connected = list(pool.map(connections, [uri] * processes, [clients] * processes))
+        played = list(
+            pool.map(moves, [uri] * processes, [clients] * processes, [MOVES] * processes)
+        )
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait()
+    # the load processes run side by side, the slowest one sets the pace
+    per_second = sum(n for n, _ in connected) / max(seconds for _, seconds in connected)
+    moves_per_second = sum(n for n, _, _ in played) / max(s for _, s, _ in played)
+    return per_second, moves_per_second, sum(n for _, _, n in played)
+
+
+def main(argv: list[str] | None = None):
+    """Benchmark entrypoint"""
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({2**i for i in range(cores.bit_length())} | {cores}),
+        help="worker counts to measure",
+    )
+    parser.add_argument("--load-processes", type=int, default=cores)
+    parser.add_argument(
+        "--clients", type=int, default=CLIENTS, help="clients per load process"
+    )
+    args = parser.parse_args(argv)
+    if args.clients % 2:
+        parser.error("--clients must be even, clients play in pairs")
+
+    print(f"{cores} cores, {args.load_processes} load processes")
+    print(f"{'server':>8} {'workers':>8} {'conn/s':>8} {'moves/s':>8} {'timeouts':>9}")
+    with ProcessPoolExecutor(args.load_processes, initializer=warm_up) as pool:
+        for workers in (None, *args.workers):
+            per_second, moves_per_second, timeouts = measure(
+                workers, pool, args.load_processes, args.clients
+            )
+            print(
+                f"{'single' if workers is None else 'router':>8} {workers or 1:>8} "
+                f"{per_second:>8.0f} {moves_per_second:>8.0f} {timeouts:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
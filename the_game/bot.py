@@ -0,0 +1,232 @@
+"""Computer players
+
+A `Bot` takes the hunter or prey slot of a game like any other player, through
+`Game.init_player`, and picks its moves within a fixed time budget per turn.
+The hunter walks the shortest path towards the prey, cut short by the budget on
+large maps. The prey steps to the free neighbouring cell farthest from the
+hunter.
+
+The server seats bots in the empty seats of every match when started with
+`--bots`, see `rooms.RoomManager.fill`. Run bot-vs-bot matches for soak testing
+with::
+
+    python -m the_game.bot --matches 1000
+"""
+import argparse
+import random
+from time import perf_counter
+from uuid import UUID, uuid4
+
+import numpy as np
+
+from .entities import EMPTY
+from .game_elements import DELTAS, Direction, Game, ObjectType, Player
+from .pathfinding import Pathfinder
+
+# Seconds a bot may think per turn
+TURN_BUDGET = 0.005
+# Share of the budget spent searching, the rest is left for the overhead
+SEARCH_SHARE = 0.8
+# Cells around the hunter the prey looks at
+FLEE_RADIUS = 16
+
+
+class Bot:
+    """A computer player
+
+    Call `join` to add the bot to its game, then `play` on its turns.
+    """
+
+    def __init__(
+        self,
+        game: Game,
+        player_id: UUID | None = None,
+        budget: float = TURN_BUDGET,
+        seed=None,
+    ):
+        self.game = game
+        self.id = player_id or uuid4()
+        self.budget = budget
+        self.pathfinder = Pathfinder(game.map)
+        self.random = random.Random(seed)
+        # seconds taken by every move chosen so far
+        self.times: list[float] = []
+
+    @property
+    def player(self) -> Player:
+        """The bot's player"""
+        return self.game.entities.views[self.game.entities.slot_of(self.id)]
+
+    @property
+    def opponent(self) -> Player | None:
+        """The first player on the other side"""
+        side = self.player.type
+        return next((p for p in self.game.players if p.type != side), None)
+
+    def join(self):
+        """Take the next free player slot of the game"""
+        self.game.init_player(self.id)
+
+    def play(self):
+        """Make a move"""
+        self.game.move_player(self.id, self.choose())
+
+    def choose(self) -> Direction:
+        """Return the move to make"""
+        start = perf_counter()
+        deadline = start + self.budget * SEARCH_SHARE
+        player, opponent = self.player, self.opponent
+        direction = None
+        if opponent is not None:
+            if player.type == ObjectType.HUNTER:
+                direction = self._chase(player, opponent, deadline)
+            else:
+                direction = self._flee(player, opponent)
+        if direction is None:
+            direction = self.random.choice(self._free_moves(player) or list(Direction))
+        self.times.append(perf_counter() - start)
+        return direction
+
+    def _free_moves(self, player: Player) -> list[Direction]:
+        """Return the directions in which the player can take a step"""
+        passable = self.game.map.passable
+        entities = self.game.entities
+        moves = []
+        for direction, (dx, dy) in DELTAS.items():
+            x, y = player.x + dx, player.y + dy
+            if entities.in_bounds(x, y) and passable[y, x]:
+                if entities.at(x, y) == EMPTY:
+                    moves.append(direction)
+        return moves
+
+    def _chase(self, player: Player, prey: Player, deadline: float):
+        if self.pathfinder.map is not self.game.map:
+            # the game was reset
+            self.pathfinder = Pathfinder(self.game.map)
+        path = self.pathfinder.astar(
+            (player.x, player.y), (prey.x, prey.y), deadline=deadline, partial=True
+        )
+        if not path:
+            return None
+        x, y = path[0]
+        return _direction(x - player.x, y - player.y)
+
+    def _flee(self, player: Player, hunter: Player):
+        moves = self._free_moves(player)
+        if not moves:
+            return None
+        distances = self.game.map.calc_distances(hunter.x, hunter.y, FLEE_RADIUS)
+
+        def score(direction):
+            dx, dy = direction.delta
+            x, y = player.x + dx, player.y + dy
+            distance = distances[y, x]
+            # out of the hunter's reach counts as farthest, then by straight
+            # line distance
+            if distance < 0:
+                distance = FLEE_RADIUS + 1
+            return distance, abs(x - hunter.x) + abs(y - hunter.y), self.random.random()
+
+        return max(moves, key=score)
+
+
+def _direction(dx: int, dy: int) -> Direction:
+    for direction, step in DELTAS.items():
+        if step == (dx, dy):
+            return direction
+    raise ValueError(f"not a single step: ({dx}, {dy})")
+
+
+def check(game: Game):
+    """Raise AssertionError if the game's entity store is inconsistent"""
+    entities = game.entities
+    slots = entities.slots()
+    xs, ys = entities.xs[slots], entities.ys[slots]
+    placed = (xs >= 0) & (ys >= 0)
+    assert (entities.occupancy[ys[placed], xs[placed]] == slots[placed]).all()
+    assert (entities.occupancy != EMPTY).sum() == placed.sum()
+    for player in game.players:
+        assert game.map.passable[player.y, player.x], f"{player} is in a wall"
+
+
+def soak(
+    matches: int,
+    turns: int,
+    width: int,
+    height: int,
+    budget: float = TURN_BUDGET,
+    seed: int | None = None,
+) -> dict:
+    """Play bot-vs-bot matches and return statistics
+
+    A match ends when the hunter is next to the prey or after `turns` turns.
+    Every match is checked for consistency at the end.
+    """
+    rng = np.random.default_rng(seed)
+    played = caught = 0
+    times = []
+    start = perf_counter()
+    for _ in range(matches):
+        game = Game(width, height)
+        hunter = Bot(game, budget=budget, seed=int(rng.integers(2**31)))
+        prey = Bot(game, budget=budget, seed=int(rng.integers(2**31)))
+        hunter.join()
+        prey.join()
+        game.initialize(int(rng.integers(2**31)))
+        for turn in range(turns):
+            (hunter if turn % 2 == 0 else prey).play()
+            played += 1
+            h, p = hunter.player, prey.player
+            if abs(h.x - p.x) + abs(h.y - p.y) == 1:
+                caught += 1
+                break
+        check(game)
+        times += hunter.times + prey.times
+
+    elapsed = perf_counter() - start
+    times = np.array(times) * 1e3
+    return {
+        "matches": matches,
+        "turns": played,
+        "caught": caught,
+        "turns_per_second": played / elapsed,
+        "move_ms_p50": float(np.percentile(times, 50)),
+        "move_ms_p99": float(np.percentile(times, 99)),
+        "move_ms_max": float(times.max()),
+        "over_budget": int((times > budget * 1e3).sum()),
+    }
+
+
+def main(argv: list[str] | None = None):
+    """Soak test entrypoint"""
+    parser = argparse.ArgumentParser(description="Play bot-vs-bot matches")
+    parser.add_argument("--matches", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=200, help="turns per match")
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--height", type=int, default=64)
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=TURN_BUDGET * 1e3,
+        help="milliseconds a bot may think per turn",
+    )
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    stats = soak(
+        args.matches,
+        args.turns,
+        args.width,
+        args.height,
+        args.budget / 1e3,
+        args.seed,
+    )
+    for key, value in stats.items():
+        print(
+            f"{key:>17}: {value:.2f}"
+            if isinstance(value, float)
+            else f"{key:>17}: {value}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,25 @@
-import asyncio
-import json
+import argparse
 import logging
-import threading
 from collections import deque
+from itertools import count
 from pathlib import Path
-from time import sleep
+from time import perf_counter
 
 import numpy as np
 import pygame
-import websockets
 
-from .game_elements import X_SPACES, Y_SPACES
+from .game_elements import BLOCKING_OBJECTS, X_SPACES, Y_SPACES, ObjectType
 from .messaging import Message, MessageType
-from .tiles import Tilemap, Tileset
+from .network import SERVER_URI, NetworkBridge
+from .replay import ReplayFeed, ReplayReader
+from .terrain import TerrainParams, generate
+from .tiles import Camera, ChunkedTilemap, Tileset
+from .visibility import FieldOfView, Sight
 
 logging.basicConfig(level=logging.WARNING)
 LOG = logging.getLogger(__name__)
 
-msg_queue: list = []  # list of messages to send to the server
-msgs_received: deque = deque()
+network = NetworkBridge()
 print_items: deque = deque(maxlen=20)
 
 SCREEN_SIZE = (1100, 600)
@@ -28,6 +29,7 @@ GAME_AREA = (
     800,
     SCREEN_SIZE[1],
 )
+# The game area shows X_SPACES x Y_SPACES cells of the world at a time
 GRID_WIDTH = GAME_AREA[2] // X_SPACES
 GRID_HEIGHT = GAME_AREA[3] // Y_SPACES
 # The tileset is 16x16
@@ -39,6 +41,19 @@ MESSAGE_AREA = (
     SCREEN_SIZE[0] - GAME_AREA[2],
     SCREEN_SIZE[1],
 )
+MESSAGE_COLOR = (127, 127, 127)
+MESSAGE_LINE_HEIGHT = 25
+# Tiles of the floor variants and the terrain obstacles
+FLOOR_TILES = (12, 15, 23)
+STONE_TILE = 79
+TREE_TILE = 125
+# Seconds after which a move without an answer is left out of the latency
+# report, see `LatencyProbe`
+PROBE_TIMEOUT = 2.0
+# Objects are drawn in this order
+OBJECT_COLORS = {"stone": "grey", "tree": "green", "prey": "red", "hunter": "blue"}
+# Drawn over the cells out of sight
+FOG_COLOR = (0, 0, 0, 160)
 tileset = Tileset(
     Path(Path(__file__).parent, "static", "tileset.png"),
     size=(GRID_WIDTH, GRID_HEIGHT),
@@ -46,35 +61,75 @@ tileset = Tileset(
     spacing=0,
     offset=(-1, 0),
 )
-tilemap = Tilemap(tileset, (Y_SPACES, X_SPACES), GRID_WIDTH)
+# set up once the server tells us the world size, see `build_tilemap`
+tilemap: ChunkedTilemap | None = None
+camera: Camera | None = None
 
 
-async def send(socket):
-    """Sends data to the server"""
-    while True:
-        if msg_queue:  # checks if there is something in the list
-            msg = msg_queue.pop(0)
-            await socket.send(msg.serialize())
-        await asyncio.sleep(0.1)
-
-
-async def recv(socket):
-    """Recieves data from the server"""
-    while True:
-        message = await socket.recv()
-        LOG.debug(f"received message from server: {message}")
-        try:
-            process_message(Message.deserialize(message))
-        except ValueError:
-            LOG.warning("received invalid message: '%s'", message)
-        await asyncio.sleep(0.1)
+class LatencyProbe:
+    """Measure the time from a key press to the frame showing its result
 
+    Every move is tagged, see `input`. The server acknowledges the tag right
+    after applying the move, before sending the state update it caused, or
+    answers with an error, which it only sends to the client whose message
+    failed. Errors answer the oldest move without an answer, since the server
+    answers moves in order. The round trip ends when the answer has been drawn.
+    Moves still without an answer after `timeout` seconds are dropped.
+    """
 
-async def connect():
-    """Joins the websocket server"""
-    async with websockets.connect("ws://localhost:8001") as socket:
-        LOG.debug(f"connected to server as {socket.id}")
-        await asyncio.gather(recv(socket), send(socket))
+    def __init__(self, timeout: float = PROBE_TIMEOUT):
+        self.timeout = timeout
+        self.samples: list[float] = []
+        self.dropped = 0
+        # send times of the unanswered moves by tag, oldest first
+        self._inputs: dict[int, float] = {}
+        self._tags = count()
+        self._answered: list[float] = []
+
+    def input(self) -> int:
+        """Record a move sent to the server and return its tag"""
+        self._expire()
+        tag = next(self._tags)
+        self._inputs[tag] = perf_counter()
+        return tag
+
+    def answer(self, tag: int | None = None):
+        """Record the server's answer to the move with a tag, or the oldest one"""
+        if tag is None:
+            tag = next(iter(self._inputs), None)
+        sent = self._inputs.pop(tag, None)
+        if sent is not None:
+            self._answered.append(sent)
+
+    def _expire(self):
+        deadline = perf_counter() - self.timeout
+        for tag, sent in list(self._inputs.items()):
+            if sent > deadline:
+                break
+            del self._inputs[tag]
+            self.dropped += 1
+
+    def rendered(self):
+        """Record that every answer received so far is on screen"""
+        if self._answered:
+            now = perf_counter()
+            self.samples.extend(now - sent for sent in self._answered)
+            self._answered.clear()
+
+    def report(self) -> str:
+        """Summarize the round trip times in milliseconds"""
+        if not self.samples:
+            return "no input round trips measured"
+        samples = np.array(self.samples) * 1e3
+        p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+        return (
+            f"input to render over {len(samples)} moves: p50 {p50:.1f} ms, "
+            f"p95 {p95:.1f} ms, p99 {p99:.1f} ms, max {samples.max():.1f} ms, "
+            f"{self.dropped} unanswered"
+        )
+
+
+latency: LatencyProbe | None = None
 
 
 def convert_position(x: int, y: int) -> tuple[int, int]:
@@ -83,12 +138,75 @@ def convert_position(x: int, y: int) -> tuple[int, int]:
 
 
 server_ready = False
-game_objects: dict[(str, list[pygame.Rect])] = {
-    "prey": [],
-    "hunter": [],
-    "stone": [],
-    "tree": [],
+# entity id of this client's player
+player_id: int | None = None
+# sequence number of the last state applied
+world_seq: int | None = None
+entity_kinds: dict[int, str] = {}
+game_objects: dict[str, dict[int, pygame.Rect]] = {
+    "prey": {},
+    "hunter": {},
+    "stone": {},
+    "tree": {},
 }
+# world areas changed by the server since the last frame
+damage: list[pygame.Rect] = []
+# message panel lines currently on screen
+panel_lines: list[str] = []
+# when the server only sends what is in sight, the field of view of this
+# client's player, see `update_sight`
+sight: Sight | None = None
+field_of_view: FieldOfView | None = None
+# cells which don't block sight, as far as this client knows, and their version
+passable: np.ndarray | None = None
+passable_version = 0
+fog_tile: pygame.Surface | None = None
+
+
+def apply_state(payload: dict) -> bool:
+    """Apply a world state payload from the server
+
+    See `state.WorldState` for the payload format. Keyframes list every game
+    object the client should have, deltas the entities which changed, entered
+    or left its view. Either way only the entities which changed are touched.
+    Returns False if the payload is stale or doesn't apply to the current state.
+    """
+    global world_seq, passable_version
+    removed = payload["removed"]
+    if payload["base"] is None:
+        listed = {entity[0] for entity in payload["entities"]}
+        removed = [entity_id for entity_id in entity_kinds if entity_id not in listed]
+    elif world_seq is None or payload["base"] > world_seq or payload["seq"] <= world_seq:
+        return False
+
+    for entity_id in removed:
+        kind = entity_kinds.pop(entity_id, None)
+        if kind is not None:
+            damage.append(game_objects[kind].pop(entity_id))
+
+    for entity_id, type, x, y in payload["entities"]:
+        kind = ObjectType(type).name.lower()
+        position = convert_position(x, y)
+        if ObjectType(type) in BLOCKING_OBJECTS and passable[y, x]:
+            # stones and trees stay put, out of sight too
+            passable[y, x] = False
+            passable_version += 1
+        previous = entity_kinds.get(entity_id)
+        if previous is not None and previous != kind:
+            damage.append(game_objects[previous].pop(entity_id))
+        entity_kinds[entity_id] = kind
+        rect = game_objects[kind].get(entity_id)
+        if rect is None:
+            rect = game_objects[kind][entity_id] = pygame.Rect(position, OBJECT_SIZE)
+        elif rect.topleft == position:
+            continue
+        else:
+            damage.append(rect.copy())
+            rect.update(position, OBJECT_SIZE)
+        damage.append(rect.copy())
+
+    world_seq = payload["seq"]
+    return True
 
 
 def process_message(message: Message):
@@ -100,52 +218,208 @@ def process_message(message: Message):
         Game object positions come through indexed by the game grid. These need
         to be converted to pixels based on the screen size.
     """
-    global server_ready
+    global server_ready, player_id, sight, field_of_view
     match message["type"]:
         case MessageType.READY:
-            positions = json.loads(message["content"])
-            # TODO: set the tilemap `map` attribute here then call
-            # tilemap.render() below
-            for thing, value in positions.items():
-                for (x, y) in value:
-                    game_objects[thing].append(
-                        pygame.Rect(convert_position(x, y), OBJECT_SIZE)
-                    )
+            build_tilemap(*message["content"]["world"], message["content"]["terrain"])
+            player_id = message["content"]["player"]
+            network.token = message["content"].get("token")
+            radius = message["content"].get("sight")
+            sight = Sight(radius) if radius is not None else None
+            field_of_view = None
+            apply_state(message["content"]["state"])
+            update_sight()
+            network.post(Message(MessageType.ACK, world_seq))
             server_ready = True
         case MessageType.MOVE:
-            positions = json.loads(message["content"])
-            for thing, value in positions.items():
-                for (x, y) in value:
-                    # FIXME: This assumes the only values in the MOVE response
-                    # are for the hunter and prey
-                    game_objects[thing][0].update(convert_position(x, y), OBJECT_SIZE)
+            if apply_state(message["content"]):
+                update_sight()
+                network.post(Message(MessageType.ACK, world_seq))
+        case MessageType.ACK:
+            if latency is not None:
+                latency.answer(message["content"])
         case MessageType.ERROR:
             print_items.append(message["content"])
+            if latency is not None:
+                latency.answer()
         case _:
             raise ValueError(f"invalid message type: {message['type']}")
 
 
+def sight_rect(field: FieldOfView) -> pygame.Rect:
+    """Return the world area of the cells a field of view covers"""
+    size = 2 * field.radius + 1
+    return pygame.Rect(
+        convert_position(field.x - field.radius, field.y - field.radius),
+        (size * GRID_WIDTH, size * GRID_HEIGHT),
+    )
+
+
+def update_sight():
+    """Update the field of view of this client's player
+
+    The field is recomputed, see `visibility.Sight`, when the player moved or
+    a stone or tree came into sight, and the area it covered and covers now is
+    redrawn.
+    """
+    global field_of_view
+    kind = entity_kinds.get(player_id)
+    if sight is None or kind is None:
+        return
+    rect = game_objects[kind][player_id]
+    position = (rect.x // GRID_WIDTH, rect.y // GRID_HEIGHT)
+    field = sight.update(passable, passable_version, {player_id: position})[player_id]
+    if field is not field_of_view:
+        if field_of_view is not None:
+            damage.append(sight_rect(field_of_view))
+        damage.append(sight_rect(field))
+        field_of_view = field
+
+
+def build_tilemap(width: int, height: int, params: dict | None = None):
+    """Set up the tilemap and camera for a world of width x height cells
+
+    With terrain parameters from the server, the map is regenerated locally,
+    see `terrain.generate`.
+    """
+    global tilemap, camera, passable, passable_version
+    tiles = np.full((height, width), 15, dtype=np.uint8)
+    tiles[0, 0] = 6
+    tiles[0, -1] = 28
+    tiles[-1, 0] = 8
+    tiles[-1, -1] = 30
+    tiles[0, 1:-1] = 17
+    tiles[-1, 1:-1] = 19
+    tiles[1:-1, 0] = 7
+    tiles[1:-1, -1] = 29
+    passable = np.ones((height, width), dtype=bool)
+    passable_version += 1
+    if params is None:
+        tiles[1:-1, 1:-1] = np.random.choice(FLOOR_TILES, size=(height - 2, width - 2))
+    else:
+        terrain = generate(width, height, TerrainParams.from_dict(params))
+        tiles[1:-1, 1:-1] = np.take(FLOOR_TILES, terrain.floor[1:-1, 1:-1])
+        tiles[terrain.obstacles] = STONE_TILE
+        tiles[terrain.trees] = TREE_TILE
+        passable[terrain.obstacles | terrain.trees] = False
+
+    tilemap = ChunkedTilemap(tileset, (height, width), GRID_WIDTH)
+    tilemap.map = tiles
+    camera = Camera(GAME_AREA[2:], tilemap.rect)
+    damage.append(tilemap.rect.copy())
+
+
+def draw_objects(screen: pygame.Surface, area: list[pygame.Rect] | None = None):
+    """Draw the game objects in view, or only those touching `area`"""
+    if area is None:
+        area = [camera.rect]
+    for kind, color in OBJECT_COLORS.items():
+        for rect in game_objects[kind].values():
+            if rect.collidelist(area) != -1:
+                pygame.draw.rect(screen, color, camera.to_screen(rect, GAME_AREA[:2]))
+
+
+def cell_runs(rects: list[pygame.Rect]) -> list[pygame.Rect]:
+    """Return the cells touching rects as one rect per run of cells in a row
+
+    The runs don't overlap, so whatever is drawn over them is drawn once.
+    """
+    cells = set()
+    for rect in rects:
+        for y in range(rect.top // GRID_HEIGHT, (rect.bottom - 1) // GRID_HEIGHT + 1):
+            for x in range(rect.left // GRID_WIDTH, (rect.right - 1) // GRID_WIDTH + 1):
+                cells.add((y, x))
+    runs: list[pygame.Rect] = []
+    for y, x in sorted(cells):
+        left, top = convert_position(x, y)
+        if runs and runs[-1].top == top and runs[-1].right == left:
+            runs[-1].width += GRID_WIDTH
+        else:
+            runs.append(pygame.Rect(left, top, GRID_WIDTH, GRID_HEIGHT))
+    return runs
+
+
+def draw_fog(screen: pygame.Surface, area: list[pygame.Rect]):
+    """Darken the cells out of sight inside `area`, rects which don't overlap"""
+    global fog_tile
+    if fog_tile is None:
+        fog_tile = pygame.Surface((GRID_WIDTH, GRID_HEIGHT), pygame.SRCALPHA)
+        fog_tile.fill(FOG_COLOR)
+    for rect in area:
+        for y in range(rect.top // GRID_HEIGHT, (rect.bottom - 1) // GRID_HEIGHT + 1):
+            for x in range(rect.left // GRID_WIDTH, (rect.right - 1) // GRID_WIDTH + 1):
+                if field_of_view.sees(x, y):
+                    continue
+                cell = rect.clip(pygame.Rect(convert_position(x, y), fog_tile.get_size()))
+                screen.blit(
+                    fog_tile,
+                    camera.to_screen(cell, GAME_AREA[:2]),
+                    pygame.Rect((0, 0), cell.size),
+                )
+
+
+def draw_game(screen: pygame.Surface) -> list[pygame.Rect]:
+    """Redraw the damaged parts of the game area and return them
+
+    The camera follows this client's player, or the first hunter when
+    watching. When it moves, the whole game area is redrawn. Cells out of
+    sight are drawn in fog.
+    """
+    followed = player_id
+    if followed is None:
+        followed = min(game_objects["hunter"], default=None)
+    kind = entity_kinds.get(followed)
+    if kind is not None and camera.follow(game_objects[kind][followed]):
+        damage[:] = [camera.rect.copy()]
+
+    view = camera.rect
+    dirty = [rect.clip(view) for rect in damage if rect.colliderect(view)]
+    damage.clear()
+    if not dirty:
+        return []
+    if field_of_view is not None:
+        dirty = [rect.clip(view) for rect in cell_runs(dirty)]
+
+    screen.set_clip(GAME_AREA)
+    tilemap.draw(screen, view, GAME_AREA[:2], dirty)
+    draw_objects(screen, dirty)
+    if field_of_view is not None:
+        draw_fog(screen, dirty)
+    screen.set_clip(None)
+    return [camera.to_screen(rect, GAME_AREA[:2]) for rect in dirty]
+
+
+def draw_messages(screen: pygame.Surface, font: pygame.font.Font) -> list[pygame.Rect]:
+    """Redraw the message panel lines which changed and return them"""
+    dirty = []
+    for i, message in enumerate(print_items):
+        if i < len(panel_lines) and panel_lines[i] == message:
+            continue
+        top = 60 + i * MESSAGE_LINE_HEIGHT
+        line = pygame.Rect(MESSAGE_AREA[0], top, MESSAGE_AREA[2], MESSAGE_LINE_HEIGHT)
+        screen.fill(MESSAGE_COLOR, line)
+        screen.blit(font.render(message, True, "lightgray"), (825, top))
+        dirty.append(line)
+    panel_lines[:] = print_items
+    return dirty
+
+
+def process_messages():
+    """Process every message received from the server since the last frame"""
+    for message in network.drain():
+        try:
+            process_message(message)
+        except ValueError:
+            LOG.warning("received invalid message: '%s'", message)
+
+
 def main() -> None:
     """Client entry point"""
     pygame.init()
     pygame.display.set_caption("Electric Elves Game")
 
     screen = pygame.display.set_mode(SCREEN_SIZE)
-    tileset.image.convert()
     tileset.rescale(SCALE)
-    tilemap.image = screen
-    tilemap.map = np.ones((Y_SPACES, X_SPACES), dtype=int) * 15
-    tilemap.map[0, 0] = 6
-    tilemap.map[0, -1] = 28
-    tilemap.map[-1, 0] = 8
-    tilemap.map[-1, -1] = 30
-    tilemap.map[0, 1:-1] = 17
-    tilemap.map[-1, 1:-1] = 19
-    tilemap.map[1:-1, 0] = 7
-    tilemap.map[1:-1, -1] = 29
-    tilemap.map[1:-1, 1:-1] = np.random.choice(
-        (12, 15, 23), size=(Y_SPACES - 2, X_SPACES - 2)
-    )
 
     clock = pygame.time.Clock()
 
@@ -155,9 +429,7 @@ def main() -> None:
 
     # Connect to the server!
     LOG.debug("connecting to server")
-    socket_thread = threading.Thread(target=asyncio.run, args=(connect(),))
-    socket_thread.daemon = True
-    socket_thread.start()
+    network.start()
 
     screen.fill("black")
     screen.blit(
@@ -174,23 +446,24 @@ def main() -> None:
             if event.type == pygame.QUIT or (
                 event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE
             ):
-                msg_queue.append(Message(MessageType.QUIT, ""))
                 return
-        LOG.debug("waiting for other client")
-        sleep(0.1)
+        process_messages()
+        clock.tick(30)
 
-    # Draw Messages
+    # Draw everything once, afterwards only damaged areas are redrawn
     screen.fill("black")
-    screen.fill((127, 127, 127), message_window)
+    screen.fill(MESSAGE_COLOR, message_window)
     screen.blit(font.render("Messages", True, "white"), (825, 25))
+    draw_game(screen)
+    pygame.display.flip()
 
     while True:
+        clock.tick(60)
         for event in pygame.event.get():
             # Check if window should be closed
             if event.type == pygame.QUIT or (
                 event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE
             ):
-                msg_queue.append(Message(MessageType.QUIT, ""))
                 return
             if event.type == pygame.KEYDOWN and event.key in (
                 pygame.K_UP,
@@ -198,28 +471,59 @@ def main() -> None:
                 pygame.K_RIGHT,
                 pygame.K_LEFT,
             ):
-                msg_queue.append(Message(MessageType.MOVE, event.key))
-                sleep(0.1)
-
-        clock.tick(60)
+                if latency is not None:
+                    content = {"direction": event.key, "probe": latency.input()}
+                else:
+                    content = event.key
+                network.post(Message(MessageType.MOVE, content))
 
-        for i, message in enumerate(print_items):
-            screen.blit(font.render(message, True, "lightgray"), (825, 60 + i * 25))
+        process_messages()
 
-        tilemap.render()
-        for stone in game_objects["stone"]:
-            pygame.draw.rect(screen, "grey", stone)
-
-        for tree in game_objects["tree"]:
-            pygame.draw.rect(screen, "green", tree)
-
-        pygame.draw.rect(screen, "red", game_objects["prey"][0])
-        pygame.draw.rect(screen, "blue", game_objects["hunter"][0])
-        pygame.display.flip()
+        dirty = draw_game(screen) + draw_messages(screen, font)
+        if dirty:
+            pygame.display.update(dirty)
+        if latency is not None:
+            latency.rendered()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="The Game client")
+    parser.add_argument("--server", default=SERVER_URI, help="server websocket URI")
+    parser.add_argument(
+        "--latency",
+        action="store_true",
+        help="report input to render round trip times on exit",
+    )
+    parser.add_argument(
+        "--watch",
+        nargs="?",
+        const="",
+        metavar="ROOM",
+        help="watch a match instead of playing, the oldest one without ROOM",
+    )
+    parser.add_argument(
+        "--replay", type=Path, help="play back a recorded match instead of playing"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="playback speed of the replay"
+    )
+    parser.add_argument(
+        "--turn", type=int, default=0, help="turn to start the replay from"
+    )
+    args = parser.parse_args()
+    network.uri = args.server
+    if args.watch is not None:
+        network.uri = f"{args.server.rstrip('/')}/?watch={args.watch}"
+    if args.replay is not None:
+        # no server: the replay sends the messages
+        network = ReplayFeed(ReplayReader(args.replay), args.speed, args.turn)
+    if args.latency:
+        latency = LatencyProbe()
+
     try:
         main()
     finally:
-        msg_queue.append(Message(MessageType.QUIT, ""))
+        network.post(Message(MessageType.QUIT, ""))
+        network.close()
+        if latency is not None:
+            print(latency.report())
@@ -0,0 +1,206 @@
+"""Wire codecs
+
+A codec turns a `Message` into the data sent through the websocket and back.
+The codec of a connection is chosen during the websocket handshake: each codec
+is offered as a subprotocol and the server picks the first one it supports.
+Connections which don't ask for a subprotocol, like the `python -m websockets`
+debugging session, use JSON.
+
+The binary codec frames every message as a header packed with
+`BinaryCodec.HEADER` (message type and content kind) followed by the content.
+World state payloads (see `state.WorldState`) are packed as arrays of
+fixed-size entity records instead of nested lists.
+"""
+import json
+import struct
+from abc import ABC, abstractmethod
+from enum import IntEnum, auto
+
+import numpy as np
+from websockets.typing import Data, Subprotocol
+
+from .messaging import Message, MessageType
+
+
+class Codec(ABC):
+    """Base class for wire codecs"""
+
+    # websocket subprotocol name
+    name: Subprotocol
+
+    @abstractmethod
+    def encode(self, message: Message) -> Data:
+        """Return the wire representation of a message"""
+
+    @abstractmethod
+    def decode(self, data: Data) -> Message:
+        """Construct a message from its wire representation
+
+        Raises ValueError for malformed data.
+        """
+
+    def __str__(self):
+        return f"{self.__class__.__name__} {self.name}"
+
+
+class JsonCodec(Codec):
+    """JSON text frames, see `Message.serialize`"""
+
+    name = Subprotocol("elves.json")
+
+    def encode(self, message: Message) -> Data:
+        """Return the wire representation of a message"""
+        return message.serialize()
+
+    def decode(self, data: Data) -> Message:
+        """Construct a message from its wire representation"""
+        return Message.deserialize(data)
+
+
+class ContentKind(IntEnum):
+    """How the content of a binary message is packed"""
+
+    NONE = auto()
+    INT = auto()
+    STR = auto()
+    JSON = auto()
+    # a world state payload
+    STATE = auto()
+    # a dict holding a world state payload under "state"
+    JSON_STATE = auto()
+
+
+STATE_KEYS = {"seq", "base", "entities", "removed"}
+
+
+class BinaryCodec(Codec):
+    """Compact binary frames"""
+
+    name = Subprotocol("elves.bin")
+
+    # message type, content kind
+    HEADER = struct.Struct("!BB")
+    INT = struct.Struct("!q")
+    # seq, base (NO_BASE for keyframes), entity count, removed count
+    STATE = struct.Struct("!iiII")
+    # length of the JSON part of a JSON_STATE content
+    JSON_LENGTH = struct.Struct("!I")
+    # entity records, packed with `struct` for small payloads and numpy above
+    # NUMPY_THRESHOLD entities
+    ENTITY = struct.Struct("!IBhh")
+    ENTITY_ARRAY = np.dtype([("id", ">u4"), ("type", "u1"), ("x", ">i2"), ("y", ">i2")])
+    REMOVED = np.dtype(">u4")
+    NUMPY_THRESHOLD = 64
+    NO_BASE = -1
+
+    def encode(self, message: Message) -> bytes:
+        """Return the wire representation of a message"""
+        content = message["content"]
+        match content:
+            case None:
+                kind, body = ContentKind.NONE, b""
+            case bool():
+                kind, body = ContentKind.JSON, json.dumps(content).encode()
+            case int():
+                kind, body = ContentKind.INT, self.INT.pack(content)
+            case str():
+                kind, body = ContentKind.STR, content.encode()
+            case dict() if content.keys() == STATE_KEYS:
+                kind, body = ContentKind.STATE, self.pack_state(content)
+            case {"state": dict() as state} if state.keys() == STATE_KEYS:
+                rest = json.dumps(
+                    {key: value for key, value in content.items() if key != "state"}
+                ).encode()
+                kind = ContentKind.JSON_STATE
+                body = self.JSON_LENGTH.pack(len(rest)) + rest + self.pack_state(state)
+            case _:
+                kind, body = ContentKind.JSON, json.dumps(content).encode()
+        return self.HEADER.pack(message["type"], kind) + body
+
+    def decode(self, data: Data) -> Message:
+        """Construct a message from its wire representation"""
+        if isinstance(data, str):
+            raise ValueError("malformed message - expected a binary frame")
+        data = memoryview(data)
+        try:
+            type, kind = self.HEADER.unpack_from(data)
+            header_size = self.HEADER.size
+            body = data[header_size:]
+            match kind:
+                case ContentKind.NONE:
+                    content = None
+                case ContentKind.INT:
+                    (content,) = self.INT.unpack(body)
+                case ContentKind.STR:
+                    content = str(body, "utf-8")
+                case ContentKind.JSON:
+                    content = json.loads(bytes(body))
+                case ContentKind.STATE:
+                    content = self.unpack_state(body)
+                case ContentKind.JSON_STATE:
+                    (length,) = self.JSON_LENGTH.unpack_from(body)
+                    start = self.JSON_LENGTH.size
+                    end = start + length
+                    content = json.loads(bytes(body[start:end]))
+                    if not isinstance(content, dict):
+                        raise ValueError("malformed message - expected a JSON object before the state")
+                    content["state"] = self.unpack_state(body[end:])
+                case _:
+                    raise ValueError(f"unknown content kind {kind}")
+            return Message(MessageType(type), content)
+        except (struct.error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise ValueError(f"malformed message - {exc!r}") from exc
+
+    def pack_state(self, state: dict) -> bytes:
+        """Pack a world state payload"""
+        entities = state["entities"]
+        if len(entities) < self.NUMPY_THRESHOLD:
+            records = b"".join([self.ENTITY.pack(*entity) for entity in entities])
+        else:
+            columns = np.asarray(entities, dtype=np.int64)
+            array = np.empty(len(columns), dtype=self.ENTITY_ARRAY)
+            for column, name in enumerate(self.ENTITY_ARRAY.names):
+                array[name] = columns[:, column]
+            records = array.tobytes()
+        removed = np.asarray(state["removed"], dtype=self.REMOVED).tobytes()
+        base = self.NO_BASE if state["base"] is None else state["base"]
+        header = self.STATE.pack(
+            state["seq"], base, len(entities), len(state["removed"])
+        )
+        return header + records + removed
+
+    def unpack_state(self, body: memoryview) -> dict:
+        """Unpack a world state payload"""
+        seq, base, n_entities, n_removed = self.STATE.unpack_from(body)
+        start = self.STATE.size
+        end = start + n_entities * self.ENTITY.size
+        if len(body) != end + n_removed * self.REMOVED.itemsize:
+            raise ValueError("malformed message - truncated state")
+
+        if n_entities < self.NUMPY_THRESHOLD:
+            entities = [
+                list(entity) for entity in self.ENTITY.iter_unpack(body[start:end])
+            ]
+        else:
+            array = np.frombuffer(body[start:end], dtype=self.ENTITY_ARRAY)
+            columns = [array[name].astype(np.int64) for name in self.ENTITY_ARRAY.names]
+            entities = np.stack(columns, axis=1).tolist()
+        return {
+            "seq": seq,
+            "base": None if base == self.NO_BASE else base,
+            "entities": entities,
+            "removed": np.frombuffer(body[end:], dtype=self.REMOVED).tolist(),
+        }
+
+
+# Codecs in order of preference
+CODECS: dict[Subprotocol, Codec] = {
+    codec.name: codec for codec in (BinaryCodec(), JsonCodec())
+}
+SUBPROTOCOLS = list(CODECS)
+DEFAULT_CODEC = CODECS[JsonCodec.name]
+
+
+def codec_for(subprotocol: Subprotocol | None) -> Codec:
+    """Return the codec negotiated for a connection's subprotocol"""
+    return CODECS.get(subprotocol, DEFAULT_CODEC)
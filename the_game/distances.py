@@ -0,0 +1,96 @@
+"""Distance fields
+
+A distance field holds the number of steps needed to walk from a source cell
+to every other cell of a grid, moving up, down, left or right and never
+entering a blocked cell. Unreachable cells are -1.
+
+The breadth-first search works on whole frontiers at once: the grid is padded
+with a blocked border and flattened, so the neighbours of every frontier cell
+are found with a single array addition and no bounds checks.
+"""
+from collections import OrderedDict
+from typing import Hashable
+
+import numpy as np
+
+UNREACHABLE = -1
+
+
+def distance_field(passable: np.ndarray, x: int, y: int, limit: int | None = None) -> np.ndarray:
+    """Return the distances from (x, y) over the `passable` cells
+
+    `passable` is a boolean array indexed `[y, x]`. The source cell always has
+    distance 0, even if it is blocked. With `limit`, the search stops after
+    `limit` steps and farther cells are left unreachable.
+    """
+    height, width = passable.shape
+    if not (0 <= x < width and 0 <= y < height):
+        raise ValueError(f"({x}, {y}) is outside of the {width}x{height} grid")
+
+    # Pad with a blocked border so flat neighbour offsets never leave the grid
+    stride = width + 2
+    open_cells = np.zeros((height + 2, stride), dtype=bool)
+    open_cells[1:-1, 1:-1] = passable
+    open_cells = open_cells.ravel()
+    flat_dist = np.full(open_cells.shape, UNREACHABLE, dtype=np.int32)
+    offsets = np.array([1, -1, stride, -stride])
+    # scratch used to drop duplicate neighbours without sorting
+    slot = np.empty(open_cells.shape, dtype=np.intp)
+
+    source = (y + 1) * stride + x + 1
+    open_cells[source] = False
+    flat_dist[source] = 0
+    frontier = np.array([source])
+
+    step = 0
+    while frontier.size and (limit is None or step < limit):
+        step += 1
+        neighbours = (frontier[:, None] + offsets).ravel()
+        neighbours = neighbours[open_cells[neighbours]]
+        order = np.arange(neighbours.size)
+        slot[neighbours] = order
+        neighbours = neighbours[slot[neighbours] == order]
+        open_cells[neighbours] = False
+        flat_dist[neighbours] = step
+        frontier = neighbours
+
+    return flat_dist.reshape(height + 2, stride)[1:-1, 1:-1].copy()
+
+
+class FieldCache:
+    """Least recently used cache of distance fields
+
+    Fields are keyed by their source cell, step limit and the version of the
+    grid they were computed from, so a field is only recomputed after the grid
+    has changed. Cached fields are read-only.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fields: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+
+    def __len__(self):
+        return len(self._fields)
+
+    def get(self, passable: np.ndarray, version: int, x: int, y: int, limit: int | None = None) -> np.ndarray:
+        """Return the distance field from (x, y), computing it if needed"""
+        key = (x, y, limit, version)
+        field = self._fields.get(key)
+        if field is not None:
+            self.hits += 1
+            self._fields.move_to_end(key)
+            return field
+
+        self.misses += 1
+        field = distance_field(passable, x, y, limit)
+        field.flags.writeable = False
+        self._fields[key] = field
+        if len(self._fields) > self.maxsize:
+            self._fields.popitem(last=False)
+        return field
+
+    def clear(self):
+        """Drop every cached field"""
+        self._fields.clear()
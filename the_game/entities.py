@@ -0,0 +1,307 @@
+"""Entity storage
+
+Game objects are stored as a struct of arrays: one NumPy column each for the
+type and position, indexed by a compact slot number. An occupancy grid maps
+every cell to the slot standing on it, so finding what is at a cell, or
+whether a move is blocked, is a single array lookup.
+
+Slots of removed entities are reused. Entities outside the grid, such as
+players who haven't been placed yet, are stored but don't occupy a cell.
+
+A snapshot is the raw buffers of the three columns; the occupancy grid and the
+free slots are rebuilt from them on restore.
+"""
+import struct
+from typing import Hashable
+
+import numpy as np
+
+# Type of a free slot
+FREE = 0
+# Occupancy of a cell nobody stands on
+EMPTY = -1
+# capacity, followed by the columns
+SNAPSHOT = struct.Struct("!I")
+# byte order independent dtype of the position columns in snapshots
+POSITION = np.dtype("<i4")
+
+
+class EntityStore:
+    """Struct-of-arrays storage with an occupancy grid
+
+    `types`, `xs` and `ys` are the columns, indexed by slot. Entities may have
+    an external key, e.g. a player's UUID, to look their slot up by.
+    """
+
+    def __init__(self, width: int, height: int, capacity: int = 64):
+        self.width = width
+        self.height = height
+        self.types = np.full(capacity, FREE, dtype=np.uint8)
+        self.xs = np.full(capacity, -1, dtype=np.int32)
+        self.ys = np.full(capacity, -1, dtype=np.int32)
+        self.occupancy = np.full((height, width), EMPTY, dtype=np.int32)
+        # views of the stored entities, see `Game.view`
+        self.views: dict[int, object] = {}
+        self._keys: dict[int, Hashable] = {}
+        self._slots: dict[Hashable, int] = {}
+        # free slots, lowest last
+        self._free: list[int] = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.types) - len(self._free)
+
+    @property
+    def capacity(self) -> int:
+        """Number of slots allocated"""
+        return len(self.types)
+
+    def in_bounds(self, x: int, y: int) -> bool:
+        """Return True if (x, y) is on the grid"""
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def at(self, x: int, y: int) -> int:
+        """Return the slot standing at (x, y), or EMPTY"""
+        if not self.in_bounds(x, y):
+            return EMPTY
+        return int(self.occupancy[y, x])
+
+    def slot_of(self, key: Hashable) -> int | None:
+        """Return the slot of the entity with an external key"""
+        return self._slots.get(key)
+
+    def key_of(self, slot: int) -> Hashable | None:
+        """Return the external key of a slot"""
+        return self._keys.get(slot)
+
+    def slots(self) -> np.ndarray:
+        """Return the slots in use"""
+        return np.flatnonzero(self.types != FREE)
+
+    def of_type(self, type: int) -> np.ndarray:
+        """Return the slots of every entity of a type"""
+        return np.flatnonzero(self.types == type)
+
+    def add(self, type: int, x: int, y: int, key: Hashable | None = None) -> int:
+        """Store an entity and return its slot
+
+        Raises ValueError if the cell is taken.
+        """
+        if key is not None and key in self._slots:
+            raise ValueError(f"an entity with key {key} already exists")
+        if self.at(x, y) != EMPTY:
+            raise ValueError(f"({x}, {y}) is occupied")
+        if not self._free:
+            self._grow(len(self.types))
+
+        slot = self._free.pop()
+        self.types[slot] = type
+        self.xs[slot] = x
+        self.ys[slot] = y
+        if self.in_bounds(x, y):
+            self.occupancy[y, x] = slot
+        if key is not None:
+            self._keys[slot] = key
+            self._slots[key] = slot
+        return slot
+
+    def add_many(self, types, xs, ys) -> np.ndarray:
+        """Store many entities at once and return their slots
+
+        The cells must be on the grid, distinct and free.
+        """
+        types = np.asarray(types, dtype=np.uint8)
+        xs = np.asarray(xs, dtype=np.int32)
+        ys = np.asarray(ys, dtype=np.int32)
+        if not (
+            (0 <= xs).all()
+            and (xs < self.width).all()
+            and (0 <= ys).all()
+            and (ys < self.height).all()
+        ):
+            raise ValueError("entities must be placed on the grid")
+        cells = ys.astype(np.int64) * self.width + xs
+        if np.unique(cells).size != cells.size:
+            raise ValueError("entities must be placed on distinct cells")
+        if (self.occupancy.ravel()[cells] != EMPTY).any():
+            raise ValueError("entities must be placed on free cells")
+
+        if len(self._free) < len(types):
+            self._grow(len(types) - len(self._free))
+        taken = slice(len(self._free) - len(types), None)
+        slots = np.array(self._free[taken][::-1], dtype=np.int32)
+        del self._free[taken]
+
+        self.types[slots] = types
+        self.xs[slots] = xs
+        self.ys[slots] = ys
+        self.occupancy[ys, xs] = slots
+        return slots
+
+    def bind(self, slot: int, key: Hashable):
+        """Give a stored entity an external key"""
+        if key in self._slots:
+            raise ValueError(f"an entity with key {key} already exists")
+        self._keys[slot] = key
+        self._slots[key] = slot
+
+    def remove(self, slot: int):
+        """Free a slot"""
+        if self.types[slot] == FREE:
+            raise KeyError(f"slot {slot} is free")
+        x, y = int(self.xs[slot]), int(self.ys[slot])
+        if self.in_bounds(x, y):
+            self.occupancy[y, x] = EMPTY
+        self.types[slot] = FREE
+        self.xs[slot] = self.ys[slot] = -1
+        key = self._keys.pop(slot, None)
+        if key is not None:
+            del self._slots[key]
+        self.views.pop(slot, None)
+        self._free.append(slot)
+
+    def place(self, slot: int, x: int, y: int):
+        """Move an entity to (x, y)
+
+        Raises ValueError if another entity stands there.
+        """
+        occupant = self.at(x, y)
+        if occupant not in (EMPTY, slot):
+            raise ValueError(f"({x}, {y}) is occupied")
+        old_x, old_y = int(self.xs[slot]), int(self.ys[slot])
+        if self.in_bounds(old_x, old_y):
+            self.occupancy[old_y, old_x] = EMPTY
+        self.xs[slot] = x
+        self.ys[slot] = y
+        if self.in_bounds(x, y):
+            self.occupancy[y, x] = slot
+
+    def walk(
+        self, slot: int, x: int, y: int, passable: np.ndarray | None = None
+    ) -> tuple[int, int]:
+        """Return how far an entity gets walking in a straight line to (x, y)
+
+        The entity stops in front of the first occupied cell, or the first cell
+        which isn't `passable`, a mask indexed `[y, x]`.
+        """
+        cx, cy = int(self.xs[slot]), int(self.ys[slot])
+        dx, dy = np.sign(x - cx), np.sign(y - cy)
+        while (cx, cy) != (x, y):
+            if self.at(cx + dx, cy + dy) != EMPTY:
+                break
+            if passable is not None and not passable[cy + dy, cx + dx]:
+                break
+            cx, cy = cx + dx, cy + dy
+        return int(cx), int(cy)
+
+    def move_many(
+        self, slots, xs, ys, passable: np.ndarray | None = None
+    ) -> np.ndarray:
+        """Move many entities one step at the same time
+
+        Every entity tries to step to its (x, y), a cell next to it. Returns
+        the mask of the entities which moved. A move fails if the cell is off
+        the grid or not `passable`, if several entities try to enter it, or if
+        it is occupied by an entity which stays put. Two entities can't swap
+        cells, but can follow each other.
+        """
+        slots = np.asarray(slots, dtype=np.int32)
+        xs = np.asarray(xs, dtype=np.int32)
+        ys = np.asarray(ys, dtype=np.int32)
+        if not slots.size:
+            return np.zeros(0, dtype=bool)
+        cx, cy = self.xs[slots], self.ys[slots]
+        ok = (
+            (0 <= xs)
+            & (xs < self.width)
+            & (0 <= ys)
+            & (ys < self.height)
+            & ((xs != cx) | (ys != cy))
+        )
+        if passable is not None:
+            ok[ok] = passable[ys[ok], xs[ok]]
+        cells = ys.astype(np.int64) * self.width + xs
+        _, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        ok &= counts[inverse.ravel()] == 1
+
+        # index in `slots` of the entity in every target cell, -1 if it
+        # doesn't try to move
+        occupant = np.full(len(slots), EMPTY, dtype=np.int32)
+        occupant[ok] = self.occupancy[ys[ok], xs[ok]]
+        order = np.argsort(slots)
+        index = np.minimum(np.searchsorted(slots[order], occupant), len(slots) - 1)
+        other = np.where(slots[order][index] == occupant, order[index], -1)
+        swap = (other >= 0) & (xs[other] == cx) & (ys[other] == cy)
+        # a cell can be entered if it is free, or if its occupant moves away;
+        # a failed move can make the moves into its cell fail, so repeat
+        while True:
+            enter = (occupant == EMPTY) | ((other >= 0) & ok[other] & ~swap)
+            if (ok <= enter).all():
+                break
+            ok &= enter
+
+        moved = slots[ok]
+        self.occupancy[cy[ok], cx[ok]] = EMPTY
+        self.occupancy[ys[ok], xs[ok]] = moved
+        self.xs[moved] = xs[ok]
+        self.ys[moved] = ys[ok]
+        return ok
+
+    def snapshot(self) -> bytes:
+        """Return the columns as bytes, see `restore`
+
+        Keys aren't included, the owner of the store has to `bind` them again.
+        """
+        return self.pack(self.types, self.xs, self.ys)
+
+    def columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return copies of the type and position columns, to `pack` later"""
+        return self.types.copy(), self.xs.copy(), self.ys.copy()
+
+    @staticmethod
+    def pack(types: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> bytes:
+        """Return a snapshot of columns, see `snapshot`"""
+        return b"".join(
+            (
+                SNAPSHOT.pack(len(types)),
+                types.tobytes(),
+                xs.astype(POSITION, copy=False).tobytes(),
+                ys.astype(POSITION, copy=False).tobytes(),
+            )
+        )
+
+    @classmethod
+    def restore(cls, width: int, height: int, data: bytes) -> "EntityStore":
+        """Return a store with the entities of a `snapshot`"""
+        (capacity,) = SNAPSHOT.unpack_from(data)
+        store = cls(width, height, 0)
+        offset = SNAPSHOT.size
+        store.types = np.frombuffer(data, np.uint8, capacity, offset).copy()
+        offset += capacity
+        store.xs = np.frombuffer(data, POSITION, capacity, offset).astype(np.int32)
+        offset += capacity * POSITION.itemsize
+        store.ys = np.frombuffer(data, POSITION, capacity, offset).astype(np.int32)
+
+        used = store.types != FREE
+        placed = np.flatnonzero(
+            used
+            & (0 <= store.xs)
+            & (store.xs < width)
+            & (0 <= store.ys)
+            & (store.ys < height)
+        )
+        store.occupancy[store.ys[placed], store.xs[placed]] = placed
+        store._free = np.flatnonzero(~used)[::-1].tolist()
+        return store
+
+    def _grow(self, extra: int):
+        old = len(self.types)
+        new = old + max(extra, old)
+        self.types = np.concatenate([self.types, np.full(new - old, FREE, np.uint8)])
+        self.xs = np.concatenate([self.xs, np.full(new - old, -1, np.int32)])
+        self.ys = np.concatenate([self.ys, np.full(new - old, -1, np.int32)])
+        self._free[:0] = range(new - 1, old - 1, -1)
+
+    def __str__(self):
+        return (
+            f"{self.__class__.__name__} {self.width}x{self.height} entities:{len(self)}"
+        )
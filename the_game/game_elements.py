@@ -1,28 +1,56 @@
-import random
-from dataclasses import dataclass, field
+import json
+import struct
+from dataclasses import dataclass, field, replace
 from enum import Enum, IntEnum, auto
-from itertools import product
-from queue import Queue
-from uuid import UUID, uuid4
+from typing import Hashable
+from uuid import UUID
 
 import numpy as np
-import pygame
 
-# The number of spaces on the grid
+from .distances import FieldCache
+from .entities import EMPTY, EntityStore
+from .placement import exclude_around, scatter
+from .terrain import TerrainParams, generate
+from .turns import TurnMode, Turns, scheduler
+
+# The default number of spaces on the grid, see `Game`
 # Keep in mind that the grid is 0-indexed, so the only valid positions are:
 # 0 <= x < X_SPACES
 # 0 <= y < Y_SPACES
 X_SPACES = 16
 Y_SPACES = 12
+# The largest supported world
+MAX_SPACES = 4096
+# width, height and terrain JSON length, followed by the terrain and the grids
+MAP_SNAPSHOT = struct.Struct("!HHH")
+# lengths of the metadata, map and entity sections
+GAME_SNAPSHOT = struct.Struct("!III")
 
 
 class Direction(Enum):
-    """A movement direction"""
+    """A movement direction
+
+    The values are the pygame key codes of the arrow keys, which the client
+    sends as they are.
+    """
+
+    UP = 1073741906
+    DOWN = 1073741905
+    LEFT = 1073741904
+    RIGHT = 1073741903
+
+    @property
+    def delta(self) -> tuple[int, int]:
+        """The (dx, dy) of one step"""
+        return DELTAS[self]
+
 
-    UP = pygame.K_UP
-    DOWN = pygame.K_DOWN
-    LEFT = pygame.K_LEFT
-    RIGHT = pygame.K_RIGHT
+DELTAS = {
+    Direction.UP: (0, -1),
+    Direction.DOWN: (0, 1),
+    Direction.LEFT: (-1, 0),
+    Direction.RIGHT: (1, 0),
+}
 
 
 class CellType(IntEnum):
@@ -34,59 +62,252 @@ class CellType(IntEnum):
 
 
 class Map:
-    """A game map"""
+    """A game map
+
+    The grid is indexed `[y, x]`. Change cells through `set_cell` so the
+    cached distance fields are invalidated.
+    """
+
+    # Cells which can't be walked through
+    BLOCKING = (CellType.STONE, CellType.TREE)
+
+    def __init__(self, width: int, height: int, terrain: TerrainParams | None = None):
+        self.width = width
+        self.height = height
+        self.grid = np.full((height, width), CellType.EMPTY, dtype=np.uint8)
+        # floor variant of every cell, see `terrain.Terrain.floor`
+        self.floor = np.zeros((height, width), dtype=np.uint8)
+        # parameters of the generated terrain, if any
+        self.terrain: TerrainParams | None = None
+        # incremented on every grid change
+        self.version = 0
+        self.fields = FieldCache()
+        self._passable = None
+        self._passable_version = -1
+        # (version, bytes) of the last snapshot
+        self._snapshot: tuple[int, bytes] | None = None
+
+        if terrain is not None:
+            self.generate(terrain)
+
+    def generate(self, params: TerrainParams):
+        """Replace the grid with generated terrain, see `terrain.generate`"""
+        terrain = generate(self.width, self.height, params)
+        self.grid[:] = CellType.EMPTY
+        self.grid[terrain.obstacles] = CellType.STONE
+        self.grid[terrain.trees] = CellType.TREE
+        self.floor = terrain.floor
+        self.terrain = params
+        self.version += 1
+
+    def set_cell(self, x: int, y: int, cell: CellType):
+        """Set the contents of a cell"""
+        if self.grid[y, x] != cell:
+            self.grid[y, x] = cell
+            self.version += 1
+
+    def set_cells(self, xs: np.ndarray, ys: np.ndarray, cell: CellType):
+        """Set the contents of many cells at once"""
+        if len(xs):
+            self.grid[ys, xs] = cell
+            self.version += 1
+
+    @property
+    def passable(self) -> np.ndarray:
+        """Boolean mask of the cells which can be walked through"""
+        if self._passable_version != self.version:
+            self._passable = ~np.isin(self.grid, self.BLOCKING)
+            self._passable_version = self.version
+        return self._passable
+
+    def calc_distances(self, x: int, y: int, limit: int | None = None) -> np.ndarray:
+        """Return the walking distances from (x, y) indexed `[y, x]`
+
+        Blocked and unreachable cells are -1. See `distances.distance_field`.
+        """
+        return self.fields.get(self.passable, self.version, x, y, limit)
+
+    def snapshot(self) -> bytes:
+        """Return the grid and floor as raw buffers, see `restore`
+
+        The snapshot is reused until the grid changes.
+        """
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            terrain = b""
+            if self.terrain is not None:
+                terrain = json.dumps(self.terrain.to_dict()).encode()
+            data = b"".join(
+                (
+                    MAP_SNAPSHOT.pack(self.width, self.height, len(terrain)),
+                    terrain,
+                    self.grid.tobytes(),
+                    self.floor.astype(np.uint8, copy=False).tobytes(),
+                )
+            )
+            self._snapshot = self.version, data
+        return self._snapshot[1]
+
+    @classmethod
+    def restore(cls, data: bytes) -> "Map":
+        """Return the map of a `snapshot`"""
+        width, height, length = MAP_SNAPSHOT.unpack_from(data)
+        offset = MAP_SNAPSHOT.size
+        map = cls(width, height)
+        if length:
+            terrain = json.loads(bytes(data[offset:offset + length]))
+            map.terrain = TerrainParams.from_dict(terrain)
+        offset += length
+        cells = width * height
+        grid = np.frombuffer(data, np.uint8, cells, offset)
+        map.grid = grid.reshape(height, width).copy()
+        offset += cells
+        floor = np.frombuffer(data, np.uint8, cells, offset)
+        map.floor = floor.reshape(height, width).copy()
+        return map
 
-    def __init__(self, width: int, height: int):
-        self.grid = np.full((width, height), CellType.EMPTY)
 
-        # TODO: Construct a map
+class ObjectType(IntEnum):
+    """Enumeration for player types"""
 
-    def calc_distances(self, x, y):
-        """Calculate distances"""
-        dist = np.full_like(self.grid, -1)
-        dist[y][x] = 0
+    HUNTER = auto()
+    PREY = auto()
+    STONE = auto()
+    TREE = auto()
 
-        q = Queue()
-        q.put([x, y])
 
-        directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+# Objects which block their cell on the map
+BLOCKING_OBJECTS = {ObjectType.STONE: CellType.STONE, ObjectType.TREE: CellType.TREE}
 
-        while q.not_empty:
-            x, y = q.get()
-            for dx, dy in directions:
-                nx, ny = x + dx, y + dy
-                if dist[y][x] + 1 < dist[ny][nx] or dist[ny][nx] == -1:
-                    dist[ny][nx] = dist[y][x] + 1
-                    q.put([nx, ny])
 
-        return dist
+@dataclass
+class Layout:
+    """How many objects `Game.initialize` scatters over the map
 
+    The map is generated from `terrain`, with a seed picked per game. On top of
+    it, `counts` maps object types to a count, or to a density as a float
+    fraction of the cells. No object is placed within `exclusion` cells of a
+    player.
+    """
 
-class ObjectType(IntEnum):
-    """Enumeration for player types"""
+    counts: dict[ObjectType, float] = field(
+        default_factory=lambda: {ObjectType.STONE: 4, ObjectType.TREE: 4}
+    )
+    exclusion: float = 0
+    terrain: TerrainParams | None = field(default_factory=TerrainParams)
 
-    HUNTER = auto()
-    PREY = auto()
-    STONE = auto()
-    TREE = auto()
+
+@dataclass
+class Rules:
+    """How many players a game takes and how they take turns, see `turns`"""
+
+    players: int = 2
+    turns: TurnMode = TurnMode.ROUND_ROBIN
+    # seconds a player has to move, None to wait forever
+    timeout: float | None = None
 
 
 @dataclass
+class GameSnapshot:
+    """A copy of the state of a game, see `Game.capture`
+
+    Only `pack` encodes it, so it can be packed on another thread.
+    """
+
+    # JSON-able apart from the player UUIDs
+    meta: dict
+    # `Map.snapshot`
+    map: bytes
+    # copies of the entity columns, see `EntityStore.pack`
+    entities: tuple[np.ndarray, np.ndarray, np.ndarray]
+
+    def pack(self) -> bytes:
+        """Return the snapshot as bytes, see `Game.restore`"""
+        meta = json.dumps(self.meta, default=str).encode()
+        sections = (meta, self.map, EntityStore.pack(*self.entities))
+        return GAME_SNAPSHOT.pack(*map(len, sections)) + b"".join(sections)
+
+
 class Object:
-    """A game object"""
+    """A game object
+
+    Once added to a game, an object is a view of its row in the game's
+    `EntityStore`: reading a field reads the store's columns, and setting the
+    position moves the object in the store's occupancy grid. Objects not added
+    to a game keep their own fields.
+    """
+
+    __slots__ = ("id", "store", "slot", "_type", "_x", "_y")
+
+    def __init__(self, id: Hashable, type: ObjectType, x: int, y: int):
+        self.id = id
+        self.store: EntityStore | None = None
+        self.slot = -1
+        self._type = type
+        self._x = x
+        self._y = y
+
+    def attach(self, store: EntityStore, slot: int):
+        """Make the object a view of `slot` in store"""
+        self.store = store
+        self.slot = slot
+        store.views[slot] = self
+
+    @property
+    def type(self) -> ObjectType:
+        """The object type"""
+        if self.store is None:
+            return self._type
+        return ObjectType(self.store.types[self.slot])
+
+    @property
+    def x(self) -> int:
+        """The column"""
+        if self.store is None:
+            return self._x
+        return int(self.store.xs[self.slot])
+
+    @x.setter
+    def x(self, value: int):
+        self.place(value, self.y)
+
+    @property
+    def y(self) -> int:
+        """The row"""
+        if self.store is None:
+            return self._y
+        return int(self.store.ys[self.slot])
+
+    @y.setter
+    def y(self, value: int):
+        self.place(self.x, value)
+
+    def place(self, x: int, y: int):
+        """Set the position
+
+        Raises ValueError if another object of the store is at (x, y).
+        """
+        if self.store is None:
+            self._x, self._y = x, y
+        else:
+            self.store.place(self.slot, x, y)
 
-    id: UUID
-    type: ObjectType
-    x: int
-    y: int
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(id={self.id!r}, type={self.type!r}, "
+            f"x={self.x}, y={self.y})"
+        )
 
 
-@dataclass
 class Movable(Object):
     """A movable object"""
 
+    __slots__ = ()
+
     def move(self, direction: Direction, map: Map, amount=1):
-        """Move object one space in `direction`"""
+        """Move object one space in `direction`
+
+        The object stops in front of the first occupied or blocked cell.
+        """
         nx, ny = self.x, self.y
 
         match direction:
@@ -102,118 +323,303 @@ class Movable(Object):
         # bounds check
         if ny < 0:
             ny = 0
-        if ny >= Y_SPACES:
-            ny = Y_SPACES - 1
+        if ny >= map.height:
+            ny = map.height - 1
         if nx < 0:
             nx = 0
-        if nx >= X_SPACES:
-            nx = X_SPACES - 1
-
-        # wall collision detection
+        if nx >= map.width:
+            nx = map.width - 1
 
-        #     dx = np.sign(nx - self.x)
-        #     if dx != 0:
-        #         for x in range(self.x + dx, nx + dx, dx):
-        #             if map.grid[self.y][x] == CellType.WALL:
-        #                 nx = x - dx
-        #                 break
-        #
-        #     dy = np.sign(ny - self.y)
-        #     if dy != 0:
-        #        for y in range(self.y + dy, ny + dy, dy):
-        #            if map.grid[y][self.x] == CellType.WALL:
-        #                 ny = y - dy
-        #                 break
+        # collision detection
+        if self.store is not None:
+            nx, ny = self.store.walk(self.slot, nx, ny, map.passable)
 
-        self.x, self.y = nx, ny
+        self.place(nx, ny)
 
 
-@dataclass
 class Player(Movable):
     """A player"""
 
-    map: Map
-    # used to store distances from a certain point to not have to
-    # repeatedly call the dist calc function when checking valid movements
-    distances: list | None = field(init=False, default=None)
-    point_distances_calcd: tuple[int, int] = field(init=False, default=(-1, -1))
+    __slots__ = ("map",)
+
+    def __init__(self, id: Hashable, type: ObjectType, x: int, y: int, map: Map):
+        super().__init__(id, type, x, y)
+        self.map = map
 
     # mp = movement points
     def is_valid(self, x, y, nx, ny, mp):
         """Return True if the movement is legal"""
-        if self.distances is None or self.point_distances_calcd != (x, y):
-            self.distances = self.map.calc_distances(x, y)
-            self.point_distances_calcd = (x, y)
-
-        return self.distances[ny][nx] <= mp
+        if not (0 <= nx < self.map.width and 0 <= ny < self.map.height):
+            return False
+        distance = self.map.calc_distances(x, y, mp)[ny, nx]
+        return 0 <= distance <= mp
 
     def update(self, nx, ny):
         """Update the player position"""
-        self.x, self.y = nx, ny
-        self.distances = None
+        self.place(nx, ny)
 
 
 class Game:
-    """A game"""
-
-    def __init__(self):
-        self.map = Map(X_SPACES, Y_SPACES)
-        self.players = []
-        self.objects = []
+    """A game
+
+    Players and objects live in `entities`. `players` and `objects` are views
+    of its rows. Players are added up to `rules.players` and take turns as
+    `scheduler` decides. `version` changes whenever the state of the game
+    does, so unchanged games can be told apart cheaply.
+    """
+
+    # Object types of the players
+    PLAYER_TYPES = (ObjectType.HUNTER, ObjectType.PREY)
+
+    def __init__(
+        self,
+        width: int = X_SPACES,
+        height: int = Y_SPACES,
+        layout: Layout | None = None,
+        rules: Rules | None = None,
+    ):
+        if not (0 < width <= MAX_SPACES and 0 < height <= MAX_SPACES):
+            raise ValueError(f"world size must be at most {MAX_SPACES}x{MAX_SPACES}")
+        self.map = Map(width, height)
+        self.entities = EntityStore(width, height)
+        self.layout = layout or Layout()
+        self.rules = rules or Rules()
+        self.scheduler = scheduler(self.rules.turns, self.rules.timeout)
+        # players by id, in the order they joined
+        self._players: dict[Hashable, Player] = {}
         self.turns = 0
         self.initialized = False
-
-    def initialize(self):
-        """Generate the map and set initial positions"""
-        self.players[0].x = random.choice(range(X_SPACES // 4))
-        self.players[0].y = random.choice(range(Y_SPACES))
-        self.players[1].x = random.choice(range(3 * X_SPACES // 4, X_SPACES))
-        self.players[1].y = random.choice(range(Y_SPACES))
-
-        # create list of spaces available on the grid
-        available_spaces = list(product(range(X_SPACES), range(Y_SPACES)))
-        available_spaces.remove((self.players[0].x, self.players[0].y))
-        available_spaces.remove((self.players[1].x, self.players[1].y))
-
-        # add stones
-        for _ in range(4):
-            position = random.choice(available_spaces)
-            self.objects.append(Object(uuid4(), ObjectType.STONE, *position))
-            available_spaces.remove(position)
-
-        # add trees
-        for _ in range(4):
-            position = random.choice(available_spaces)
-            self.objects.append(Object(uuid4(), ObjectType.TREE, *position))
-            available_spaces.remove(position)
+        self.version = 0
+
+    @property
+    def players(self) -> list[Player]:
+        """The players, in the order they joined"""
+        return list(self._players.values())
+
+    def player(self, player_id: Hashable) -> Player | None:
+        """Return the player with an id"""
+        return self._players.get(player_id)
+
+    @property
+    def objects(self) -> list[Object]:
+        """Every object which isn't a player"""
+        slots = self.entities.slots()
+        types = self.entities.types[slots]
+        slots = slots[~np.isin(types, self.PLAYER_TYPES)]
+        return [self.view(slot) for slot in slots.tolist()]
+
+    def view(self, slot: int) -> Object:
+        """Return the object stored in slot"""
+        view = self.entities.views.get(slot)
+        if view is None:
+            view = Object(slot, ObjectType(self.entities.types[slot]), -1, -1)
+            view.attach(self.entities, slot)
+        return view
+
+    def object_at(self, x: int, y: int) -> Object | None:
+        """Return the object or player at (x, y)"""
+        slot = self.entities.at(x, y)
+        return None if slot == EMPTY else self.view(slot)
+
+    def add(self, obj: Object) -> Object:
+        """Add an object to the game
+
+        Raises ValueError if the object's cell is taken.
+        """
+        slot = self.entities.add(obj.type, obj.x, obj.y, key=obj.id)
+        obj.attach(self.entities, slot)
+        if obj.type in BLOCKING_OBJECTS:
+            self.map.set_cell(obj.x, obj.y, BLOCKING_OBJECTS[obj.type])
+        return obj
+
+    def add_object(self, type: ObjectType, x: int, y: int) -> Object:
+        """Add an object identified by its slot to the game"""
+        slot = self.entities.add(type, x, y)
+        if type in BLOCKING_OBJECTS:
+            self.map.set_cell(x, y, BLOCKING_OBJECTS[type])
+        return self.view(slot)
+
+    def initialize(self, seed=None):
+        """Generate the map and set initial positions
+
+        Pass `seed` for a reproducible game.
+        """
+        rng = np.random.default_rng(seed)
+        if self.layout.terrain is not None:
+            terrain_seed = int(rng.integers(2**31))
+            self.map.generate(replace(self.layout.terrain, seed=terrain_seed))
+
+        # hunters start in the left quarter, prey in the right quarter, or
+        # anywhere if their quarter is full
+        width = self.map.width
+        free = self.map.passable & (self.entities.occupancy == EMPTY)
+        for type, columns in (
+            (ObjectType.HUNTER, slice(0, max(width // 4, 1))),
+            (ObjectType.PREY, slice(3 * width // 4, width)),
+        ):
+            for player in self._players.values():
+                if player.type != type:
+                    continue
+                area = np.zeros_like(free)
+                area[:, columns] = free[:, columns]
+                cells = np.flatnonzero(area)
+                if not len(cells):
+                    cells = np.flatnonzero(free)
+                if not len(cells):
+                    raise ValueError(
+                        f"no free cell left for {len(self._players)} players on the "
+                        f"{width}x{self.map.height} map"
+                    )
+                y, x = np.divmod(int(rng.choice(cells)), width)
+                player.place(int(x), int(y))
+                free[y, x] = False
+
+        spawns = [(player.x, player.y) for player in self.players]
+        free = exclude_around(free, spawns, self.layout.exclusion)
+        for type, (xs, ys) in scatter(free, self.layout.counts, rng).items():
+            self.entities.add_many(np.full(len(xs), type), xs, ys)
+            if type in BLOCKING_OBJECTS:
+                self.map.set_cells(xs, ys, BLOCKING_OBJECTS[type])
 
         self.turns = 0
+        self.scheduler.start()
         self.initialized = True
+        self.version += 1
 
     def reset(self):
         """Reset the game"""
-        self.__init__()
+        self.__init__(self.map.width, self.map.height, self.layout, self.rules)
 
-    def init_player(self, player_id: UUID):
-        """Add a player to the game"""
-        if len(self.players) >= 2:
+    def init_player(self, player_id: UUID, type: ObjectType | None = None):
+        """Add a player to the game
+
+        Without a type, the player joins the side with fewer players, the
+        hunters first.
+        """
+        if len(self._players) >= self.rules.players:
             raise RuntimeError("maximum players are added")
-        if len(self.players) == 0:
-            self.players.append(Player(player_id, ObjectType.HUNTER, -1, -1, self.map))
-        else:
-            self.players.append(Player(player_id, ObjectType.PREY, -1, -1, self.map))
-
-    def deinit_player(self, player_id: UUID):
-        """Remove a player from the game"""
-        for player in self.players:
-            if player.id == player_id:
-                self.players.remove(player)
-                break
-
-    def move_player(self, player_id: UUID, direction: Direction):
-        """Move a player in the given direction"""
-        current_player_idx = self.turns % 2
-        if self.players[current_player_idx].id != player_id:
-            raise RuntimeError("not your turn")
-        self.players[current_player_idx].move(direction, self.map)
-        self.turns += 1
+        if player_id in self._players:
+            raise RuntimeError(f"player {player_id} already joined")
+        if type is None:
+            hunters = sum(p.type == ObjectType.HUNTER for p in self._players.values())
+            prey = len(self._players) - hunters
+            type = ObjectType.HUNTER if hunters <= prey else ObjectType.PREY
+        self._players[player_id] = self.add(Player(player_id, type, -1, -1, self.map))
+        self.scheduler.add(player_id)
+        self.version += 1
+
+    def deinit_player(self, player_id: UUID) -> list[Player]:
+        """Remove a player from the game
+
+        Returns the players who moved because of it, e.g. when the others were
+        only waiting for this player to finish a round.
+        """
+        player = self._players.pop(player_id, None)
+        if player is None:
+            return []
+        self.entities.remove(player.slot)
+        self.version += 1
+        return self._resolve(self.scheduler.remove(player_id))
+
+    def move_player(self, player_id: UUID, direction: Direction) -> list[Player]:
+        """Move a player in the given direction
+
+        The move is resolved when the scheduler says so. Returns the players
+        who moved. Raises RuntimeError if the player can't move now.
+        """
+        turns = self.scheduler.submit(player_id, direction)
+        self.version += 1
+        return self._resolve(turns)
+
+    def expire(self) -> list[Player]:
+        """Time out overdue turns and return the players who moved"""
+        return self._resolve(self.scheduler.expire())
+
+    def _resolve(self, turns: Turns) -> list[Player]:
+        """Apply the moves of every turn, see `EntityStore.move_many`"""
+        moved: dict[Hashable, Player] = {}
+        if turns:
+            self.version += 1
+        for moves in turns:
+            self.turns += 1
+            players = [self._players[player_id] for player_id, _ in moves]
+            if len(players) == 1:
+                player = players[0]
+                position = player.x, player.y
+                player.move(moves[0][1], self.map)
+                if (player.x, player.y) != position:
+                    moved[player.id] = player
+            elif players:
+                slots = np.array([player.slot for player in players])
+                deltas = np.array([direction.delta for _, direction in moves])
+                xs = np.clip(
+                    self.entities.xs[slots] + deltas[:, 0], 0, self.map.width - 1
+                )
+                ys = np.clip(
+                    self.entities.ys[slots] + deltas[:, 1], 0, self.map.height - 1
+                )
+                ok = self.entities.move_many(slots, xs, ys, self.map.passable)
+                for player, stepped in zip(players, ok.tolist()):
+                    if stepped:
+                        moved[player.id] = player
+        return list(moved.values())
+
+    def snapshot(self) -> bytes:
+        """Return the state of the game as compact bytes, see `restore`
+
+        The map and entities are stored as raw buffers. Player ids must be
+        UUIDs. The layout isn't included, it only matters for new games.
+        """
+        return self.capture().pack()
+
+    def capture(self) -> GameSnapshot:
+        """Return a copy of the state of the game to `pack` later
+
+        Only copies the entity columns and the players, the map snapshot is
+        reused until the grid changes.
+        """
+        return GameSnapshot(
+            {
+                "initialized": self.initialized,
+                "turns": self.turns,
+                "rules": [self.rules.players, self.rules.turns.value, self.rules.timeout],
+                "players": [[player.id, player.slot] for player in self._players.values()],
+                "scheduler": self.scheduler.snapshot(lambda move: move.value),
+            },
+            self.map.snapshot(),
+            self.entities.columns(),
+        )
+
+    @classmethod
+    def restore(cls, data: bytes, layout: Layout | None = None) -> "Game":
+        """Return the game of a `snapshot`
+
+        Turn timeouts start over, as if the current turn had just begun.
+        """
+        lengths = GAME_SNAPSHOT.unpack_from(data)
+        offset = GAME_SNAPSHOT.size
+        sections = []
+        for length in lengths:
+            sections.append(memoryview(data)[offset:offset + length])
+            offset += length
+        meta = json.loads(bytes(sections[0]))
+        players, turns, timeout = meta["rules"]
+
+        world = Map.restore(sections[1])
+        game = cls(world.width, world.height, layout, Rules(players, TurnMode(turns), timeout))
+        game.map = world
+        game.entities = EntityStore.restore(world.width, world.height, sections[2])
+        for key, slot in meta["players"]:
+            player_id = UUID(key)
+            type = ObjectType(game.entities.types[slot])
+            player = Player(player_id, type, -1, -1, world)
+            player.attach(game.entities, slot)
+            game.entities.bind(slot, player_id)
+            game._players[player_id] = player
+            game.scheduler.add(player_id)
+        game.scheduler.restore(meta["scheduler"], Direction)
+        game.turns = meta["turns"]
+        game.initialized = meta["initialized"]
+        if game.initialized:
+            game.scheduler.start()
+        return game
@@ -0,0 +1,143 @@
+"""Interest management
+
+On a large map, most entities are far away from any one player, and sending
+every client all of them makes each message grow with the world. With
+interest management, a client is only sent the entities within `radius` cells
+of its player on each axis, its area of interest.
+
+The payloads keep the format of `state`: an entity which enters the area of
+interest is listed in `entities` like a changed one, and one which leaves it,
+by moving or because the player moved, is listed in `removed` like a removed
+one. A client therefore builds up its entities incrementally either way.
+
+Deltas need to know what the client has, so a `View` remembers the entities in
+the area of interest of every payload sent to its client until one of them is
+acknowledged. The client may have applied payloads it didn't acknowledge yet
+too, so an entity is removed if it left the view of any payload since, and
+sent in full unless it stayed in view of all of them.
+
+The entities in view are found with the spatial hash of the world state, see
+`WorldState.near`. While the player stays put, they are only updated with the
+entities which changed since, which is all that moves for most clients of a
+match.
+
+With a field of view, see `visibility`, entities in the area of interest which
+the player can't see are left out like those outside of it.
+"""
+from .state import WorldState
+from .visibility import FieldOfView
+
+
+class View:
+    """The entities a client is sent, see the module docstring"""
+
+    __slots__ = (
+        "radius",
+        "since",
+        "known",
+        "_sent",
+        "_seen",
+        "_kept",
+        "_center",
+        "_field",
+        "_visible",
+        "_at",
+    )
+
+    def __init__(self, radius: int):
+        self.radius = radius
+        # last sequence number acknowledged, and the entities the client had then
+        self.since: int | None = None
+        self.known: set[int] = set()
+        # entities in view in the payloads sent since, by sequence number
+        self._sent: dict[int, set[int]] = {}
+        # entities the client may have, and those it has unless they changed
+        self._seen: set[int] = set()
+        self._kept: set[int] = set()
+        # entities in view of `_center` and `_field` at sequence number `_at`
+        self._center: tuple[int, int] | None = None
+        self._field: FieldOfView | None = None
+        self._visible: set[int] = set()
+        self._at: int | None = None
+
+    def ack(self, seq: int):
+        """Record that the client applied the payload of sequence `seq`"""
+        visible = self._sent.get(seq)
+        if visible is None:
+            # acknowledged before, or sent without interest management
+            return
+        self.since, self.known = seq, visible
+        self._sent = {s: v for s, v in self._sent.items() if s > seq}
+        self._seen = visible.union(*self._sent.values())
+        self._kept = visible.intersection(*self._sent.values())
+
+    def payload(
+        self,
+        state: WorldState,
+        center: tuple[int, int] | None,
+        field: FieldOfView | None = None,
+    ) -> dict:
+        """Return a payload of the changes in view of `center` since the last ack
+
+        Without a center, nothing is in view. With a `field` of view, only the
+        entities it sees are.
+        """
+        visible = self.visible(state, center, field)
+        changed = state.changes(self.since)
+        if changed is None:
+            base, entering, left = None, visible, ()
+        else:
+            base = self.since
+            entering = (visible - self._kept) | (changed & visible)
+            left = self._seen - visible
+        self._sent[state.seq] = visible
+        self._seen |= visible
+        self._kept &= visible
+        if len(self._sent) > state.keyframe_interval:
+            # never acknowledged, too old for a delta anyway
+            del self._sent[next(iter(self._sent))]
+        entities = state.entities
+        return {
+            "seq": state.seq,
+            "base": base,
+            "entities": [[entity_id, *entities[entity_id]] for entity_id in entering],
+            "removed": list(left),
+        }
+
+    def visible(
+        self,
+        state: WorldState,
+        center: tuple[int, int] | None,
+        field: FieldOfView | None = None,
+    ) -> set[int]:
+        """Return the entities in view of `center` and seen by `field`"""
+        if center is None:
+            return set()
+        changed = None
+        if center == self._center and field is self._field:
+            changed = state.changes(self._at)
+        entities = state.entities
+        if changed is None:
+            visible = state.near(*center, self.radius)
+            if field is not None:
+                visible = {
+                    entity_id
+                    for entity_id in visible
+                    if field.sees(entities[entity_id][1], entities[entity_id][2])
+                }
+        else:
+            x, y = center
+            radius = self.radius
+            visible = self._visible - changed
+            for entity_id in changed:
+                entity = entities.get(entity_id)
+                if (
+                    entity is not None
+                    and abs(entity[1] - x) <= radius
+                    and abs(entity[2] - y) <= radius
+                    and (field is None or field.sees(entity[1], entity[2]))
+                ):
+                    visible.add(entity_id)
+        self._center, self._field, self._visible = center, field, visible
+        self._at = state.seq
+        return visible
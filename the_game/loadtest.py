@@ -0,0 +1,483 @@
+"""Server load test
+
+Starts a server, in-process or as a subprocess, or targets a running one, and
+opens many synthetic clients at once. The lobby pairs them into matches like
+real players. Every client regenerates its map from the READY message and
+tracks the world state, so it only sends moves to free cells and every move
+is answered by a state update. Clients take turns and measure:
+
+- connect time: the websocket handshake;
+- ready time: from connecting until the match starts;
+- move round trip: from sending a MOVE until the state update moving the
+  client's player, or an error, comes back.
+
+Results are printed as JSON, and written to `--output` to compare versions::
+
+    python -m the_game.loadtest --clients 500 --moves 50 --output load.json
+
+The clients keep track of the turns by watching both players move, so they
+need two player matches where everyone sees everything. A server with more
+players per match, interest management or a field of view is rejected with
+`UnsupportedServer` as soon as its first match starts.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import socket
+import subprocess
+import sys
+from datetime import datetime, timezone
+from time import perf_counter
+
+import numpy as np
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+from . import server
+from .codec import CODECS, BinaryCodec
+from .game_elements import DELTAS, Direction, ObjectType
+from .messaging import Message, MessageType
+from .terrain import TerrainParams, generate
+
+LOG = logging.getLogger(__name__)
+
+# How to run the server under test
+SERVER_MODES = ("inprocess", "subprocess")
+# Seconds to wait for a server to accept connections
+STARTUP_TIMEOUT = 10.0
+# Seconds to wait for the opponent or an answer before giving up on it
+MOVE_TIMEOUT = 5.0
+
+PLAYER_TYPES = (ObjectType.HUNTER, ObjectType.PREY)
+
+
+class UnsupportedServer(Exception):
+    """The server runs matches the synthetic clients can't play"""
+
+
+def unsupported(ready: dict) -> str | None:
+    """Return why the match of a READY message can't be played, if it can't"""
+    players = ready.get("players", len(PLAYER_TYPES))
+    if players != len(PLAYER_TYPES):
+        return f"matches have {players} players, only {len(PLAYER_TYPES)} are supported"
+    if ready.get("sight") is not None:
+        return "the server limits what players see (--sight)"
+    if ready.get("interest_radius") is not None:
+        return "the server uses interest management (--interest-radius)"
+    return None
+
+
+class SyntheticClient:
+    """A bot speaking the game protocol over a websocket
+
+    Call `run` to connect, play `moves` moves and disconnect. The measurements
+    are kept on the instance.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        moves: int,
+        codec: str = BinaryCodec.name,
+        timeout: float = MOVE_TIMEOUT,
+        seed=None,
+    ):
+        self.uri = uri
+        self.moves = moves
+        self.codec = CODECS[codec]
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        # measurements, in seconds
+        self.connect_time: float | None = None
+        self.ready_time: float | None = None
+        self.round_trips: list[float] = []
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.failure: str | None = None
+        # why the server can't be tested, see `unsupported`
+        self.unsupported: str | None = None
+
+        self._socket = None
+        self._ready = asyncio.Event()
+        # set whenever a player moved or an error came back
+        self._progress = asyncio.Event()
+        self._answer: asyncio.Future | None = None
+        self._player: int | None = None
+        self._seq: int | None = None
+        self._entities: dict[int, tuple[int, int, int]] = {}
+        self._obstacles: np.ndarray | None = None
+        # moves made by both players, the hunter moves on even turns
+        self._turn = 0
+        self._opponent_moves = 0
+        self._opponent_left = False
+
+    async def run(self):
+        """Connect, play and disconnect"""
+        start = perf_counter()
+        try:
+            async with websockets.connect(
+                self.uri, subprotocols=[self.codec.name]
+            ) as self._socket:
+                connected = perf_counter()
+                self.connect_time = connected - start
+                receiver = asyncio.create_task(self._receive())
+                try:
+                    await self._ready.wait()
+                    if self.unsupported is not None:
+                        raise UnsupportedServer(self.unsupported)
+                    self.ready_time = perf_counter() - connected
+                    await self._play()
+                finally:
+                    receiver.cancel()
+        except (OSError, ConnectionClosed) as exc:
+            self.failure = repr(exc)
+
+    @property
+    def _type(self) -> ObjectType:
+        return ObjectType(self._entities[self._player][0])
+
+    @property
+    def _opponent(self) -> int | None:
+        for entity_id, (type, _, _) in self._entities.items():
+            if entity_id != self._player and type in PLAYER_TYPES:
+                return entity_id
+        return None
+
+    def _my_turn(self) -> bool:
+        return self._turn % 2 == PLAYER_TYPES.index(self._type)
+
+    async def _play(self):
+        made = 0
+        while made < self.moves and not self._opponent_left:
+            if not self._my_turn():
+                if await self._wait_progress():
+                    continue
+                # the opponent is stuck or its move was lost, try anyway
+                self.timeouts += 1
+            await self._move()
+            made += 1
+        # stay until the opponent made its moves too
+        while self._opponent_moves < self.moves and not self._opponent_left:
+            if not await self._wait_progress():
+                self.timeouts += 1
+                break
+
+    async def _wait_progress(self) -> bool:
+        self._progress.clear()
+        try:
+            await asyncio.wait_for(self._progress.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _move(self):
+        direction = self._choose()
+        self._answer = asyncio.get_running_loop().create_future()
+        sent = perf_counter()
+        await self._send(Message(MessageType.MOVE, direction.value))
+        try:
+            await asyncio.wait_for(self._answer, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            # a blocked move passes the turn without an answer
+            self._turn += 1
+        else:
+            self.round_trips.append(perf_counter() - sent)
+        finally:
+            self._answer = None
+
+    def _choose(self) -> Direction:
+        """Return a random move to a free cell"""
+        _, x, y = self._entities[self._player]
+        height, width = self._obstacles.shape
+        taken = {(ex, ey) for _, ex, ey in self._entities.values()}
+        moves = [
+            direction
+            for direction, (dx, dy) in DELTAS.items()
+            if 0 <= x + dx < width
+            and 0 <= y + dy < height
+            and not self._obstacles[y + dy, x + dx]
+            and (x + dx, y + dy) not in taken
+        ]
+        return self.random.choice(moves or list(Direction))
+
+    async def _send(self, message: Message):
+        await self._socket.send(self.codec.encode(message))
+        self.sent += 1
+
+    async def _receive(self):
+        async for data in self._socket:
+            self.received += 1
+            try:
+                message = self.codec.decode(data)
+            except ValueError:
+                LOG.warning("received invalid message: '%s'", data)
+                continue
+            match message["type"]:
+                case MessageType.READY:
+                    content = message["content"]
+                    self.unsupported = unsupported(content)
+                    if self.unsupported is not None:
+                        self._ready.set()
+                        return
+                    width, height = content["world"]
+                    self._obstacles = np.zeros((height, width), dtype=bool)
+                    if content["terrain"] is not None:
+                        params = TerrainParams.from_dict(content["terrain"])
+                        self._obstacles = generate(width, height, params).obstacles
+                    self._player = content["player"]
+                    self._apply(content["state"])
+                    await self._send(Message(MessageType.ACK, self._seq))
+                    self._ready.set()
+                case MessageType.MOVE:
+                    if self._apply(message["content"]):
+                        await self._send(Message(MessageType.ACK, self._seq))
+                case MessageType.ERROR:
+                    if self._answer is not None and not self._answer.done():
+                        self.errors += 1
+                        # it wasn't our turn after all
+                        self._turn += 1
+                        self._answer.set_result(None)
+                        self._progress.set()
+
+    def _apply(self, payload: dict) -> bool:
+        """Apply a world state payload, see `client.apply_state`"""
+        if payload["base"] is not None and (
+            self._seq is None
+            or payload["base"] > self._seq
+            or payload["seq"] <= self._seq
+        ):
+            return False
+
+        opponent = self._opponent
+        before = {
+            entity_id: self._entities.get(entity_id)
+            for entity_id in (self._player, opponent)
+        }
+        if payload["base"] is None:
+            self._entities.clear()
+        for entity_id in payload["removed"]:
+            self._entities.pop(entity_id, None)
+        for entity_id, type, x, y in payload["entities"]:
+            self._entities[entity_id] = (type, x, y)
+        self._seq = payload["seq"]
+
+        if opponent is not None and opponent not in self._entities:
+            self._opponent_left = True
+            self._progress.set()
+        for entity_id, entity in before.items():
+            if entity is None or self._entities.get(entity_id, entity) == entity:
+                continue
+            self._turn += 1
+            self._progress.set()
+            if entity_id == self._player:
+                if self._answer is not None and not self._answer.done():
+                    self._answer.set_result(None)
+            else:
+                self._opponent_moves += 1
+        return True
+
+
+def percentiles(samples: list[float]) -> dict[str, float | None]:
+    """Return the p50, p95, p99 and maximum of samples in seconds, in ms"""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    samples = np.array(samples) * 1e3
+    p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(samples.max()),
+    }
+
+
+def free_port() -> int:
+    """Return a TCP port nobody listens on right now"""
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_server(port: int, timeout: float = STARTUP_TIMEOUT):
+    """Wait until something accepts connections on a local port"""
+    deadline = perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("localhost", port)
+        except OSError:
+            if perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+        else:
+            writer.close()
+            await writer.wait_closed()
+            return
+
+
+def revision() -> str | None:
+    """Return the git revision of the working tree, if any"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(
+    clients: int,
+    moves: int,
+    uri: str | None = None,
+    mode: str = "inprocess",
+    width: int = server.ServerConfig.width,
+    height: int = server.ServerConfig.height,
+    codec: str = BinaryCodec.name,
+    timeout: float = MOVE_TIMEOUT,
+    seed: int | None = None,
+) -> dict:
+    """Run a load test and return its results
+
+    Without `uri`, a server for a width x height world is started according to
+    `mode` and stopped afterwards. `clients` should be even, since the lobby
+    pairs clients into matches. Raises `UnsupportedServer` if the server at
+    `uri` runs matches the clients can't play.
+    """
+    process = server_task = None
+    if uri is None:
+        port = free_port()
+        uri = f"ws://localhost:{port}"
+        if mode == "inprocess":
+            # the server logs every message, keep the clients' output readable
+            for name in ("the_game", "websockets"):
+                logging.getLogger(name).setLevel(logging.WARNING)
+            config = server.ServerConfig("localhost", port, width, height)
+            server_task = asyncio.create_task(server.main(config))
+        elif mode == "subprocess":
+            process = await asyncio.create_subprocess_exec(
+                *(sys.executable, "-m", "the_game.server", "--host", "localhost"),
+                *("--port", str(port), "--width", str(width), "--height", str(height)),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        else:
+            raise ValueError(f"unknown server mode {mode!r}")
+        await wait_for_server(port)
+
+    rng = random.Random(seed)
+    bots = [
+        SyntheticClient(uri, moves, codec, timeout, rng.random())
+        for _ in range(clients)
+    ]
+    started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    start = perf_counter()
+    tasks = [asyncio.create_task(bot.run()) for bot in bots]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        # clients waiting for a match which won't start are cancelled too
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        errors = [task.exception() for task in done if task.exception() is not None]
+        if errors:
+            raise errors[0]
+    finally:
+        elapsed = perf_counter() - start
+        if server_task is not None:
+            server_task.cancel()
+        if process is not None:
+            process.terminate()
+            await process.wait()
+
+    round_trips = [rtt for bot in bots for rtt in bot.round_trips]
+    sent = sum(bot.sent for bot in bots)
+    received = sum(bot.received for bot in bots)
+    return {
+        "revision": revision(),
+        "started": started,
+        "config": {
+            "clients": clients,
+            "moves": moves,
+            "server": "external" if server_task is None and process is None else mode,
+            "world": [width, height],
+            "codec": codec,
+            "timeout": timeout,
+        },
+        "seconds": elapsed,
+        "failed_clients": sum(bot.failure is not None for bot in bots),
+        "connect_ms": percentiles(
+            [bot.connect_time for bot in bots if bot.connect_time is not None]
+        ),
+        "ready_ms": percentiles(
+            [bot.ready_time for bot in bots if bot.ready_time is not None]
+        ),
+        "move_rtt_ms": percentiles(round_trips),
+        "moves": len(round_trips),
+        "moves_per_second": len(round_trips) / elapsed,
+        "messages_sent": sent,
+        "messages_received": received,
+        "messages_per_second": (sent + received) / elapsed,
+        "errors": sum(bot.errors for bot in bots),
+        "timeouts": sum(bot.timeouts for bot in bots),
+    }
+
+
+def main(argv: list[str] | None = None):
+    """Load test entrypoint"""
+    parser = argparse.ArgumentParser(description="Load test the game server")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--moves", type=int, default=50, help="moves per client")
+    parser.add_argument("--uri", help="test a running server instead")
+    parser.add_argument(
+        "--server",
+        choices=SERVER_MODES,
+        default="inprocess",
+        help="how to run the server under test",
+    )
+    parser.add_argument("--width", type=int, default=server.ServerConfig.width)
+    parser.add_argument("--height", type=int, default=server.ServerConfig.height)
+    parser.add_argument("--codec", choices=list(CODECS), default=BinaryCodec.name)
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=MOVE_TIMEOUT,
+        help="seconds to wait for an answer or the opponent",
+    )
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    if args.clients % 2:
+        parser.error("--clients must be even, clients play in pairs")
+
+    try:
+        results = asyncio.run(
+            run(
+                args.clients,
+                args.moves,
+                args.uri,
+                args.server,
+                args.width,
+                args.height,
+                args.codec,
+                args.timeout,
+                args.seed,
+            )
+        )
+    except UnsupportedServer as exc:
+        sys.exit(f"can't load test {args.uri}: {exc}")
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Matchmaking lobby
+
+Clients wait in the lobby until a partner arrives. Waiting is done on plain
+futures so an idle client costs nothing until it is paired or disconnects.
+"""
+import asyncio
+import logging
+
+from .rooms import Room, RoomManager
+
+LOG = logging.getLogger(__name__)
+
+
+class Lobby:
+    """Pair waiting clients into rooms
+
+    Clients must be hashable, have an `id` and expose the
+    `connection_lost_waiter` future of a `WebSocketServerProtocol`, which
+    resolves as soon as the connection is gone.
+    """
+
+    def __init__(self, rooms: RoomManager):
+        self.rooms = rooms
+        self._waiting: dict[object, asyncio.Future] = {}
+
+    def __len__(self):
+        return len(self._waiting)
+
+    async def join(self, client) -> Room | None:
+        """Wait until the client's room is full
+
+        Returns the room, or None if the client disconnected while waiting. A
+        client which disconnected has already left its room.
+        """
+        room = self.rooms.join(client)
+        if room.full:
+            for other in room.clients:
+                waiter = self._waiting.pop(other, None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(room)
+            return room
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting[client] = waiter
+
+        def on_close(_):
+            # Leave right away so nobody gets paired with a dead connection
+            if self._waiting.pop(client, None) is waiter and not waiter.done():
+                self.rooms.leave(client)
+                waiter.set_result(None)
+
+        closed = client.connection_lost_waiter
+        closed.add_done_callback(on_close)
+        LOG.info("%s waiting in room %s", client.id, room.id)
+        try:
+            return await waiter
+        finally:
+            closed.remove_done_callback(on_close)
+            if self._waiting.get(client) is waiter:
+                del self._waiting[client]
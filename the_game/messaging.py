@@ -32,6 +32,9 @@ class MessageType(IntEnum):
     MOVE = auto()
     # Signals to the receiver to quit
     QUIT = auto()
+    # Acknowledges the last state sequence number the sender applied, or from
+    # the server, a move tagged by a latency probe
+    ACK = auto()
 
 
 class Message(UserDict):
@@ -49,7 +52,7 @@ class Message(UserDict):
         if type not in MessageType:
             raise ValueError(f"{type} is not a valid MessageType")
 
-        LOG.debug(f"Message(type:{type}, content:{content}")
+        LOG.debug("Message(type:%s, content:%s)", type, content)
         super().__init__(type=type, content=content, **kwargs)
 
     def serialize(self):
@@ -79,7 +82,7 @@ class Message(UserDict):
             >>> message = Message(type=MessageType.MOVE, content="up")
             >>> assert message == Message.deserialize(message.serialize())
         """
-        LOG.debug(f"deserializing: '{message!s}'")
+        LOG.debug("deserializing: '%s'", message)
         try:
             message_dict = json.loads(message)
         except json.JSONDecodeError as exc:
@@ -0,0 +1,239 @@
+"""Server metrics
+
+Counters, gauges and histograms are plain Python numbers kept in a `Registry`,
+cheap enough to update for every message. `Registry.render` formats them in
+the Prometheus text exposition format and `serve` answers scrapes of
+`/metrics` over HTTP::
+
+    curl http://localhost:8002/metrics
+
+Metrics may have labels, passed as positional values in the order of the
+metric's label names. A metric created with `function` reads its value when it
+is scraped instead.
+
+`Sampler` thins out log lines on hot paths.
+"""
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Callable, Iterator
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.00001,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """Base class for metrics"""
+
+    # Prometheus metric type
+    kind: str
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        function: Callable[[], float] | None = None,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.function = function
+        # per label values; a metric without labels starts at 0
+        self.values: dict[tuple, float] = {} if labels else {(): 0}
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """Yield the (name, labels, value) of every sample"""
+        if self.function is not None:
+            yield self.name, {}, self.function()
+            return
+        for values, value in self.values.items():
+            yield self.name, dict(zip(self.labels, values)), value
+
+
+class Counter(Metric):
+    """A value which only goes up"""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        """Add to the counter"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value which goes up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        """Set the gauge"""
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    """Observations counted in buckets
+
+    `buckets` are the upper bounds, the `+Inf` bucket is added implicitly.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label values, the count of every bucket, not cumulative
+        self.counts: dict[tuple, list[int]] = {}
+        self.sums: dict[tuple, float] = {}
+
+    def observe(self, value: float, *labels):
+        """Count an observation"""
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """Yield the (name, labels, value) of every sample"""
+        bounds = [*map(_format, self.buckets), "+Inf"]
+        for values, counts in self.counts.items():
+            labels = dict(zip(self.labels, values))
+            total = 0
+            for bound, count in zip(bounds, counts):
+                total += count
+                yield f"{self.name}_bucket", {**labels, "le": bound}, total
+            yield f"{self.name}_sum", labels, self.sums[values]
+            yield f"{self.name}_count", labels, total
+
+
+class Registry:
+    """A collection of metrics"""
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric and return it"""
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} already exists")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels=(), function=None) -> Counter:
+        """Create and register a counter"""
+        return self.register(Counter(name, help, labels, function))
+
+    def gauge(self, name: str, help: str, labels=(), function=None) -> Gauge:
+        """Create and register a gauge"""
+        return self.register(Gauge(name, help, labels, function))
+
+    def histogram(
+        self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        """Create and register a histogram"""
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    pairs = ",".join(
+                        f'{key}="{_escape(str(label))}"'
+                        for key, label in labels.items()
+                    )
+                    name = f"{name}{{{pairs}}}"
+                lines.append(f"{name} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+# The registry of the server
+REGISTRY = Registry()
+
+
+async def serve(
+    host: str, port: int, registry: Registry = REGISTRY
+) -> asyncio.AbstractServer:
+    """Serve `registry` at /metrics over HTTP
+
+    Returns the started server; close it to stop serving.
+    """
+
+    async def scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            method, path, *_ = request.split(b"\r\n", 1)[0].decode().split(" ")
+            if method == "GET" and path.split("?")[0] == "/metrics":
+                status, body = "200 OK", registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(scrape, host, port)
+    LOG.info("metrics served on http://%s:%d/metrics", host or "localhost", port)
+    return server
+
+
+class Sampler:
+    """Let the first and then every n-th event through
+
+    Call the sampler for every event, e.g. to decide whether to log it. With
+    `every` set to 1 every event passes, with 0 none do.
+    """
+
+    def __init__(self, every: int = 1):
+        self.every = every
+        self.events = 0
+
+    def __call__(self) -> bool:
+        """Count an event and return True if it passes"""
+        self.events += 1
+        return self.every > 0 and (self.events - 1) % self.every == 0
@@ -0,0 +1,142 @@
+"""Client networking
+
+The client draws with pygame on the main thread and talks to the server from
+an asyncio event loop on a background thread. `NetworkBridge` connects the two
+without polling: outgoing messages are handed to the event loop with
+`call_soon_threadsafe` and wake the sender immediately, and incoming messages
+are appended to a deque which the pygame thread drains once per frame.
+
+Once the server sent a resume token, a lost connection is retried with it, so
+the match goes on after a server restart.
+"""
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Iterator
+
+import websockets
+from websockets.exceptions import WebSocketException
+
+from .codec import SUBPROTOCOLS, Codec, codec_for
+from .messaging import Message
+
+LOG = logging.getLogger(__name__)
+
+SERVER_URI = "ws://localhost:8001"
+# Seconds between attempts to reconnect
+RECONNECT_DELAY = 1.0
+
+
+class NetworkBridge:
+    """Thread-safe link between the pygame thread and the network thread
+
+    Use `post` to send a message and `drain` to receive. Both may be called
+    from any thread.
+    """
+
+    def __init__(self, uri: str = SERVER_URI):
+        self.uri = uri
+        # set from the READY message, see the module docstring
+        self.token: str | None = None
+        # appended by the network thread, popped by the pygame thread
+        self.inbound: deque[Message] = deque()
+        self.connected = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._outbound: asyncio.Queue[Message | None] | None = None
+        # messages posted before the event loop is running
+        self._backlog: list[Message | None] = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Connect to the server on a background thread"""
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(self._run(),), daemon=True
+        )
+        self._thread.start()
+
+    def post(self, message: Message | None):
+        """Queue a message for the server
+
+        Posting None stops the sender once everything before it is sent.
+        """
+        with self._lock:
+            if self._loop is None:
+                self._backlog.append(message)
+                return
+        try:
+            self._loop.call_soon_threadsafe(self._outbound.put_nowait, message)
+        except RuntimeError:
+            # the event loop is closed, the connection is gone
+            pass
+
+    def drain(self) -> Iterator[Message]:
+        """Yield every message received so far"""
+        inbound = self.inbound
+        while inbound:
+            yield inbound.popleft()
+
+    def close(self, timeout: float = 1.0):
+        """Send whatever is queued and disconnect"""
+        self.post(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    async def _run(self):
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._outbound = asyncio.Queue()
+            for message in self._backlog:
+                self._outbound.put_nowait(message)
+            self._backlog.clear()
+
+        while True:
+            try:
+                if await self._connect():
+                    return
+            except (OSError, WebSocketException) as exc:
+                if self.token is None:
+                    raise
+                LOG.debug("connection lost: %s", exc)
+            if self.token is None:
+                return
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _connect(self) -> bool:
+        """Talk to the server until the connection is lost
+
+        Returns True once everything posted before None is sent.
+        """
+        uri = self.uri
+        if self.token is not None:
+            uri = f"{uri.rstrip('/')}/?resume={self.token}"
+        async with websockets.connect(uri, subprotocols=SUBPROTOCOLS) as socket:
+            codec = codec_for(socket.subprotocol)
+            LOG.debug("connected to server as %s using %s", socket.id, codec)
+            self.connected.set()
+            sender = asyncio.create_task(self._send(socket, codec))
+            receiver = asyncio.create_task(self._recv(socket, codec))
+            try:
+                await asyncio.wait(
+                    (sender, receiver), return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                sender.cancel()
+                receiver.cancel()
+            if sender.done() and not sender.cancelled():
+                sender.result()
+                return True
+            receiver.result()
+            return False
+
+    async def _send(self, socket, codec: Codec):
+        while (message := await self._outbound.get()) is not None:
+            await socket.send(codec.encode(message))
+
+    async def _recv(self, socket, codec: Codec):
+        async for data in socket:
+            try:
+                self.inbound.append(codec.decode(data))
+            except ValueError:
+                LOG.warning("received invalid message: '%s'", data)
@@ -0,0 +1,137 @@
+"""Outbound message queues
+
+Every connection gets one `Outbox`: a bounded queue drained by a single writer
+task, so messages reach the client in the order they were queued and a slow
+client can't make the server buffer without limit. Payloads are queued already
+encoded, so a broadcast encodes once and shares the same object between all
+recipients.
+"""
+import asyncio
+import logging
+from collections import deque
+from enum import Enum
+
+from websockets.exceptions import ConnectionClosed
+from websockets.typing import Data
+
+LOG = logging.getLogger(__name__)
+
+# Default number of queued messages at which the overflow policy kicks in
+HIGH_WATER = 64
+
+
+class OverflowPolicy(Enum):
+    """What to do when a queue reaches its high-water mark"""
+
+    # Drop the oldest queued message
+    DROP_OLDEST = "drop-oldest"
+    # Drop the queued state updates; the newest one supersedes them because
+    # deltas are relative to the client's last acknowledged state. Other
+    # messages are never dropped: if they fill the queue, disconnect
+    COALESCE = "coalesce"
+    # Close the connection
+    DISCONNECT = "disconnect"
+
+    def __str__(self):
+        return self.value
+
+
+class Outbox:
+    """Bounded outbound queue of one connection
+
+    Call `start` to launch the writer task and `close` to stop it.
+    """
+
+    def __init__(
+        self,
+        websocket,
+        high_water: int = HIGH_WATER,
+        policy: OverflowPolicy = OverflowPolicy.COALESCE,
+    ):
+        self.websocket = websocket
+        self.high_water = high_water
+        self.policy = policy
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        # (payload, is a state update)
+        self._queue: deque[tuple[Data, bool]] = deque()
+        self._wakeup = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+
+    @property
+    def depth(self) -> int:
+        """Number of queued messages"""
+        return len(self._queue)
+
+    def start(self):
+        """Start the writer task"""
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write())
+
+    def close(self):
+        """Stop the writer task and drop whatever is still queued"""
+        self.closed = True
+        self.dropped += len(self._queue)
+        self._queue.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+
+    def put(self, data: Data, state: bool = False):
+        """Queue an encoded message
+
+        Set `state` for world state updates, which may be coalesced.
+        """
+        if self.closed:
+            return
+
+        if len(self._queue) >= self.high_water:
+            self._overflow(state)
+            if self.closed:
+                return
+
+        self._queue.append((data, state))
+        self._wakeup.set()
+
+    def _overflow(self, state: bool):
+        match self.policy:
+            case OverflowPolicy.DROP_OLDEST:
+                self._queue.popleft()
+                self.dropped += 1
+            case OverflowPolicy.COALESCE:
+                depth = len(self._queue)
+                if state:
+                    self._queue = deque(item for item in self._queue if not item[1])
+                    self.dropped += depth - len(self._queue)
+                if len(self._queue) >= self.high_water:
+                    # nothing left which may be dropped
+                    self._disconnect()
+            case OverflowPolicy.DISCONNECT:
+                self._disconnect()
+
+    def _disconnect(self):
+        LOG.warning(
+            "disconnecting slow client %s: %d messages queued",
+            self.websocket.id,
+            len(self._queue),
+        )
+        self.close()
+        asyncio.create_task(self.websocket.close(1008, "client too slow"))
+
+    async def _write(self):
+        try:
+            while True:
+                while self._queue:
+                    data, _ = self._queue.popleft()
+                    await self.websocket.send(data)
+                    self.sent += 1
+                self._wakeup.clear()
+                await self._wakeup.wait()
+        except ConnectionClosed:
+            self.closed = True
+
+    def __str__(self):
+        return (
+            f"{self.__class__.__name__} {self.websocket.id} "
+            f"depth:{self.depth} sent:{self.sent} dropped:{self.dropped}"
+        )
@@ -0,0 +1,370 @@
+"""Pathfinding on the map grid
+
+`Pathfinder` answers shortest path queries on a `Map`: A* on the 4-connected
+grid with the Manhattan heuristic, A* on the 8-connected grid with the octile
+heuristic, and jump point search, which finds the same 8-connected paths while
+expanding far fewer nodes on open maps. Diagonal steps may not cut corners.
+
+Queries are plain Python loops over flat lists, which beats indexing NumPy
+arrays one element at a time. The lists are sized to the map once and reused:
+a node's cost and parent are only valid if its stamp matches the current
+query, so nothing is cleared between queries.
+
+Jump point search expands few nodes but may scan many cells between them, so
+the cells its jumps scan count against the node budget too.
+"""
+import math
+from heapq import heappop, heappush
+from time import perf_counter
+
+import numpy as np
+
+from .game_elements import Map
+
+# Default number of nodes a query may expand
+NODE_BUDGET = 100_000
+# Check the deadline every this many expanded nodes
+DEADLINE_INTERVAL = 16
+
+SQRT2 = math.sqrt(2)
+
+
+class Pathfinder:
+    """Shortest paths on a map
+
+    Positions are (x, y). Paths exclude the start and include the goal. A query
+    gives up after expanding `budget` nodes or when `deadline`, a
+    `time.perf_counter` value, passes. It then returns None, or with `partial`,
+    the path to the expanded node closest to the goal. The budget is checked
+    between expansions, and `jps` counts the cells its jumps scanned against it.
+    """
+
+    def __init__(self, map: Map, budget: int = NODE_BUDGET):
+        self.map = map
+        self.budget = budget
+        # nodes expanded and cells scanned by jumps in the last query
+        self.expanded = 0
+        self.scanned = 0
+        self._version = -1
+        self._stride = 0
+        self._open: list[bool] = []
+        self._cost: list[float] = []
+        self._parent: list[int] = []
+        self._seen: list[int] = []
+        self._closed: list[int] = []
+        self._stamp = 0
+
+    def _sync(self):
+        """Rebuild the grid if the map changed"""
+        if self._version == self.map.version:
+            return
+        # pad with blocked cells so neighbours never need a bounds check
+        padded = np.zeros((self.map.height + 2, self.map.width + 2), dtype=bool)
+        padded[1:-1, 1:-1] = self.map.passable
+        self._stride = padded.shape[1]
+        self._open = padded.ravel().tolist()
+        n = len(self._open)
+        if len(self._cost) != n:
+            self._cost = [0.0] * n
+            self._parent = [0] * n
+            self._seen = [0] * n
+            self._closed = [0] * n
+            self._stamp = 0
+        self._version = self.map.version
+
+    def _index(self, x: int, y: int) -> int:
+        return (y + 1) * self._stride + x + 1
+
+    def _position(self, i: int) -> tuple[int, int]:
+        y, x = divmod(i, self._stride)
+        return x - 1, y - 1
+
+    def _start(self, start, goal) -> tuple[int, int] | None:
+        """Prepare a query and return the start and goal indices"""
+        self._sync()
+        self._stamp += 1
+        self.expanded = 0
+        self.scanned = 0
+        # plain ints, NumPy integers would turn the grid arithmetic into NumPy's
+        (sx, sy), (gx, gy) = ((int(x), int(y)) for x, y in (start, goal))
+        for x, y in ((sx, sy), (gx, gy)):
+            if not (0 <= x < self.map.width and 0 <= y < self.map.height):
+                raise ValueError(f"({x}, {y}) is outside the map")
+        s, g = self._index(sx, sy), self._index(gx, gy)
+        if not self._open[g]:
+            return None
+        self._seen[s] = self._stamp
+        self._cost[s] = 0.0
+        self._parent[s] = -1
+        return s, g
+
+    def _trace(self, i: int) -> list[int]:
+        """Return the indices from the start, excluded, to i"""
+        nodes = []
+        parent = self._parent
+        while parent[i] != -1:
+            nodes.append(i)
+            i = parent[i]
+        nodes.reverse()
+        return nodes
+
+    def astar(
+        self,
+        start: tuple[int, int],
+        goal: tuple[int, int],
+        diagonal: bool = False,
+        budget: int | None = None,
+        deadline: float | None = None,
+        partial: bool = False,
+    ) -> list[tuple[int, int]] | None:
+        """Return a shortest path with A*
+
+        Without `diagonal`, only orthogonal steps are taken and the heuristic is
+        the Manhattan distance, otherwise the octile distance.
+        """
+        ends = self._start(start, goal)
+        if ends is None:
+            return None
+        s, g = ends
+        budget = self.budget if budget is None else budget
+        stride, stamp = self._stride, self._stamp
+        is_open, cost, parent = self._open, self._cost, self._parent
+        seen, closed = self._seen, self._closed
+        gy, gx = divmod(g, stride)
+
+        if diagonal:
+            steps = [
+                (1, 1.0, 0, 0),
+                (-1, 1.0, 0, 0),
+                (stride, 1.0, 0, 0),
+                (-stride, 1.0, 0, 0),
+                # diagonal steps need both orthogonal neighbours open
+                (stride + 1, SQRT2, 1, stride),
+                (stride - 1, SQRT2, -1, stride),
+                (-stride + 1, SQRT2, 1, -stride),
+                (-stride - 1, SQRT2, -1, -stride),
+            ]
+        else:
+            steps = [
+                (1, 1.0, 0, 0),
+                (-1, 1.0, 0, 0),
+                (stride, 1.0, 0, 0),
+                (-stride, 1.0, 0, 0),
+            ]
+
+        def heuristic(i):
+            y, x = divmod(i, stride)
+            dx, dy = abs(x - gx), abs(y - gy)
+            if diagonal:
+                return max(dx, dy) + (SQRT2 - 1) * min(dx, dy)
+            return dx + dy
+
+        best, best_h = s, heuristic(s)
+        heap = [(best_h, best_h, s)]
+        while heap:
+            _, h, i = heappop(heap)
+            if closed[i] == stamp:
+                continue
+            closed[i] = stamp
+            if i == g:
+                return [self._position(node) for node in self._trace(i)]
+            if h < best_h:
+                best, best_h = i, h
+            self.expanded += 1
+            if self.expanded > budget or (
+                deadline is not None
+                and self.expanded % DEADLINE_INTERVAL == 0
+                and perf_counter() > deadline
+            ):
+                break
+
+            base = cost[i]
+            for step, step_cost, side, other in steps:
+                j = i + step
+                if not is_open[j] or closed[j] == stamp:
+                    continue
+                if side and not (is_open[i + side] and is_open[i + other]):
+                    continue
+                new_cost = base + step_cost
+                if seen[j] != stamp or new_cost < cost[j]:
+                    seen[j] = stamp
+                    cost[j] = new_cost
+                    parent[j] = i
+                    h = heuristic(j)
+                    heappush(heap, (new_cost + h, h, j))
+
+        if partial:
+            return [self._position(node) for node in self._trace(best)]
+        return None
+
+    def jps(
+        self,
+        start: tuple[int, int],
+        goal: tuple[int, int],
+        budget: int | None = None,
+        deadline: float | None = None,
+        partial: bool = False,
+    ) -> list[tuple[int, int]] | None:
+        """Return a shortest 8-connected path with jump point search
+
+        Only jump points are expanded; the returned path is filled in between
+        them and is as long as the one `astar` finds with `diagonal`. Every cell
+        a jump scans counts against `budget` like an expanded node.
+        """
+        ends = self._start(start, goal)
+        if ends is None:
+            return None
+        s, g = ends
+        budget = self.budget if budget is None else budget
+        stride, stamp = self._stride, self._stamp
+        cost, parent = self._cost, self._parent
+        seen, closed = self._seen, self._closed
+        gy, gx = divmod(g, stride)
+
+        def heuristic(i):
+            y, x = divmod(i, stride)
+            dx, dy = abs(x - gx), abs(y - gy)
+            return max(dx, dy) + (SQRT2 - 1) * min(dx, dy)
+
+        best, best_h = s, heuristic(s)
+        heap = [(best_h, best_h, s)]
+        while heap:
+            _, h, i = heappop(heap)
+            if closed[i] == stamp:
+                continue
+            closed[i] = stamp
+            if i == g:
+                return self._fill(self._trace(i), s)
+            if h < best_h:
+                best, best_h = i, h
+            self.expanded += 1
+            if self.expanded + self.scanned > budget or (
+                deadline is not None
+                and self.expanded % DEADLINE_INTERVAL == 0
+                and perf_counter() > deadline
+            ):
+                break
+
+            base = cost[i]
+            for dx, dy in self._directions(i):
+                j = self._jump(i, dx, dy, g)
+                if j == -1 or closed[j] == stamp:
+                    continue
+                jy, jx = divmod(j, stride)
+                iy, ix = divmod(i, stride)
+                ax, ay = abs(jx - ix), abs(jy - iy)
+                new_cost = base + max(ax, ay) + (SQRT2 - 1) * min(ax, ay)
+                if seen[j] != stamp or new_cost < cost[j]:
+                    seen[j] = stamp
+                    cost[j] = new_cost
+                    parent[j] = i
+                    h = heuristic(j)
+                    heappush(heap, (new_cost + h, h, j))
+
+        if partial:
+            return self._fill(self._trace(best), s)
+        return None
+
+    def _directions(self, i: int) -> list[tuple[int, int]]:
+        """Return the directions worth searching from a jump point"""
+        is_open, stride = self._open, self._stride
+        p = self._parent[i]
+        if p == -1:
+            directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+            directions += [
+                (dx, dy)
+                for dx in (1, -1)
+                for dy in (1, -1)
+                if is_open[i + dx] and is_open[i + dy * stride]
+            ]
+            return directions
+
+        py, px = divmod(p, stride)
+        iy, ix = divmod(i, stride)
+        dx, dy = (ix > px) - (ix < px), (iy > py) - (iy < py)
+        directions = []
+        if dx and dy:
+            vertical, horizontal = is_open[i + dy * stride], is_open[i + dx]
+            if vertical:
+                directions.append((0, dy))
+            if horizontal:
+                directions.append((dx, 0))
+            if vertical and horizontal:
+                directions.append((dx, dy))
+        elif dx:
+            up, down = is_open[i - stride], is_open[i + stride]
+            if is_open[i + dx]:
+                directions.append((dx, 0))
+                if up:
+                    directions.append((dx, -1))
+                if down:
+                    directions.append((dx, 1))
+            if up:
+                directions.append((0, -1))
+            if down:
+                directions.append((0, 1))
+        else:
+            left, right = is_open[i - 1], is_open[i + 1]
+            if is_open[i + dy * stride]:
+                directions.append((0, dy))
+                if left:
+                    directions.append((-1, dy))
+                if right:
+                    directions.append((1, dy))
+            if left:
+                directions.append((-1, 0))
+            if right:
+                directions.append((1, 0))
+        return directions
+
+    def _jump(self, i: int, dx: int, dy: int, goal: int) -> int:
+        """Step from i in (dx, dy) until a jump point; return it or -1"""
+        is_open, stride = self._open, self._stride
+        step = dy * stride + dx
+        scanned = 0
+        try:
+            while True:
+                i += step
+                scanned += 1
+                if not is_open[i]:
+                    return -1
+                if i == goal:
+                    return i
+                if dx and dy:
+                    # a diagonal stops where a straight jump finds something
+                    if self._jump(i, dx, 0, goal) != -1 or self._jump(i, 0, dy, goal) != -1:
+                        return i
+                    if not (is_open[i + dx] and is_open[i + dy * stride]):
+                        return -1
+                elif dx:
+                    # forced neighbours: a side opens up behind an obstacle
+                    if (is_open[i - stride] and not is_open[i - stride - dx]) or (
+                        is_open[i + stride] and not is_open[i + stride - dx]
+                    ):
+                        return i
+                else:
+                    back = dy * stride
+                    if (is_open[i - 1] and not is_open[i - 1 - back]) or (
+                        is_open[i + 1] and not is_open[i + 1 - back]
+                    ):
+                        return i
+        finally:
+            self.scanned += scanned
+
+    def _fill(self, jump_points: list[int], start: int) -> list[tuple[int, int]]:
+        """Return every cell on the straight lines between jump points"""
+        path = []
+        x, y = self._position(start)
+        for node in jump_points:
+            nx, ny = self._position(node)
+            dx, dy = (nx > x) - (nx < x), (ny > y) - (ny < y)
+            while (x, y) != (nx, ny):
+                x, y = x + dx, y + dy
+                path.append((x, y))
+        return path
+
+    def __str__(self):
+        return (
+            f"{self.__class__.__name__} {self.map.width}x{self.map.height} "
+            f"budget:{self.budget} expanded:{self.expanded} scanned:{self.scanned}"
+        )
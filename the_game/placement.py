@@ -0,0 +1,84 @@
+"""Random object placement
+
+Objects are scattered by sampling cells without replacement from a mask of
+free cells, so placing any number of objects costs one pass over the mask
+rather than a search per object. Pass a seeded `numpy.random.Generator` for
+reproducible layouts.
+"""
+from typing import Iterable, Mapping
+
+import numpy as np
+
+
+def exclude_around(
+    free: np.ndarray, points: Iterable[tuple[int, int]], radius: float
+) -> np.ndarray:
+    """Return a copy of the mask without the cells within radius of any point
+
+    The mask is indexed `[y, x]` and points are (x, y). The points themselves
+    are always excluded.
+    """
+    free = free.copy()
+    height, width = free.shape
+    r = int(np.floor(radius))
+    for x, y in points:
+        if r <= 0:
+            if 0 <= x < width and 0 <= y < height:
+                free[y, x] = False
+            continue
+        top, bottom = max(y - r, 0), min(y + r + 1, height)
+        left, right = max(x - r, 0), min(x + r + 1, width)
+        if top >= bottom or left >= right:
+            continue
+        dy, dx = np.ogrid[slice(top - y, bottom - y), slice(left - x, right - x)]
+        free[top:bottom, left:right] &= dx * dx + dy * dy > radius * radius
+    return free
+
+
+def resolve_counts(counts: Mapping[int, float], cells: int) -> dict[int, int]:
+    """Turn counts and densities into counts
+
+    Integers are counts; floats are the fraction of all `cells` to cover.
+    """
+    resolved = {}
+    for kind, amount in counts.items():
+        if isinstance(amount, float):
+            if not 0 <= amount <= 1:
+                raise ValueError(f"density of {kind} must be between 0 and 1")
+            amount = round(amount * cells)
+        if amount < 0:
+            raise ValueError(f"count of {kind} must not be negative")
+        resolved[kind] = int(amount)
+    return resolved
+
+
+def scatter(
+    free: np.ndarray,
+    counts: Mapping[int, float],
+    rng: np.random.Generator,
+) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """Pick distinct free cells for every kind of object
+
+    `counts` maps each kind to a count or a density, see `resolve_counts`.
+    Returns the (xs, ys) of each kind. Raises ValueError if there aren't
+    enough free cells.
+    """
+    height, width = free.shape
+    counts = resolve_counts(counts, width * height)
+    total = sum(counts.values())
+    candidates = np.flatnonzero(free)
+    if total > candidates.size:
+        raise ValueError(
+            f"cannot place {total} objects on {candidates.size} free cells"
+        )
+
+    cells = rng.choice(candidates, total, replace=False)
+    ys, xs = np.divmod(cells, width)
+
+    placed = {}
+    start = 0
+    for kind, n in counts.items():
+        part = slice(start, start + n)
+        placed[kind] = (xs[part], ys[part])
+        start += n
+    return placed
@@ -0,0 +1,431 @@
+"""Match replays
+
+The server can record every match into an append-only binary file. The file
+starts with the world: a JSON header, the map grid and the objects. Then come
+records: every accepted input, timed-out turn and player who left, each with
+the positions of the players it moved. Every `KEYFRAME_INTERVAL` records, a
+keyframe holds the positions of all players. Since records carry their
+effects, playback needs none of the game rules.
+
+Layout, all integers big-endian::
+
+    PREAMBLE     magic, version, header length
+    header       JSON: world size, terrain parameters, players
+    grid         length, zlib compressed `Map.grid`
+    objects      count, OBJECT records
+    records      RECORD, then `count` ENTRY records
+    index        keyframe (turn, offset) pairs, written on close
+    FOOTER       index offset, keyframe count, magic
+
+A replay of a match which didn't end cleanly has no index; the reader then
+finds the keyframes by scanning the records once. `ReplayReader` maps the file
+into memory and seeks to any turn by binary search over the keyframes.
+"""
+import json
+import mmap
+import struct
+import zlib
+from enum import IntEnum, auto
+from pathlib import Path
+from time import perf_counter
+from typing import Hashable, Iterable, Iterator, NamedTuple
+
+import numpy as np
+
+from .game_elements import Direction, Game, Player
+from .messaging import Message, MessageType
+
+MAGIC = b"ELVR"
+INDEX_MAGIC = b"ELVI"
+VERSION = 1
+# Records between keyframes
+KEYFRAME_INTERVAL = 256
+# Bytes buffered before the writer touches the disk
+BUFFER_SIZE = 1 << 16
+
+# magic, version, header length
+PREAMBLE = struct.Struct("!4sBI")
+LENGTH = struct.Struct("!I")
+OBJECT = np.dtype([("type", "u1"), ("x", ">i2"), ("y", ">i2")])
+# kind, direction, player, turn after the record, milliseconds since the
+# start, entry count
+RECORD = struct.Struct("!BBHIIH")
+# a player's position after the record, (-1, -1) once they left
+ENTRY = struct.Struct("!Hhh")
+INDEX = np.dtype([("turn", ">u4"), ("offset", ">u8")])
+# index offset, keyframe count, magic
+FOOTER = struct.Struct("!QI4s")
+# Direction by code
+DIRECTIONS = tuple(Direction)
+CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+NO_DIRECTION = 255
+NO_PLAYER = 0xFFFF
+
+
+class RecordKind(IntEnum):
+    """What a record holds"""
+
+    KEYFRAME = auto()
+    MOVE = auto()
+    EXPIRE = auto()
+    LEAVE = auto()
+
+
+KINDS = frozenset(RecordKind)
+
+
+class Record(NamedTuple):
+    """A record of a replay"""
+
+    kind: RecordKind
+    # the moving or leaving player, and the direction of a move
+    player: int | None
+    direction: Direction | None
+    turn: int
+    millis: int
+    # (player, x, y)
+    entries: list[tuple[int, int, int]]
+    # where the record starts and the next one begins
+    offset: int
+    end: int
+
+
+class ReplayWriter:
+    """Record a match
+
+    Create the writer once `game` is initialized, then call `move`, `expire`
+    and `leave` as the game goes on, and `close` at the end. Writes are
+    buffered, so recording costs about as much as packing the record.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        game: Game,
+        keyframe_interval: int = KEYFRAME_INTERVAL,
+        buffering: int = BUFFER_SIZE,
+    ):
+        self.path = Path(path)
+        self.game = game
+        self.keyframe_interval = keyframe_interval
+        self.players: dict[Hashable, int] = {
+            player.id: index for index, player in enumerate(game.players)
+        }
+        # (turn, offset) of every keyframe
+        self.index: list[tuple[int, int]] = []
+        self.closed = False
+        self._since_keyframe = 0
+        self._start = perf_counter()
+        self._file = open(self.path, "wb", buffering=buffering)
+
+        terrain = game.map.terrain
+        header = json.dumps(
+            {
+                "world": [game.map.width, game.map.height],
+                "terrain": terrain.to_dict() if terrain is not None else None,
+                "players": [[str(player.id), int(player.type)] for player in game.players],
+            }
+        ).encode()
+        grid = zlib.compress(game.map.grid.tobytes())
+        objects = game.objects
+        table = np.empty(len(objects), dtype=OBJECT)
+        table["type"] = [int(obj.type) for obj in objects]
+        table["x"] = [obj.x for obj in objects]
+        table["y"] = [obj.y for obj in objects]
+        self._file.write(PREAMBLE.pack(MAGIC, VERSION, len(header)) + header)
+        self._file.write(LENGTH.pack(len(grid)) + grid)
+        self._file.write(LENGTH.pack(len(table)) + table.tobytes())
+        self.keyframe()
+
+    def keyframe(self):
+        """Record the positions of every player"""
+        self.index.append((self.game.turns, self._file.tell()))
+        self._write(RecordKind.KEYFRAME, None, None, self.game.players)
+        self._since_keyframe = 0
+
+    def move(self, player_id: Hashable, direction: Direction, moved: Iterable[Player]):
+        """Record an accepted move and the players it moved"""
+        self._record(RecordKind.MOVE, player_id, direction, moved)
+
+    def expire(self, moved: Iterable[Player]):
+        """Record timed out turns and the players who moved because of them"""
+        self._record(RecordKind.EXPIRE, None, None, moved)
+
+    def leave(self, player_id: Hashable):
+        """Record that a player left
+
+        The positions of all remaining players are recorded, since they may
+        have moved because of it.
+        """
+        self._record(RecordKind.LEAVE, player_id, None, self.game.players)
+
+    def flush(self):
+        """Write the buffered records to the disk"""
+        self._file.flush()
+
+    def close(self):
+        """Write the keyframe index and close the file"""
+        if self.closed:
+            return
+        self.closed = True
+        offset = self._file.tell()
+        index = np.array(self.index, dtype=INDEX)
+        self._file.write(index.tobytes())
+        self._file.write(FOOTER.pack(offset, len(index), INDEX_MAGIC))
+        self._file.close()
+
+    def _record(
+        self,
+        kind: RecordKind,
+        player_id: Hashable | None,
+        direction: Direction | None,
+        players: Iterable[Player],
+    ):
+        if self.closed:
+            return
+        self._write(kind, player_id, direction, players)
+        self._since_keyframe += 1
+        if self._since_keyframe >= self.keyframe_interval:
+            self.keyframe()
+
+    def _write(
+        self,
+        kind: RecordKind,
+        player_id: Hashable | None,
+        direction: Direction | None,
+        players: Iterable[Player],
+    ):
+        entries = [(self.players[player.id], player.x, player.y) for player in players]
+        if kind == RecordKind.LEAVE:
+            entries.append((self.players[player_id], -1, -1))
+        millis = int((perf_counter() - self._start) * 1e3)
+        self._file.write(
+            RECORD.pack(
+                kind,
+                NO_DIRECTION if direction is None else CODES[direction],
+                NO_PLAYER if player_id is None else self.players[player_id],
+                self.game.turns,
+                millis,
+                len(entries),
+            )
+            + b"".join([ENTRY.pack(*entry) for entry in entries])
+        )
+
+
+class ReplayReader:
+    """Random access to a recorded match
+
+    The file is memory-mapped, so opening a replay only reads its header, and
+    `seek` only touches the keyframe index and the records after the nearest
+    keyframe.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._map
+
+        try:
+            magic, version, length = PREAMBLE.unpack_from(data)
+        except struct.error as exc:
+            raise ValueError(f"{path} is not a replay") from exc
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay")
+        offset = PREAMBLE.size
+        header = json.loads(bytes(data[offset:offset + length]))
+        offset += length
+        self.width, self.height = header["world"]
+        self.terrain: dict | None = header["terrain"]
+        # (id, ObjectType value) by player index
+        self.players: list[tuple[str, int]] = [tuple(p) for p in header["players"]]
+
+        (length,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        grid = zlib.decompress(data[offset:offset + length])
+        self.grid = np.frombuffer(grid, dtype=np.uint8).reshape(self.height, self.width)
+        offset += length
+        (count,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+        self.objects = np.frombuffer(data, dtype=OBJECT, count=count, offset=offset)
+        self.start = offset + count * OBJECT.itemsize
+
+        self.end = len(data)
+        index = None
+        if len(data) >= self.start + FOOTER.size:
+            index_offset, count, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+            if magic == INDEX_MAGIC:
+                index = np.frombuffer(data, dtype=INDEX, count=count, offset=index_offset)
+                self.end = index_offset
+        if index is None:
+            index = np.array(
+                [
+                    (record.turn, record.offset)
+                    for record in self.records()
+                    if record.kind == RecordKind.KEYFRAME
+                ],
+                dtype=INDEX,
+            )
+        self.keyframe_turns = index["turn"].astype(np.int64)
+        self.keyframe_offsets = index["offset"].astype(np.int64)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def turns(self) -> int:
+        """The turn the match ended with"""
+        last = None
+        offset = int(self.keyframe_offsets[-1]) if len(self.keyframe_offsets) else None
+        for last in self.records(offset):
+            pass
+        return last.turn if last is not None else 0
+
+    def records(self, offset: int | None = None) -> Iterator[Record]:
+        """Yield the records from an offset on, by default from the first
+
+        Records end at the first truncated or invalid one, e.g. of a crashed
+        server.
+        """
+        data = self._map
+        offset = self.start if offset is None else offset
+        while offset + RECORD.size <= self.end:
+            kind, direction, player, turn, millis, count = RECORD.unpack_from(
+                data, offset
+            )
+            end = offset + RECORD.size + count * ENTRY.size
+            if end > self.end or kind not in KINDS:
+                return
+            entries = list(ENTRY.iter_unpack(data[offset + RECORD.size:end]))
+            yield Record(
+                RecordKind(kind),
+                None if player == NO_PLAYER else player,
+                None if direction == NO_DIRECTION else DIRECTIONS[direction],
+                turn,
+                millis,
+                entries,
+                offset,
+                end,
+            )
+            offset = end
+
+    def seek(self, turn: int) -> tuple[np.ndarray, int]:
+        """Return the player positions at a turn and where the next record is
+
+        Positions are indexed `[player, axis]`, x before y, and are -1 for
+        players who left.
+        """
+        positions = [(-1, -1)] * len(self.players)
+        i = int(np.searchsorted(self.keyframe_turns, turn, side="right")) - 1
+        offset = int(self.keyframe_offsets[max(i, 0)])
+        for record in self.records(offset):
+            if record.turn > turn and record.kind != RecordKind.KEYFRAME:
+                offset = record.offset
+                break
+            for player, x, y in record.entries:
+                positions[player] = x, y
+            offset = record.end
+        return np.array(positions, dtype=np.int32).reshape(-1, 2), offset
+
+    def close(self):
+        """Unmap the file"""
+        self.objects = None
+        self._map.close()
+
+
+class ReplayFeed:
+    """Play a replay back as the messages the server would send
+
+    Has the interface of `network.NetworkBridge`, so the client can show a
+    replay with no server running. Messages sent to it are ignored. With
+    `speed` above 1, the replay is played back faster than it was recorded.
+    The client follows the first player.
+    """
+
+    def __init__(self, reader: ReplayReader, speed: float = 1.0, turn: int = 0):
+        self.reader = reader
+        self.speed = speed
+        self.turn = turn
+        # replays can't be resumed, see `network.NetworkBridge.token`
+        self.token: str | None = None
+        self.seq = 0
+        self._records: Iterator[Record] | None = None
+        self._next: Record | None = None
+        self._ready: Message | None = None
+        self._started = 0.0
+        self._millis = 0
+
+    def start(self):
+        """Start the playback"""
+        reader = self.reader
+        positions, offset = reader.seek(self.turn)
+        entities = [
+            [index, type, int(x), int(y)]
+            for index, ((_, type), (x, y)) in enumerate(zip(reader.players, positions))
+            if x >= 0
+        ]
+        first = len(reader.players)
+        entities += [
+            [first + i, int(obj["type"]), int(obj["x"]), int(obj["y"])]
+            for i, obj in enumerate(reader.objects)
+        ]
+        self.seq = 1
+        self._ready = Message(
+            MessageType.READY,
+            {
+                "player": 0,
+                "world": [reader.width, reader.height],
+                "terrain": reader.terrain,
+                "state": {
+                    "seq": self.seq,
+                    "base": None,
+                    "entities": entities,
+                    "removed": [],
+                },
+            },
+        )
+        self._records = reader.records(offset)
+        self._next = next(self._records, None)
+        self._millis = self._next.millis if self._next is not None else 0
+        self._started = perf_counter()
+
+    def post(self, message: Message | None):
+        """Ignore a message for the server"""
+
+    def drain(self) -> Iterator[Message]:
+        """Yield the messages due by now"""
+        if self._ready is not None:
+            yield self._ready
+            self._ready = None
+        elapsed = (perf_counter() - self._started) * 1e3 * self.speed
+        while self._next is not None and self._next.millis - self._millis <= elapsed:
+            record = self._next
+            self._next = next(self._records, None)
+            if record.kind == RecordKind.KEYFRAME:
+                continue
+            entities, removed = [], []
+            for player, x, y in record.entries:
+                if x < 0:
+                    removed.append(player)
+                else:
+                    entities.append([player, self.reader.players[player][1], x, y])
+            if not entities and not removed:
+                continue
+            yield Message(
+                MessageType.MOVE,
+                {
+                    "seq": self.seq + 1,
+                    "base": self.seq,
+                    "entities": entities,
+                    "removed": removed,
+                },
+            )
+            self.seq += 1
+
+    def close(self, timeout: float = 1.0):
+        """Stop the playback"""
+        self._records = self._next = None
+        self.reader.close()
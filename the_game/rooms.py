@@ -0,0 +1,305 @@
+"""Room management
+
+A room hosts a single match. The server keeps one `RoomManager` which maps
+every connected client to the room it plays in, so one process can host many
+matches side by side.
+
+Matches restored from a snapshot have no clients at first. Their players get
+their seats back by reconnecting with the id they had, see `resume`.
+
+Spectators of a room are kept apart from its clients: they don't take part in
+the match, see `watch`.
+
+Bots take the seats of a room nobody else is going to take, see `fill`. They
+only play along: a room without clients is torn down. Snapshots don't tell bots
+apart from other players, so the seats of the bots of a restored match stay
+vacant until they are abandoned.
+"""
+import asyncio
+from collections import deque
+from itertools import count
+from typing import Callable, Hashable
+from uuid import UUID
+
+from .bot import Bot
+from .game_elements import X_SPACES, Y_SPACES, Game, Rules
+from .interest import View
+from .messaging import Message
+from .replay import ReplayWriter
+from .state import WorldState
+from .visibility import Sight
+
+
+class Room:
+    """A single match and the clients taking part in it"""
+
+    __slots__ = (
+        "id",
+        "game",
+        "state",
+        "acks",
+        "views",
+        "sight",
+        "clients",
+        "bots",
+        "inputs",
+        "timer",
+        "replay",
+        "spectators",
+    )
+
+    def __init__(
+        self,
+        room_id: int,
+        width: int = X_SPACES,
+        height: int = Y_SPACES,
+        rules: Rules | None = None,
+        game: Game | None = None,
+    ):
+        self.id = room_id
+        self.game = game or Game(width, height, rules=rules)
+        self.state = WorldState()
+        # last state sequence number acknowledged by each player
+        self.acks: dict[UUID, int] = {}
+        # what each player was sent, with interest management
+        self.views: dict[UUID, View] = {}
+        # fields of view of the players, if they only see what is in sight
+        self.sight: Sight | None = None
+        self.clients: set[Hashable] = set()
+        # computer players by id, see `RoomManager.fill`
+        self.bots: dict[UUID, Bot] = {}
+        # (sender, message) waiting for the next server tick
+        self.inputs: deque[tuple[UUID, Message]] = deque()
+        # handle of the callback timing out the current turn
+        self.timer: asyncio.TimerHandle | None = None
+        # recording of the running match, if any
+        self.replay: ReplayWriter | None = None
+        # last state sequence number sent to each spectator
+        self.spectators: dict[Hashable, int] = {}
+
+    @property
+    def full(self) -> bool:
+        """Return True if no more players can join the room
+
+        The match starts once the room is full, see `Rules.players`.
+        """
+        return len(self.clients) + len(self.bots) >= self.game.rules.players
+
+    def reset(self):
+        """Reset the match and its world state"""
+        self.close_replay()
+        self.game.reset()
+        self.bots.clear()
+        self.state = WorldState()
+        self.acks.clear()
+        self.views.clear()
+        self.sight = None
+        self.inputs.clear()
+
+    def close_replay(self):
+        """Finish the recording of the match, if any"""
+        if self.replay is not None:
+            self.replay.close()
+            self.replay = None
+
+    def __str__(self):
+        return (
+            f"{self.__class__.__name__} {self.id} clients:{len(self.clients)} "
+            f"bots:{len(self.bots)}"
+        )
+
+
+class RoomManager:
+    """Assign clients to rooms
+
+    Clients are anything hashable with an `id` attribute, usually a
+    `WebSocketServerProtocol`. Joining and leaving are O(1): rooms waiting for
+    players are kept in an insertion-ordered dict so the oldest open room is
+    filled first.
+    """
+
+    def __init__(
+        self,
+        width: int = X_SPACES,
+        height: int = Y_SPACES,
+        rules: Rules | None = None,
+    ):
+        # world size and rules of new rooms
+        self.width = width
+        self.height = height
+        self.rules = rules or Rules()
+        # seats of every room taken by bots, see `fill`
+        self.bots = 0
+        self.rooms: dict[int, Room] = {}
+        self._open: dict[int, Room] = {}
+        self._by_client: dict[Hashable, Room] = {}
+        # restored rooms by the ids of the players who haven't come back yet
+        self._seats: dict[Hashable, Room] = {}
+        self._ids = count()
+        # called with a client after it joined, resumed, left or watched a room
+        self.on_change: Callable[[Hashable], None] | None = None
+
+    def __len__(self):
+        return len(self.rooms)
+
+    @property
+    def open_seats(self) -> int:
+        """Return how many more players the open rooms wait for, besides bots"""
+        return sum(
+            room.game.rules.players - len(room.clients) - self.bots
+            for room in self._open.values()
+        )
+
+    @property
+    def vacant(self) -> list[Hashable]:
+        """Return the ids of the players of restored matches who haven't resumed"""
+        return list(self._seats)
+
+    def create(self) -> Room:
+        """Create a new empty room"""
+        room = Room(next(self._ids), self.width, self.height, self.rules)
+        self.rooms[room.id] = room
+        self._open[room.id] = room
+        return room
+
+    def join(self, client) -> Room:
+        """Add a client to the oldest open room, creating one if needed"""
+        if client in self._by_client:
+            raise RuntimeError(f"{client.id} already joined a room")
+
+        if self._open:
+            room = next(iter(self._open.values()))
+        else:
+            room = self.create()
+
+        room.game.init_player(client.id)
+        room.clients.add(client)
+        self._by_client[client] = room
+        if len(room.clients) + self.bots >= room.game.rules.players:
+            self.fill(room)
+        if room.full:
+            del self._open[room.id]
+        if self.on_change is not None:
+            self.on_change(client)
+        return room
+
+    def fill(self, room: Room):
+        """Seat bots in the empty seats of a room
+
+        Bots join after the clients, so they take the sides left over.
+        """
+        while not room.full:
+            bot = Bot(room.game)
+            bot.join()
+            room.bots[bot.id] = bot
+
+    def restore(self, room_id: int, game: Game) -> Room:
+        """Host a restored match until its players resume"""
+        room = Room(room_id, game=game)
+        self.rooms[room.id] = room
+        for player in game.players:
+            self._seats[player.id] = room
+        self._ids = count(max(next(self._ids), room_id + 1))
+        return room
+
+    def resume(self, client) -> Room | None:
+        """Give a client its seat in a restored match back
+
+        The client must have the id of a player who hasn't resumed yet. Returns
+        the room, or None if there is no such seat.
+        """
+        if client in self._by_client:
+            raise RuntimeError(f"{client.id} already joined a room")
+        room = self._seats.pop(client.id, None)
+        if room is None:
+            return None
+        if room.state.seq == 0:
+            # the world state is only needed once somebody is back
+            room.state.load(room.game)
+        room.clients.add(client)
+        self._by_client[client] = room
+        if self.on_change is not None:
+            self.on_change(client)
+        return room
+
+    def watch(self, client, room_id: int | None = None) -> Room | None:
+        """Add a spectator to a running match
+
+        Without `room_id`, the oldest running match is watched. Returns the
+        room, or None if there is no such match.
+        """
+        if room_id is None:
+            room = next(
+                (room for room in self.rooms.values() if room.game.initialized), None
+            )
+        else:
+            room = self.rooms.get(room_id)
+        if room is None or not room.game.initialized:
+            return None
+        if room.state.seq == 0:
+            room.state.load(room.game)
+        room.spectators[client] = room.state.seq
+        if self.on_change is not None:
+            self.on_change(client)
+        return room
+
+    def unwatch(self, client, room: Room):
+        """Remove a spectator from a room"""
+        room.spectators.pop(client, None)
+
+    def abandon(self, room: Room):
+        """Remove the players of a restored room who didn't resume
+
+        The room is torn down if nobody resumed.
+        """
+        for player in room.game.players:
+            if self._seats.get(player.id) is room:
+                del self._seats[player.id]
+                room.game.deinit_player(player.id)
+        if not room.clients:
+            self.close(room)
+
+    def leave(self, client) -> Room | None:
+        """Remove a client from its room
+
+        Empty rooms are torn down. A room which hasn't started its match yet is
+        reopened for new players.
+        """
+        room = self._by_client.pop(client, None)
+        if room is None:
+            return None
+
+        room.clients.discard(client)
+        room.acks.pop(client.id, None)
+        room.views.pop(client.id, None)
+        if room.sight is not None:
+            room.sight.discard(client.id)
+        room.game.deinit_player(client.id)
+        if room.replay is not None:
+            room.replay.leave(client.id)
+        if not room.clients:
+            self.close(room)
+        elif not room.game.initialized:
+            self._open[room.id] = room
+        if self.on_change is not None:
+            self.on_change(client)
+        return room
+
+    def close(self, room: Room):
+        """Tear down a room and forget its clients"""
+        for client in room.clients:
+            self._by_client.pop(client, None)
+        room.clients.clear()
+        if room.timer is not None:
+            room.timer.cancel()
+            room.timer = None
+        room.close_replay()
+        for player in room.game.players:
+            if self._seats.get(player.id) is room:
+                del self._seats[player.id]
+        self.rooms.pop(room.id, None)
+        self._open.pop(room.id, None)
+
+    def room_of(self, client) -> Room | None:
+        """Return the room a client is in"""
+        return self._by_client.get(client)
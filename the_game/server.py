@@ -1,15 +1,34 @@
 """Server module"""
+import argparse
 import asyncio
-import json
 import logging
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+from urllib.parse import parse_qs, urlsplit
 from uuid import UUID
 
 import websockets
 from websockets.exceptions import ConnectionClosed
-from websockets.server import WebSocketServerProtocol
+from websockets.server import WebSocketServer, WebSocketServerProtocol
+from websockets.typing import Data
 
-from .game_elements import Direction, Game, ObjectType
+from . import metrics, outbox, snapshots, spectators
+from .codec import SUBPROTOCOLS, Codec, codec_for
+from .game_elements import MAX_SPACES, X_SPACES, Y_SPACES, Direction, Rules
+from .interest import View
+from .lobby import Lobby
 from .messaging import Message, MessageType
+from .metrics import REGISTRY, Sampler
+from .outbox import Outbox, OverflowPolicy
+from .replay import ReplayWriter
+from .rooms import Room, RoomManager
+from .snapshots import Snapshotter
+from .ticker import Ticker
+from .turns import TurnMode
+from .visibility import FieldOfView, Sight
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,156 +37,843 @@ logging.basicConfig(
 )
 LOG = logging.getLogger(__name__)
 
-connected_clients: set[WebSocketServerProtocol] = set()
-game = Game()
 
+@dataclass
+class ServerConfig:
+    """Server settings"""
 
-async def send(websocket: WebSocketServerProtocol, message: str):
-    """Send a serialized message to websocket"""
+    host: str = ""
+    port: int = 8001
+    # world size of new matches, in cells
+    width: int = X_SPACES
+    height: int = Y_SPACES
+    # outbound queue length at which `outbox_policy` kicks in
+    outbox_high_water: int = outbox.HIGH_WATER
+    outbox_policy: OverflowPolicy = OverflowPolicy.COALESCE
+    # port of the metrics endpoint on metrics_host, None to disable it
+    metrics_port: int | None = None
+    metrics_host: str = "localhost"
+    # log every n-th incoming message and processing error, 0 for none
+    log_every: int = 100
+    error_log_every: int = 1
+    # apply inputs this many times per second instead of as they arrive
+    tick_rate: float | None = None
+    # players per match, how they take turns and seconds they have to move
+    players: int = 2
+    turn_mode: TurnMode = TurnMode.ROUND_ROBIN
+    turn_timeout: float | None = None
+    # directory to record a replay of every match into, None to not record
+    replay_dir: str | None = None
+    # directory to keep snapshots of the running matches in, None for none,
+    # and seconds between snapshots
+    snapshot_dir: str | None = None
+    snapshot_interval: float = snapshots.INTERVAL
+    # seconds the players of a restored match have to reconnect
+    resume_timeout: float = 60.0
+    # most state updates per second sent to spectators
+    spectator_rate: float = spectators.RATE
+    # cells around their player within which clients are sent entities, None
+    # to send them every entity, see `interest`
+    interest_radius: int | None = None
+    # cells around them players see in their line of sight, None to see
+    # everything; only what they see is sent, see `visibility`
+    sight: int | None = None
+    # seats of every match taken by bots, fewer than `players`, see `bot`
+    bots: int = 0
+
+
+config = ServerConfig()
+rooms = RoomManager()
+lobby = Lobby(rooms)
+outboxes: dict[WebSocketServerProtocol, Outbox] = {}
+# messages dropped by the outboxes of closed connections
+dropped = 0
+log_messages = Sampler(config.log_every)
+log_errors = Sampler(config.error_log_every)
+log_overruns = Sampler(100)
+# rooms with queued inputs, see `tick`
+ticking: dict[int, Room] = {}
+ticker: Ticker | None = None
+# rooms with spectators, see `spectate`
+watched: dict[int, Room] = {}
+
+MESSAGES_RECEIVED = REGISTRY.counter(
+    "game_messages_received_total", "Messages received by type", ("type",)
+)
+MESSAGES_SENT = REGISTRY.counter(
+    "game_messages_sent_total", "Messages queued for clients by type", ("type",)
+)
+MESSAGE_ERRORS = REGISTRY.counter(
+    "game_message_errors_total", "Messages which failed to decode or process"
+)
+DECODE_SECONDS = REGISTRY.histogram(
+    "game_decode_seconds", "Time to decode a message", ("codec",)
+)
+PROCESS_SECONDS = REGISTRY.histogram(
+    "game_process_seconds", "Time to process a message by type", ("type",)
+)
+ENCODE_SECONDS = REGISTRY.histogram(
+    "game_encode_seconds", "Time to encode a message", ("codec",)
+)
+REGISTRY.gauge(
+    "game_connected_clients",
+    "Open client connections",
+    function=lambda: len(outboxes) - spectator_count(),
+)
+REGISTRY.gauge(
+    "game_lobby_clients", "Clients waiting for a match", function=lambda: len(lobby)
+)
+REGISTRY.gauge("game_rooms", "Rooms, running or waiting", function=lambda: len(rooms))
+REGISTRY.gauge(
+    "game_active_games",
+    "Rooms with a running match",
+    function=lambda: sum(room.game.initialized for room in rooms.rooms.values()),
+)
+REGISTRY.gauge(
+    "game_outbox_depth",
+    "Messages queued in all outboxes",
+    function=lambda: outbox_stats()["depth"],
+)
+REGISTRY.gauge(
+    "game_spectators",
+    "Spectator connections",
+    function=lambda: spectator_count(),
+)
+SPECTATOR_UPDATES = REGISTRY.counter(
+    "game_spectator_updates_total", "State updates sent to spectators"
+)
+SPECTATOR_SKIPS = REGISTRY.counter(
+    "game_spectator_skips_total",
+    "State updates skipped for spectators whose connection was backed up",
+)
+TICK_SECONDS = REGISTRY.histogram("game_tick_seconds", "Time to run a server tick")
+TICK_LATENESS_SECONDS = REGISTRY.histogram(
+    "game_tick_lateness_seconds", "Time a server tick started after its deadline"
+)
+REGISTRY.counter(
+    "game_tick_overruns_total",
+    "Server ticks which ran past the next deadline",
+    function=lambda: ticker.overruns if ticker is not None else 0,
+)
+REGISTRY.counter(
+    "game_ticks_skipped_total",
+    "Server tick deadlines missed because of overruns",
+    function=lambda: ticker.skipped if ticker is not None else 0,
+)
+REGISTRY.counter(
+    "game_outbox_dropped_total",
+    "Messages dropped by the outbox overflow policy",
+    function=lambda: dropped + outbox_stats()["dropped"],
+)
+
+
+def outbox_stats() -> dict[str, int]:
+    """Return the total depth and dropped message count of all outboxes"""
+    return {
+        "depth": sum(box.depth for box in outboxes.values()),
+        "dropped": sum(box.dropped for box in outboxes.values()),
+    }
+
+
+def spectator_count() -> int:
+    """Return the number of spectators of all rooms"""
+    return sum(len(room.spectators) for room in watched.values())
+
+
+def encode(codec: Codec, message: Message) -> Data:
+    """Encode a message, recording the time taken"""
+    start = perf_counter()
+    data = codec.encode(message)
+    ENCODE_SECONDS.observe(perf_counter() - start, codec.name)
+    return data
+
+
+def broadcast(room: Room, message: Message, clients=None):
+    """Queue a message for all clients in a room, or only for `clients`
+
+    The message is encoded once per codec in use and the encoded payload is
+    shared by all recipients.
+    """
+    encoded: dict[Codec, Data] = {}
+    for websocket in room.clients if clients is None else clients:
+        codec = codec_for(websocket.subprotocol)
+        if codec not in encoded:
+            encoded[codec] = encode(codec, message)
+        outboxes[websocket].put(encoded[codec])
+        MESSAGES_SENT.inc(message["type"].name)
+
+
+def see(room: Room, clients) -> dict[UUID, FieldOfView]:
+    """Return the fields of view of the players of clients of a room"""
+    if room.sight is None:
+        room.sight = Sight(config.sight)
+    positions = {}
+    for websocket in clients:
+        player = room.game.player(websocket.id)
+        if player is not None and player.x >= 0:
+            positions[websocket.id] = (player.x, player.y)
+    map = room.game.map
+    return room.sight.update(map.passable, map.version, positions)
+
+
+def view_state(
+    room: Room, websocket: WebSocketServerProtocol, field: FieldOfView | None = None
+) -> dict:
+    """Return the state payload of a client with interest management
+
+    With a `field` of view, only the entities the player sees are sent.
+    """
+    view = room.views.get(websocket.id)
+    if view is None:
+        view = room.views[websocket.id] = View(config.interest_radius)
+    player = room.state.entities.get(room.state.entity_id(websocket.id))
+    return view.payload(room.state, player[1:] if player is not None else None, field)
+
+
+def publish(room: Room):
+    """Queue for every client in a room the state changes it hasn't acknowledged
+
+    Clients which acknowledged the same sequence number and use the same codec
+    share one encoded delta. With interest management every client gets its own.
+    """
+    seq = room.state.seq
+    encoded: dict[tuple[Codec, int | None], Data] = {}
+    fields = see(room, room.clients) if config.sight is not None else {}
+    for websocket in room.clients:
+        since = room.acks.get(websocket.id)
+        if since == seq:
+            continue
+        codec = codec_for(websocket.subprotocol)
+        if config.interest_radius is not None:
+            field = fields.get(websocket.id)
+            message = Message(MessageType.MOVE, view_state(room, websocket, field))
+            outboxes[websocket].put(encode(codec, message), state=True)
+            MESSAGES_SENT.inc(MessageType.MOVE.name)
+            continue
+        key = (codec, since)
+        if key not in encoded:
+            encoded[key] = encode(
+                codec, Message(MessageType.MOVE, room.state.delta(since))
+            )
+        outboxes[websocket].put(encoded[key], state=True)
+        MESSAGES_SENT.inc(MessageType.MOVE.name)
+
+
+def start(room: Room):
+    """Initialize the room's match and send everyone the full world state"""
+    room.game.initialize()
+    room.state.load(room.game)
+    if config.replay_dir is not None:
+        path = Path(config.replay_dir) / (
+            f"{datetime.now():%Y%m%d-%H%M%S}-room{room.id}.elvr"
+        )
+        room.replay = ReplayWriter(path, room.game)
+    play_bots(room)
+    room.state.commit()
+    for websocket in room.clients:
+        ready(room, websocket)
+
+
+def world(room: Room) -> dict:
+    """Return the world size and terrain of a room's match"""
+    # clients regenerate the map from its parameters
+    params = room.game.map.terrain
+    return {
+        "world": [room.game.map.width, room.game.map.height],
+        "terrain": params.to_dict() if params is not None else None,
+    }
+
+
+def ready(room: Room, websocket: WebSocketServerProtocol):
+    """Send a client the full world state of its match
+
+    With interest management, the state only has the entities in view, and
+    with `sight` those the player sees; the client draws the rest in fog. The
+    token is the player's id, to resume with after a server restart. The
+    number of players and the interest radius tell clients what to expect.
+    """
+    if config.sight is not None:
+        state = view_state(room, websocket, see(room, [websocket]).get(websocket.id))
+    elif config.interest_radius is not None:
+        state = view_state(room, websocket)
+    else:
+        state = room.state.keyframe()
+    message = Message(
+        MessageType.READY,
+        {
+            "player": room.state.entity_id(websocket.id),
+            **world(room),
+            "state": state,
+            "players": room.game.rules.players,
+            "interest_radius": config.interest_radius,
+            "sight": config.sight,
+            "token": str(websocket.id),
+        },
+    )
+    codec = codec_for(websocket.subprotocol)
+    outboxes[websocket].put(encode(codec, message))
+    MESSAGES_SENT.inc(MessageType.READY.name)
+
+
+def query(websocket: WebSocketServerProtocol) -> dict[str, list[str]]:
+    """Return the query parameters of a client's request"""
+    return parse_qs(urlsplit(websocket.path).query, keep_blank_values=True)
+
+
+def resume(websocket: WebSocketServerProtocol) -> Room | None:
+    """Seat a client in its restored match if it asks to resume
+
+    A client resumes by connecting with its token in the `resume` query
+    parameter, and takes the id of its player over.
+    """
+    token = query(websocket).get("resume")
+    if not token:
+        return None
     try:
-        await websocket.send(message)
-    except ConnectionClosed:
-        pass
+        player_id = UUID(token[0])
+    except ValueError:
+        return None
+    connection_id = websocket.id
+    websocket.id = player_id
+    room = rooms.resume(websocket)
+    if room is None:
+        websocket.id = connection_id
+    return room
 
 
-def broadcast(message: str):
-    """Send a serialized message to all connected clients
+def departed(room: Room, player_ids):
+    """Let the players of a room know others are gone, and who moved
 
-    See broadcasting example at https://websockets.readthedocs.io/en/stable/topics/broadcast.html#the-concurrent-way
+    The remaining players may have moved because they no longer wait for the
+    ones who left.
     """
-    for websocket in connected_clients:
-        asyncio.create_task(send(websocket, message))
+    if not room.clients or not room.game.initialized:
+        return
+    seq = room.state.seq
+    for player_id in player_ids:
+        room.state.remove(player_id)
+    play_bots(room)
+    for player in room.game.players:
+        room.state.track(player)
+    if room.state.commit() != seq:
+        publish(room)
+    schedule_expiry(room)
 
 
-def process_message(message: Message, sender: UUID) -> Message:
+def abandon(room: Room):
+    """Give up on the players of a restored match who didn't resume"""
+    before = {player.id for player in room.game.players}
+    rooms.abandon(room)
+    departed(room, before - {player.id for player in room.game.players})
+
+
+def process_message(room: Room, message: Message, sender: UUID) -> Message | None:
     """Process a client message
 
-    This is where the server-side business logic lives.
+    This is where the server-side business logic lives. Returns the message to
+    broadcast to the room, if any. State changes are recorded in `room.state`
+    and published separately.
+
+    A move may be tagged by the latency probe of its client, see
+    `client.LatencyProbe`, as `{"direction": ..., "probe": tag}`. The tag is
+    acknowledged to the sender once the move is applied.
     """
+    game = room.game
     match message["type"]:
         case MessageType.QUIT:
             LOG.info("received a QUIT message. resetting game")
-            game.reset()
+            room.reset()
             return Message(MessageType.QUIT, "quit")
         case MessageType.MOVE:
-            LOG.info("received a MOVE message")
+            LOG.debug("received a MOVE message")
+            content, probe = message["content"], None
+            if isinstance(content, dict):
+                content, probe = content.get("direction"), content.get("probe")
+            direction = Direction(content)
             try:
-                game.move_player(sender, Direction(message["content"]))
+                moved = game.move_player(sender, direction)
             except RuntimeError as exc:
                 return Message(MessageType.ERROR, f"{exc}")
-            return Message(
-                MessageType.MOVE,
-                json.dumps(
-                    {
-                        "hunter": [
-                            (
-                                game.players[0].x,
-                                game.players[0].y,
-                            )
-                        ],
-                        "prey": [
-                            (
-                                game.players[1].x,
-                                game.players[1].y,
-                            )
-                        ],
-                    }
-                ),
-            )
+            for player in moved:
+                room.state.track(player)
+            if room.replay is not None:
+                room.replay.move(sender, direction, moved)
+            if probe is not None:
+                return Message(MessageType.ACK, probe)
+            return None
+        case MessageType.ACK:
+            try:
+                seq = int(message["content"])
+            except (TypeError, ValueError) as exc:
+                raise ValueError(f"invalid ACK sequence number: {message['content']}") from exc
+            room.acks[sender] = max(seq, room.acks.get(sender, 0))
+            view = room.views.get(sender)
+            if view is not None:
+                view.ack(seq)
+            return None
         case _:
             raise ValueError(f"invalid message type: {message['type']}")
 
 
-async def handler(websocket: WebSocketServerProtocol):
-    """Client connection handler"""
-    LOG.info("client connected: %s", websocket.id)
-    try:
-        game.init_player(websocket.id)
-    except RuntimeError as exc:
-        await websocket.close(reason=f"{exc}")
-    connected_clients.add(websocket)
+def apply(room: Room, message: Message, sender: UUID):
+    """Process a client message and broadcast the response
 
+    Errors and acknowledgements only answer the sender's message, so only the
+    sender gets them. State changes are left for the caller to commit and
+    publish.
+    """
+    start = perf_counter()
     try:
-        while len(connected_clients) < 2:
-            LOG.info(
-                f"waiting for 2 clients to connect. connected: {len(connected_clients)}"
-            )
-            # make sure user client hasn't disconnected
-            await websocket.ping()
-
-            await asyncio.sleep(1)
-
-        LOG.info("Both clients connected! ")
-
-        if not game.initialized:
-            # initiate the game
-            # TODO: make sure the player IDs are in the right order
-            game.initialize()
-            broadcast(
-                Message(
-                    MessageType.READY,
-                    json.dumps(
-                        {
-                            "hunter": [
-                                (
-                                    game.players[0].x,
-                                    game.players[0].y,
-                                )
-                            ],
-                            "prey": [
-                                (
-                                    game.players[1].x,
-                                    game.players[1].y,
-                                )
-                            ],
-                            "stone": [
-                                (item.x, item.y)
-                                for item in game.objects
-                                if item.type == ObjectType.STONE
-                            ],
-                            "tree": [
-                                (item.x, item.y)
-                                for item in game.objects
-                                if item.type == ObjectType.TREE
-                            ],
-                        },
-                    ),
-                ).serialize()
+        response = process_message(room, message, sender)
+    except ValueError as exc:
+        MESSAGE_ERRORS.inc()
+        if log_errors():
+            LOG.error(
+                "failed to process message due to exception: "
+                "message: %s exception: %s",
+                message,
+                exc,
             )
+        response = Message(MessageType.ERROR, str(exc))
+    PROCESS_SECONDS.observe(perf_counter() - start, message["type"].name)
+
+    if response is None:
+        return
+    if response["type"] in (MessageType.ERROR, MessageType.ACK):
+        broadcast(room, response, [websocket for websocket in room.clients if websocket.id == sender])
+    else:
+        # send the message to all clients in the room
+        broadcast(room, response)
+
+
+def play_bots(room: Room):
+    """Let the bots of a room move for as long as it's their turn
+
+    Their moves are applied like those of the clients, see `apply`. State
+    changes are left for the caller to commit and publish.
+    """
+    if not room.bots or not room.game.initialized:
+        return
+    scheduler = room.game.scheduler
+    while room.clients:
+        bots = [bot for bot in room.bots.values() if scheduler.expects(bot.id)]
+        if not bots:
+            return
+        for bot in bots:
+            apply(room, Message(MessageType.MOVE, bot.choose().value), bot.id)
+
+
+def schedule_expiry(room: Room):
+    """Arrange for the current turn of a room to time out
+
+    Does nothing unless the match has a turn timeout.
+    """
+    if room.timer is not None:
+        room.timer.cancel()
+        room.timer = None
+    deadline = room.game.scheduler.deadline
+    if deadline is not None and room.clients:
+        delay = max(deadline - room.game.scheduler.clock(), 0)
+        room.timer = asyncio.get_running_loop().call_later(delay, expire, room)
+
+
+def time_out(room: Room):
+    """Time out the overdue turns of a room and track who moved"""
+    turns = room.game.turns
+    moved = room.game.expire()
+    for player in moved:
+        room.state.track(player)
+    if room.replay is not None and room.game.turns != turns:
+        room.replay.expire(moved)
+
+
+def expire(room: Room):
+    """Time out the overdue turns of a room
+
+    In tick mode, this waits for the next tick.
+    """
+    room.timer = None
+    if not room.clients:
+        return
+    if ticker is not None:
+        ticking[room.id] = room
+        return
+    seq = room.state.seq
+    time_out(room)
+    play_bots(room)
+    if room.state.commit() != seq:
+        publish(room)
+    schedule_expiry(room)
+
+
+def tick():
+    """Apply the queued inputs of every room
+
+    The inputs of a room are applied in the order they arrived, so the turn
+    rules of `Game.move_player` hold as without ticks, and overdue turns are
+    timed out. Every room then publishes its state changes at most once.
+    """
+    queued = list(ticking.values())
+    ticking.clear()
+    for room in queued:
+        if not room.clients:
+            # everybody left
+            room.inputs.clear()
+            continue
+        seq = room.state.seq
+        try:
+            while room.inputs:
+                sender, message = room.inputs.popleft()
+                apply(room, message, sender)
+                play_bots(room)
+            time_out(room)
+            play_bots(room)
+        except Exception:
+            # don't let one broken room stop the ticks of all the others
+            LOG.exception("failed to apply the inputs of room %s", room.id)
+            room.inputs.clear()
+        if room.state.commit() != seq:
+            publish(room)
+        schedule_expiry(room)
+
+
+def on_tick(lateness: float, duration: float):
+    """Record the timing of a server tick"""
+    TICK_LATENESS_SECONDS.observe(lateness)
+    TICK_SECONDS.observe(duration)
+    if duration > ticker.period and log_overruns():
+        LOG.warning("tick took %.1f ms, %s", duration * 1e3, ticker)
+
+
+async def watch(websocket: WebSocketServerProtocol, room_id: str):
+    """Stream a match to a spectator until it disconnects
+
+    `room_id` is the room to watch, empty for the oldest running match.
+    Updates are queued by `spectate`; whatever the spectator sends is ignored.
+    """
+    global dropped
+    try:
+        room = rooms.watch(websocket, int(room_id) if room_id else None)
+    except ValueError:
+        room = None
+    if room is None:
+        await websocket.close(1008, "no such match")
+        return
+
+    LOG.info("%s watching room %s", websocket.id, room.id)
+    watched[room.id] = room
+    outboxes[websocket] = box = Outbox(
+        websocket, config.outbox_high_water, config.outbox_policy
+    )
+    box.start()
+    message = Message(
+        MessageType.READY,
+        {"player": None, **world(room), "state": room.state.keyframe()},
+    )
+    box.put(encode(codec_for(websocket.subprotocol), message))
+    MESSAGES_SENT.inc(MessageType.READY.name)
+    try:
+        async for _ in websocket:
+            pass
+    except ConnectionClosed:
+        pass
+    finally:
+        LOG.info("%s stopped watching room %s", websocket.id, room.id)
+        rooms.unwatch(websocket, room)
+        box.close()
+        del outboxes[websocket]
+        dropped += box.dropped
+
+
+def spectate():
+    """Send the spectators of every room the state changes they haven't seen
+
+    The spectators of a match which ended are disconnected.
+    """
+    for room in list(watched.values()):
+        sent, skipped = spectators.fan_out(room, encode, outboxes)
+        SPECTATOR_UPDATES.inc(amount=sent)
+        SPECTATOR_SKIPS.inc(amount=skipped)
+        if rooms.rooms.get(room.id) is not room:
+            # after the last update
+            for websocket in room.spectators:
+                asyncio.create_task(websocket.close(1000, "match over"))
+            room.spectators.clear()
+        if not room.spectators:
+            del watched[room.id]
+
+
+async def handler(websocket: WebSocketServerProtocol):
+    """Client connection handler
+
+    Clients asking to `watch` a match are spectators, see `watch`.
+    """
+    room_id = query(websocket).get("watch")
+    if room_id is not None:
+        await watch(websocket, room_id[0])
+        return
+
+    global dropped
+    codec = codec_for(websocket.subprotocol)
+    LOG.info("client connected: %s using %s", websocket.id, codec)
+    room = None
+    outboxes[websocket] = box = Outbox(
+        websocket, config.outbox_high_water, config.outbox_policy
+    )
+    box.start()
+
+    try:
+        room = resume(websocket)
+        if room is not None:
+            LOG.info("%s resumed in room %s", websocket.id, room.id)
+            ready(room, websocket)
+            schedule_expiry(room)
+        else:
+            room = await lobby.join(websocket)
+            if room is None:
+                LOG.info("client disconnected while waiting: %s", websocket.id)
+                return
+
+            LOG.info("room %s is full", room.id)
+
+            if not room.game.initialized:
+                start(room)
+                schedule_expiry(room)
 
         async for message in websocket:
-            LOG.info("message from %s: %s", websocket.id, message)
+            if log_messages():
+                LOG.info("message from %s: %s", websocket.id, message)
 
+            received = perf_counter()
             try:
-                msg = Message.deserialize(message)
-                response = process_message(msg, websocket.id)
+                msg = codec.decode(message)
             except ValueError as exc:
-                LOG.error(
-                    "failed to process message due to exception: %s %s",
-                    f"message: {message!s}",
-                    f"exception: {exc}",
-                )
-                response = Message(MessageType.ERROR, str(exc))
+                MESSAGE_ERRORS.inc()
+                if log_errors():
+                    LOG.error("failed to decode message: %s %s", message, exc)
+                broadcast(room, Message(MessageType.ERROR, str(exc)), [websocket])
+                continue
+            DECODE_SECONDS.observe(perf_counter() - received, codec.name)
+            MESSAGES_RECEIVED.inc(msg["type"].name)
 
-            # send the message to all connected clients
-            broadcast(response.serialize())
+            if ticker is not None and msg["type"] != MessageType.ACK:
+                # acknowledgements only record, everything else waits a tick
+                room.inputs.append((websocket.id, msg))
+                ticking[room.id] = room
+                continue
+
+            seq = room.state.seq
+            apply(room, msg, websocket.id)
+            play_bots(room)
+            if room.state.commit() != seq:
+                publish(room)
+            if msg["type"] != MessageType.ACK:
+                schedule_expiry(room)
 
     except ConnectionClosed:
         LOG.info("client disconnected: %s", websocket.id)
 
     finally:
-        connected_clients.remove(websocket)
-        game.deinit_player(websocket.id)
+        box.close()
+        del outboxes[websocket]
+        dropped += box.dropped
+        if box.dropped:
+            LOG.info("%s", box)
+        rooms.leave(websocket)
+        if room is not None:
+            departed(room, [websocket.id])
+
 
+def parse_args(argv: list[str] | None = None) -> ServerConfig:
+    """Parse the command line into a server config"""
+    parser = argparse.ArgumentParser(description="The Game server")
+    parser.add_argument("--host", default=ServerConfig.host)
+    parser.add_argument("--port", type=int, default=ServerConfig.port)
+    parser.add_argument(
+        "--width",
+        type=int,
+        default=ServerConfig.width,
+        help=f"world width in cells, at most {MAX_SPACES}",
+    )
+    parser.add_argument(
+        "--height",
+        type=int,
+        default=ServerConfig.height,
+        help=f"world height in cells, at most {MAX_SPACES}",
+    )
+    parser.add_argument(
+        "--outbox-high-water",
+        type=int,
+        default=ServerConfig.outbox_high_water,
+        help="queued messages per client before the overflow policy applies",
+    )
+    parser.add_argument(
+        "--outbox-policy",
+        type=OverflowPolicy,
+        choices=list(OverflowPolicy),
+        default=ServerConfig.outbox_policy,
+        help="what to do with a client whose queue is full",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus metrics at /metrics on this port",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        default=ServerConfig.metrics_host,
+        help="interface of the metrics endpoint",
+    )
+    parser.add_argument(
+        "--log-every",
+        type=int,
+        default=ServerConfig.log_every,
+        help="log every n-th incoming message, 0 for none",
+    )
+    parser.add_argument(
+        "--error-log-every",
+        type=int,
+        default=ServerConfig.error_log_every,
+        help="log every n-th message which failed to process, 0 for none",
+    )
+    parser.add_argument(
+        "--tick-rate",
+        type=float,
+        help="apply inputs and publish state this many times per second, "
+        "instead of as they arrive",
+    )
+    parser.add_argument(
+        "--players",
+        type=int,
+        default=ServerConfig.players,
+        help="players per match, hunters and prey alternately",
+    )
+    parser.add_argument(
+        "--turn-mode",
+        type=TurnMode,
+        choices=list(TurnMode),
+        default=ServerConfig.turn_mode,
+        help="whether players move one after the other or all at once",
+    )
+    parser.add_argument(
+        "--turn-timeout",
+        type=float,
+        help="seconds a player has to move before losing the turn",
+    )
+    parser.add_argument(
+        "--replay-dir",
+        help="record a replay of every match into this directory",
+    )
+    parser.add_argument(
+        "--snapshot-dir",
+        help="keep snapshots of the running matches in this directory and "
+        "resume them on startup",
+    )
+    parser.add_argument(
+        "--snapshot-interval",
+        type=float,
+        default=ServerConfig.snapshot_interval,
+        help="seconds between snapshots",
+    )
+    parser.add_argument(
+        "--resume-timeout",
+        type=float,
+        default=ServerConfig.resume_timeout,
+        help="seconds the players of a restored match have to reconnect",
+    )
+    parser.add_argument(
+        "--spectator-rate",
+        type=float,
+        default=ServerConfig.spectator_rate,
+        help="most state updates per second sent to spectators",
+    )
+    parser.add_argument(
+        "--interest-radius",
+        type=int,
+        help="only send clients the entities within this many cells of their "
+        "player",
+    )
+    parser.add_argument(
+        "--sight",
+        type=int,
+        help="players only see this many cells around them, and not past stones "
+        "and trees",
+    )
+    parser.add_argument(
+        "--bots",
+        type=int,
+        default=ServerConfig.bots,
+        help="seats of every match taken by computer players, fewer than "
+        "--players",
+    )
+    return ServerConfig(**vars(parser.parse_args(argv)))
 
-async def main():
-    """Server entrypoint"""
-    async with websockets.serve(handler, "", 8001):
-        await asyncio.Future()  # run forever
+
+async def main(
+    server_config: ServerConfig | None = None,
+    started: Callable[[WebSocketServer], None] | None = None,
+):
+    """Server entrypoint
+
+    `started` is called with the websocket server once it accepts connections.
+    """
+    global config, ticker
+    if server_config is not None:
+        config = server_config
+    rooms.width, rooms.height = config.width, config.height
+    if config.sight is not None:
+        # nothing farther is seen anyway
+        if config.interest_radius is None or config.interest_radius > config.sight:
+            config.interest_radius = config.sight
+    rooms.rules = Rules(config.players, config.turn_mode, config.turn_timeout)
+    if not 0 <= config.bots < config.players:
+        raise ValueError(f"bots must be fewer than the {config.players} players")
+    rooms.bots = config.bots
+    log_messages.every = config.log_every
+    log_errors.every = config.error_log_every
+    if config.replay_dir is not None:
+        Path(config.replay_dir).mkdir(parents=True, exist_ok=True)
+
+    endpoint = ticks = saving = snapshotter = None
+    if config.snapshot_dir is not None:
+        snapshotter = Snapshotter(config.snapshot_dir, rooms, config.snapshot_interval)
+        LOG.info("restored %d matches", snapshotter.load())
+        loop = asyncio.get_running_loop()
+        for room in list(rooms.rooms.values()):
+            loop.call_later(config.resume_timeout, abandon, room)
+        saving = asyncio.create_task(snapshotter.run())
+    if config.metrics_port is not None:
+        endpoint = await metrics.serve(config.metrics_host, config.metrics_port)
+    if config.tick_rate is not None:
+        ticker = Ticker(config.tick_rate, tick, on_tick)
+        ticks = asyncio.create_task(ticker.run())
+    fan_out = asyncio.create_task(Ticker(config.spectator_rate, spectate).run())
+    try:
+        async with websockets.serve(
+            handler, config.host, config.port, subprotocols=SUBPROTOCOLS
+        ) as ws_server:
+            if started is not None:
+                started(ws_server)
+            try:
+                await asyncio.Future()  # run forever
+            finally:
+                if saving is not None:
+                    # before the connections close, and their rooms with them
+                    saving.cancel()
+                    await snapshotter.save()
+                    snapshotter.close()
+    finally:
+        if endpoint is not None:
+            endpoint.close()
+        if ticks is not None:
+            ticks.cancel()
+        fan_out.cancel()
+        for room in list(rooms.rooms.values()):
+            room.close_replay()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
         pass
@@ -0,0 +1,368 @@
+"""Headless batched simulation
+
+A `Batch` holds many games of the same world size as stacked arrays: the
+walkable cells of every map, the positions of both players and the turn
+counters. `Batch.step` makes the current player of every game move at once,
+with the same rules as `Game.move_player`, using whole-array NumPy operations
+only. Nothing here imports pygame.
+
+Games are generated with `Game.initialize`, so a batch plays on the same maps
+as real matches, and are then only simulated on the arrays. A game ends when
+the hunter is next to the prey.
+
+`run` spreads batches over a process pool for balancing experiments and bot
+training::
+
+    python -m the_game.simulation --games 100000 --turns 200
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Callable, Sequence
+from uuid import UUID
+
+import numpy as np
+
+from .entities import EMPTY
+from .game_elements import Direction, Game, Layout
+from .turns import TurnMode
+
+# Directions by move code, the moves `Batch.step` takes
+DIRECTIONS = tuple(Direction)
+# (dx, dy) by move code
+STEPS = np.array([direction.delta for direction in DIRECTIONS], dtype=np.int32)
+# Index of each player in `Batch.positions`
+HUNTER, PREY = 0, 1
+# Games per batch of `run`
+BATCH_SIZE = 1_000
+
+# Picks a move code per game of a batch
+Policy = Callable[["Batch", np.random.Generator], np.ndarray]
+
+
+class Batch:
+    """Many games simulated in lockstep
+
+    `passable` is indexed `[game, y, x]` and is False on blocked map cells and
+    cells taken by objects. `positions` is indexed `[game, player, axis]`, with
+    the hunter first and x before y. As in `Game`, the hunter moves on even
+    turns and the prey on odd turns.
+    """
+
+    def __init__(self, passable: np.ndarray, positions: np.ndarray):
+        if passable.ndim != 3 or positions.shape != (len(passable), 2, 2):
+            raise ValueError("expected passable [game, y, x], positions [game, 2, 2]")
+        self.passable = passable
+        self.positions = positions.astype(np.int32)
+        self.turns = np.zeros(len(passable), dtype=np.int32)
+        self.caught = self.adjacent()
+        self._games = np.arange(len(passable))
+
+    def __len__(self):
+        return len(self.passable)
+
+    @property
+    def width(self) -> int:
+        """Width of the maps"""
+        return self.passable.shape[2]
+
+    @property
+    def height(self) -> int:
+        """Height of the maps"""
+        return self.passable.shape[1]
+
+    @property
+    def current(self) -> np.ndarray:
+        """Index of the player to move in every game"""
+        return self.turns % 2
+
+    @classmethod
+    def from_games(cls, games: Sequence[Game]) -> "Batch":
+        """Stack initialized two player, round-robin games of the same size"""
+        if len({(game.map.width, game.map.height) for game in games}) > 1:
+            raise ValueError("games of a batch must have the same size")
+        passable = []
+        positions = []
+        for game in games:
+            if not game.initialized or len(game.players) != 2:
+                raise ValueError("games must be initialized with two players")
+            if game.rules.turns != TurnMode.ROUND_ROBIN:
+                raise ValueError("games must take turns round-robin")
+            free = game.entities.occupancy == EMPTY
+            for player in game.players:
+                free[player.y, player.x] = True
+            passable.append(game.map.passable & free)
+            positions.append([(player.x, player.y) for player in game.players])
+        batch = cls(np.stack(passable), np.array(positions))
+        batch.turns[:] = [game.turns for game in games]
+        return batch
+
+    @classmethod
+    def generate(
+        cls,
+        n: int,
+        width: int,
+        height: int,
+        layout: Layout | None = None,
+        seed=None,
+    ) -> "Batch":
+        """Generate n new games
+
+        Pass `seed` for reproducible games.
+        """
+        rng = np.random.default_rng(seed)
+        games = []
+        for _ in range(n):
+            game = Game(width, height, layout)
+            game.init_player(UUID(int=HUNTER))
+            game.init_player(UUID(int=PREY))
+            game.initialize(int(rng.integers(2**31)))
+            games.append(game)
+        return cls.from_games(games)
+
+    def respawn(self, rng: np.random.Generator):
+        """Start every game over on its map
+
+        As in `Game.initialize`, the hunter is placed on a random free cell of
+        the left quarter of the map and the prey in the right quarter, or
+        anywhere if their quarter is full.
+        """
+        width = self.width
+        free = self.passable.copy()
+        for player, columns in (
+            (HUNTER, slice(0, max(width // 4, 1))),
+            (PREY, slice(3 * width // 4, width)),
+        ):
+            ys, xs = _pick(free[:, :, columns], rng)
+            xs += columns.start
+            full = ~free[:, :, columns].any(axis=(1, 2))
+            if full.any():
+                if not free[full].any(axis=(1, 2)).all():
+                    raise ValueError(
+                        f"no free cell left for the players on a {width}x{self.height} map"
+                    )
+                ys[full], xs[full] = _pick(free[full], rng)
+            self.positions[:, player, 0] = xs
+            self.positions[:, player, 1] = ys
+            free[self._games, ys, xs] = False
+        self.turns[:] = 0
+        self.caught = self.adjacent()
+
+    def adjacent(self) -> np.ndarray:
+        """Return the mask of games in which the hunter is next to the prey"""
+        offset = np.abs(self.positions[:, HUNTER] - self.positions[:, PREY])
+        return offset.sum(axis=1) == 1
+
+    def targets(self) -> np.ndarray:
+        """Return the cell every move leads the current player to
+
+        Indexed `[game, move, axis]`. Moves off the map stop at the edge.
+        """
+        position = self.positions[self._games, self.current]
+        targets = position[:, None, :] + STEPS
+        np.clip(targets[..., 0], 0, self.width - 1, out=targets[..., 0])
+        np.clip(targets[..., 1], 0, self.height - 1, out=targets[..., 1])
+        return targets
+
+    def free(self, targets: np.ndarray) -> np.ndarray:
+        """Return the mask of the targets the current player can step on"""
+        games = self._games[:, None]
+        other = self.positions[self._games, 1 - self.current][:, None, :]
+        return self.passable[games, targets[..., 1], targets[..., 0]] & (
+            (targets != other).any(axis=2)
+        )
+
+    def step(self, moves: np.ndarray) -> np.ndarray:
+        """Make the current player of every running game move
+
+        `moves` holds a move code per game, see `DIRECTIONS`. A player stays put
+        if the cell is blocked or taken by the other player; the turn passes
+        either way. Finished games are left alone. Returns the mask of the
+        games which ended with this step.
+        """
+        moves = np.asarray(moves)
+        running = ~self.caught
+        targets = self.targets()[self._games, moves][:, None, :]
+        moved = running & self.free(targets)[:, 0]
+        games = self._games[moved]
+        self.positions[games, self.current[moved]] = targets[moved, 0]
+        self.turns[running] += 1
+        ended = running & self.adjacent()
+        self.caught |= ended
+        return ended
+
+    def play(self, turns: int, policy: Policy, rng: np.random.Generator) -> int:
+        """Step every game until it ends or `turns` turns were played
+
+        Returns the number of turns played over all games.
+        """
+        start = self.turns.copy()
+        for _ in range(turns):
+            if self.caught.all():
+                break
+            self.step(policy(self, rng))
+        return int((self.turns - start).sum())
+
+
+def _pick(free: np.ndarray, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Return (ys, xs) of a random free cell of every game, which must have one"""
+    # the free cell with the highest random score of every game
+    score = rng.random(free.shape, dtype=np.float32)
+    score[~free] = -1
+    return np.divmod(score.reshape(len(free), -1).argmax(axis=1), free.shape[2])
+
+
+def random_policy(batch: Batch, rng: np.random.Generator) -> np.ndarray:
+    """Pick a random move per game"""
+    return rng.integers(len(STEPS), size=len(batch))
+
+
+def greedy_policy(batch: Batch, rng: np.random.Generator) -> np.ndarray:
+    """Step towards the prey as the hunter and away from the hunter as the prey
+
+    Only free cells are considered, by straight line distance, and ties are
+    broken at random.
+    """
+    targets = batch.targets()
+    current = batch.current
+    other = batch.positions[batch._games, 1 - current][:, None, :]
+    distance = np.abs(targets - other).sum(axis=2).astype(np.float32)
+    score = np.where((current == HUNTER)[:, None], -distance, distance)
+    score += rng.random(score.shape, dtype=np.float32) * 0.5
+    score[~batch.free(targets)] = -np.inf
+    return score.argmax(axis=1)
+
+
+POLICIES: dict[str, Policy] = {"random": random_policy, "greedy": greedy_policy}
+
+
+def simulate(
+    games: int,
+    turns: int,
+    width: int,
+    height: int,
+    policy: str = "greedy",
+    rounds: int = 1,
+    seed: np.random.SeedSequence | int | None = None,
+) -> dict:
+    """Generate and play one batch and return statistics
+
+    The batch plays `rounds` times on the same maps, with new spawns every
+    round, see `Batch.respawn`.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    start = perf_counter()
+    batch = Batch.generate(games, width, height, seed=seed.spawn(1)[0])
+    generated = perf_counter()
+    rng = np.random.default_rng(seed)
+    played = caught = 0
+    for round in range(rounds):
+        if round:
+            batch.respawn(rng)
+        played += batch.play(turns, POLICIES[policy], rng)
+        caught += int(batch.caught.sum())
+    return {
+        "games": games * rounds,
+        "turns": played,
+        "caught": caught,
+        "generate_seconds": generated - start,
+        "play_seconds": perf_counter() - generated,
+    }
+
+
+def run(
+    games: int,
+    turns: int,
+    width: int,
+    height: int,
+    policy: str = "greedy",
+    rounds: int = 1,
+    batch_size: int = BATCH_SIZE,
+    workers: int | None = None,
+    seed: int | None = None,
+) -> dict:
+    """Simulate games in batches spread over a process pool
+
+    Every batch is generated and played in a worker process, and only its
+    statistics are sent back. Generating the maps costs far more than playing
+    on them, so pass `rounds` to play each map several times. `workers`
+    defaults to the number of CPUs.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown policy {policy!r}")
+    sizes = [batch_size] * (games // batch_size)
+    if games % batch_size:
+        sizes.append(games % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    start = perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(
+            pool.map(
+                simulate,
+                sizes,
+                [turns] * len(sizes),
+                [width] * len(sizes),
+                [height] * len(sizes),
+                [policy] * len(sizes),
+                [rounds] * len(sizes),
+                seeds,
+            )
+        )
+    elapsed = perf_counter() - start
+
+    played = sum(result["turns"] for result in results)
+    play_seconds = sum(result["play_seconds"] for result in results)
+    return {
+        "games": sum(result["games"] for result in results),
+        "batches": len(sizes),
+        "workers": workers or os.cpu_count(),
+        "turns": played,
+        "caught": sum(result["caught"] for result in results),
+        "seconds": elapsed,
+        "turns_per_second": played / elapsed,
+        # throughput of the stepping alone, per worker
+        "step_turns_per_second": played / play_seconds if play_seconds else 0.0,
+        "generate_seconds": sum(result["generate_seconds"] for result in results),
+    }
+
+
+def main(argv: list[str] | None = None):
+    """Simulation entrypoint"""
+    parser = argparse.ArgumentParser(description="Simulate games headlessly")
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=200, help="turns per game")
+    parser.add_argument("--width", type=int, default=64)
+    parser.add_argument("--height", type=int, default=64)
+    parser.add_argument("--policy", choices=POLICIES, default="greedy")
+    parser.add_argument(
+        "--rounds", type=int, default=1, help="games played per generated map"
+    )
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, help="default: number of CPUs")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    stats = run(
+        args.games,
+        args.turns,
+        args.width,
+        args.height,
+        args.policy,
+        args.rounds,
+        args.batch_size,
+        args.workers,
+        args.seed,
+    )
+    for key, value in stats.items():
+        print(
+            f"{key:>21}: {value:.2f}"
+            if isinstance(value, float)
+            else f"{key:>21}: {value}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Room snapshots
+
+A `Snapshotter` keeps a snapshot of every running match on disk, so the
+matches survive a server restart. Every `interval` seconds, the state of the
+rooms whose game changed since the last save is copied on the event loop, see
+`Game.capture`, `BATCH` rooms at a time so other tasks get to run in between.
+Encoding, joining, compressing and writing happens on a worker thread.
+
+Snapshots are appended to a journal: one record per changed room, and a
+tombstone for every room which closed, all in a single write per save. The
+last record of a room wins. Once the journal is mostly outdated records, it is
+rewritten with only the latest ones, which the worker keeps in memory.
+
+On startup, `load` reads the journal back. The players of a restored match
+reconnect with the id they had, see `RoomManager.resume`.
+"""
+import asyncio
+import logging
+import os
+import struct
+import zlib
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+
+from .game_elements import Game, GameSnapshot
+from .rooms import RoomManager
+
+LOG = logging.getLogger(__name__)
+
+MAGIC = b"ELVS"
+VERSION = 1
+# magic, version
+HEADER = struct.Struct("!4sB")
+# room id, compressed snapshot length, 0 for a room which closed
+RECORD = struct.Struct("!II")
+JOURNAL = "rooms.journal"
+# Seconds between snapshots
+INTERVAL = 5.0
+# The journal is rewritten once it is this many times the size of the latest
+# records, and at least COMPACT_BYTES long
+COMPACT_RATIO = 4
+COMPACT_BYTES = 1 << 20
+# Rooms captured between yields to the event loop
+BATCH = 256
+
+
+class Journal:
+    """Append-only file of room snapshots
+
+    Not thread-safe: use it from one thread at a time.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        # latest compressed snapshot of every room
+        self.records: dict[int, bytes] = {}
+        self.size = 0
+        self._file = None
+
+    def read(self) -> dict[int, bytes]:
+        """Read the latest snapshot of every room, uncompressed
+
+        A truncated last record, e.g. of a crashed server, is ignored. So is
+        everything from the first record which doesn't decompress on.
+        """
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            return {}
+        if data[:HEADER.size] != HEADER.pack(MAGIC, VERSION):
+            raise ValueError(f"{self.path} is not a version {VERSION} journal")
+        snapshots = {}
+        offset = HEADER.size
+        while offset + RECORD.size <= len(data):
+            room_id, length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            if offset + length > len(data):
+                break
+            if length:
+                record = data[offset:offset + length]
+                try:
+                    snapshots[room_id] = zlib.decompress(record)
+                except zlib.error as exc:
+                    LOG.error("%s is corrupt at byte %d, ignoring the rest: %s", self.path, offset, exc)
+                    break
+                self.records[room_id] = record
+            else:
+                self.records.pop(room_id, None)
+                snapshots.pop(room_id, None)
+            offset += length
+        return snapshots
+
+    def append(self, snapshots: dict[int, bytes | None]):
+        """Record the snapshots of rooms, None for rooms which closed"""
+        chunks = []
+        for room_id, data in snapshots.items():
+            if data is None:
+                if self.records.pop(room_id, None) is not None:
+                    chunks.append(RECORD.pack(room_id, 0))
+                continue
+            record = self.records[room_id] = zlib.compress(data, 1)
+            chunks += (RECORD.pack(room_id, len(record)), record)
+        live = sum(map(len, self.records.values())) + RECORD.size * len(self.records)
+        if self._file is None or self.size > max(COMPACT_RATIO * live, COMPACT_BYTES):
+            self.compact()
+        elif chunks:
+            data = b"".join(chunks)
+            self._file.write(data)
+            self._file.flush()
+            self.size += len(data)
+
+    def compact(self):
+        """Rewrite the journal with the latest snapshot of every room"""
+        if self._file is not None:
+            self._file.close()
+        chunks = [HEADER.pack(MAGIC, VERSION)]
+        for room_id, record in self.records.items():
+            chunks += (RECORD.pack(room_id, len(record)), record)
+        data = b"".join(chunks)
+        temporary = self.path.with_suffix(".tmp")
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, self.path)
+        self._file = open(self.path, "ab")
+        self.size = len(data)
+
+    def close(self):
+        """Close the file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Snapshotter:
+    """Write snapshots of the running matches of `rooms` into a directory
+
+    Run `run` as a task and cancel it to stop; `save` once more on shutdown.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        rooms: RoomManager,
+        interval: float = INTERVAL,
+        executor: Executor | None = None,
+    ):
+        self.directory = Path(directory)
+        self.rooms = rooms
+        self.interval = interval
+        # one worker, so journal writes happen in order
+        self.executor = executor or ThreadPoolExecutor(
+            1, thread_name_prefix="snapshots"
+        )
+        self.journal = Journal(self.directory / JOURNAL)
+        # game version of every room in the journal
+        self.saved: dict[int, int] = {}
+
+    def load(self) -> int:
+        """Restore the rooms of the journal
+
+        Snapshots which can't be restored are logged and skipped. Returns the
+        number of rooms restored.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for room_id, data in self.journal.read().items():
+            try:
+                game = Game.restore(data)
+            except (ValueError, KeyError, struct.error) as exc:
+                LOG.error("failed to restore room %s: %s", room_id, exc)
+                continue
+            if game.initialized and game.players:
+                self.rooms.restore(room_id, game)
+                self.saved[room_id] = game.version
+        # drop whatever wasn't restored
+        for room_id in self.journal.records.keys() - self.saved.keys():
+            del self.journal.records[room_id]
+        self.journal.compact()
+        return len(self.saved)
+
+    async def run(self):
+        """Save every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except OSError as exc:
+                LOG.error("failed to save snapshots: %s", exc)
+
+    async def save(self) -> int:
+        """Save the rooms which changed and drop those which closed
+
+        Returns the number of rooms saved.
+        """
+        snapshots: dict[int, GameSnapshot | None] = {}
+        versions = {}
+        rooms = list(self.rooms.rooms.values())
+        for start in range(0, len(rooms), BATCH):
+            if start:
+                await asyncio.sleep(0)
+            for room in rooms[start:start + BATCH]:
+                game = room.game
+                if game.initialized and self.saved.get(room.id) != game.version:
+                    snapshots[room.id] = game.capture()
+                    versions[room.id] = game.version
+        for room_id in self.saved:
+            room = self.rooms.rooms.get(room_id)
+            if room is None or not room.game.initialized:
+                snapshots[room_id] = None
+        if not snapshots:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._write, snapshots)
+        for room_id, data in snapshots.items():
+            if data is None:
+                del self.saved[room_id]
+            else:
+                self.saved[room_id] = versions[room_id]
+        return len(versions)
+
+    def _write(self, snapshots: dict[int, GameSnapshot | None]):
+        """Pack the snapshots and append them to the journal, on the worker"""
+        self.journal.append(
+            {room_id: None if snapshot is None else snapshot.pack() for room_id, snapshot in snapshots.items()}
+        )
+
+    def close(self):
+        """Close the journal and shut the worker down"""
+        self.executor.shutdown()
+        self.journal.close()
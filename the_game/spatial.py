@@ -0,0 +1,67 @@
+"""Spatial hashing
+
+A `SpatialHash` buckets ids by position on a grid of square buckets, so the
+ids near a point are found by looking at a few buckets instead of at every
+position. Buckets entirely within the area searched are taken as they are,
+only the ids of those on its edges are checked one by one.
+"""
+
+# Default bucket size, in cells
+BUCKET = 8
+
+
+class SpatialHash:
+    """Ids bucketed by their (x, y) position"""
+
+    def __init__(self, size: int = BUCKET):
+        self.size = size
+        self.positions: dict[int, tuple[int, int]] = {}
+        self.buckets: dict[tuple[int, int], set[int]] = {}
+
+    def add(self, key: int, x: int, y: int):
+        """Add an id at a position, or move it there"""
+        old = self.positions.get(key)
+        cell = (x // self.size, y // self.size)
+        self.positions[key] = (x, y)
+        if old is not None:
+            old_cell = (old[0] // self.size, old[1] // self.size)
+            if old_cell == cell:
+                return
+            self._unbucket(key, old_cell)
+        bucket = self.buckets.get(cell)
+        if bucket is None:
+            bucket = self.buckets[cell] = set()
+        bucket.add(key)
+
+    def discard(self, key: int):
+        """Remove an id, if it is there"""
+        old = self.positions.pop(key, None)
+        if old is not None:
+            self._unbucket(key, (old[0] // self.size, old[1] // self.size))
+
+    def _unbucket(self, key: int, cell: tuple[int, int]):
+        bucket = self.buckets[cell]
+        bucket.discard(key)
+        if not bucket:
+            del self.buckets[cell]
+
+    def near(self, x: int, y: int, radius: int) -> set[int]:
+        """Return the ids at most `radius` cells away from a point on each axis"""
+        size = self.size
+        left, right, top, bottom = x - radius, x + radius, y - radius, y + radius
+        found: set[int] = set()
+        for bx in range(left // size, right // size + 1):
+            x_inside = bx * size >= left and (bx + 1) * size - 1 <= right
+            for by in range(top // size, bottom // size + 1):
+                bucket = self.buckets.get((bx, by))
+                if not bucket:
+                    continue
+                if x_inside and by * size >= top and (by + 1) * size - 1 <= bottom:
+                    found |= bucket
+                    continue
+                positions = self.positions
+                for key in bucket:
+                    kx, ky = positions[key]
+                    if left <= kx <= right and top <= ky <= bottom:
+                        found.add(key)
+        return found
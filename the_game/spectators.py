@@ -0,0 +1,64 @@
+"""Spectators
+
+A spectator watches a running match without playing: it isn't a player of
+the game and nothing it sends is processed. A match may have thousands, so
+they are served differently from the players:
+
+- Updates go out at most `rate` times per second, on a ticker of their own,
+  rather than after every move.
+- An update is encoded once per codec and starting sequence number and shared
+  by every spectator of the match. When all spectators kept up, that is one
+  encoding per codec per tick.
+- At most one update per spectator is queued, in its `Outbox`. A spectator
+  whose outbox is still sending an earlier update is skipped. On the first
+  tick it has caught up, it gets one delta from the last state it was sent to
+  the latest, see `WorldState.delta`, so a slow spectator drops states instead
+  of falling further behind, and its outbox never overflows.
+
+Updates are sent through the outboxes with `WebSocketServerProtocol.send`, so
+the fan-out never blocks. Only the encoded payload is shared: every connection
+frames it on its own.
+"""
+from typing import Callable, Hashable, Mapping
+
+from websockets.typing import Data
+
+from .codec import Codec, codec_for
+from .messaging import Message, MessageType
+from .outbox import Outbox
+from .rooms import Room
+
+# Default updates per second
+RATE = 10.0
+
+
+def fan_out(
+    room: Room,
+    encode: Callable[[Codec, Message], Data],
+    outboxes: Mapping[Hashable, Outbox],
+) -> tuple[int, int]:
+    """Queue for the spectators of a room the state changes they haven't seen
+
+    `outboxes` has the outbox of every spectator. Returns the number of
+    spectators sent an update and of those skipped.
+    """
+    seq = room.state.seq
+    updates: dict[tuple[Codec, int], Data] = {}
+    sent = skipped = 0
+    for websocket, since in room.spectators.items():
+        if since == seq:
+            continue
+        box = outboxes[websocket]
+        if box.depth or box.closed:
+            skipped += 1
+            continue
+        codec = codec_for(websocket.subprotocol)
+        key = (codec, since)
+        update = updates.get(key)
+        if update is None:
+            message = Message(MessageType.MOVE, room.state.delta(since))
+            update = updates[key] = encode(codec, message)
+        box.put(update, state=True)
+        room.spectators[websocket] = seq
+        sent += 1
+    return sent, skipped
@@ -0,0 +1,140 @@
+"""Versioned world state
+
+The server keeps one `WorldState` per match. Every committed change bumps the
+sequence number and is remembered in a short change log, so each client can be
+sent only the entities which changed since the last sequence number it
+acknowledged. A full keyframe is sent when a client is too far behind, has
+never acknowledged anything, or periodically for recovery.
+
+A state payload looks like this::
+
+    {
+        "seq": 12,          # sequence number after applying the payload
+        "base": 10,         # sequence number the delta applies to, None for keyframes
+        "entities": [[id, type, x, y], ...],
+        "removed": [id, ...],
+    }
+
+Entity ids are small integers assigned by the world state, and types are
+`ObjectType` values.
+
+The entities near a position are found with a spatial hash, which is only
+built and kept up to date once asked for, see `near`.
+"""
+from collections import deque
+from itertools import count
+from typing import Hashable
+
+from .game_elements import Game, Object
+from .spatial import SpatialHash
+
+# Number of sequence numbers kept in the change log. Every KEYFRAME_INTERVAL-th
+# sequence number is sent as a full keyframe.
+KEYFRAME_INTERVAL = 64
+
+
+class WorldState:
+    """Sequence numbered positions of every entity in a game"""
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.entities: dict[int, tuple[int, int, int]] = {}
+        self._ids: dict[Hashable, int] = {}
+        self._next_id = count()
+        self._pending: set[int] = set()
+        # (seq, changed ids) for the last `keyframe_interval` commits
+        self._log: deque[tuple[int, frozenset[int]]] = deque(maxlen=keyframe_interval)
+        self._grid: SpatialHash | None = None
+
+    def entity_id(self, key: Hashable) -> int:
+        """Return the compact id of an object id, assigning one if needed"""
+        entity_id = self._ids.get(key)
+        if entity_id is None:
+            entity_id = self._ids[key] = next(self._next_id)
+        return entity_id
+
+    def track(self, obj: Object):
+        """Record the current type and position of a game object"""
+        entity_id = self.entity_id(obj.id)
+        entity = (int(obj.type), obj.x, obj.y)
+        if self.entities.get(entity_id) != entity:
+            self.entities[entity_id] = entity
+            self._pending.add(entity_id)
+            if self._grid is not None:
+                self._grid.add(entity_id, obj.x, obj.y)
+
+    def remove(self, key: Hashable):
+        """Forget a game object"""
+        entity_id = self._ids.pop(key, None)
+        if entity_id is not None and self.entities.pop(entity_id, None) is not None:
+            self._pending.add(entity_id)
+            if self._grid is not None:
+                self._grid.discard(entity_id)
+
+    def load(self, game: Game) -> int:
+        """Track every player and object of a game and commit"""
+        for obj in (*game.players, *game.objects):
+            self.track(obj)
+        return self.commit()
+
+    def commit(self) -> int:
+        """Close the current sequence number if anything changed"""
+        if self._pending:
+            self.seq += 1
+            self._log.append((self.seq, frozenset(self._pending)))
+            self._pending = set()
+        return self.seq
+
+    def keyframe(self) -> dict:
+        """Return a payload with every entity"""
+        return {
+            "seq": self.seq,
+            "base": None,
+            "entities": [[entity_id, *entity] for entity_id, entity in self.entities.items()],
+            "removed": [],
+        }
+
+    def near(self, x: int, y: int, radius: int) -> set[int]:
+        """Return the ids of the entities at most `radius` cells away on each axis"""
+        if self._grid is None:
+            self._grid = SpatialHash()
+            for entity_id, (_, ex, ey) in self.entities.items():
+                self._grid.add(entity_id, ex, ey)
+        return self._grid.near(x, y, radius)
+
+    def changes(self, since: int | None) -> set[int] | None:
+        """Return the ids of the entities changed after sequence `since`
+
+        Returns None when a keyframe is due instead: `since` is None, older
+        than the change log, or the current sequence number is due for one.
+        """
+        oldest = self._log[0][0] if self._log else self.seq + 1
+        if since is None or since < oldest - 1 or self.seq % self.keyframe_interval == 0:
+            return None
+
+        changed = set()
+        for seq, ids in reversed(self._log):
+            if seq <= since:
+                break
+            changed |= ids
+        return changed
+
+    def delta(self, since: int | None) -> dict:
+        """Return a payload with the entities changed after sequence `since`
+
+        Falls back to a keyframe when one is due, see `changes`.
+        """
+        changed = self.changes(since)
+        if changed is None:
+            return self.keyframe()
+
+        entities = []
+        removed = []
+        for entity_id in changed:
+            entity = self.entities.get(entity_id)
+            if entity is None:
+                removed.append(entity_id)
+            else:
+                entities.append([entity_id, *entity])
+        return {"seq": self.seq, "base": since, "entities": entities, "removed": removed}
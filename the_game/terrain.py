@@ -0,0 +1,195 @@
+"""Procedural terrain
+
+A map is generated from a handful of parameters, seed included, using
+whole-array NumPy operations only:
+
+1. Octaves of value noise decide where obstacles go: the highest `obstacles`
+   fraction of the noise becomes obstacle cells.
+2. A few rounds of cellular-automaton smoothing turn the speckle into clumps.
+3. A meandering corridor is carved from the left to the right edge, and every
+   open cell not connected to it is filled, so any two open cells, the player
+   spawns included, are connected.
+
+A second noise field splits the obstacles into stones and trees and picks the
+floor variant of the open cells.
+
+The same parameters always produce the same terrain, so the server only sends
+`TerrainParams` and clients regenerate the map locally.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+# Number of floor variants, see `Terrain.floor`
+FLOOR_VARIANTS = 3
+
+
+@dataclass(frozen=True)
+class TerrainParams:
+    """Parameters of a generated map"""
+
+    seed: int = 0
+    # fraction of the cells seeded with obstacles before smoothing
+    obstacles: float = 0.2
+    # size in cells of the coarsest noise features
+    scale: int = 8
+    octaves: int = 3
+    # rounds of cellular-automaton smoothing
+    smoothing: int = 2
+    # fraction of the obstacles which are trees, the rest are stones
+    trees: float = 0.5
+
+    def to_dict(self) -> dict:
+        """Return the parameters as a message payload"""
+        # flat, so the deep copy of `asdict` isn't needed
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TerrainParams":
+        """Return the parameters in a message payload"""
+        return cls(**data)
+
+
+@dataclass
+class Terrain:
+    """A generated map, indexed `[y, x]`"""
+
+    # cells which can't be walked through
+    obstacles: np.ndarray
+    # the obstacles which are trees
+    trees: np.ndarray
+    # floor variant of every cell, 0 <= variant < FLOOR_VARIANTS
+    floor: np.ndarray
+
+
+def value_noise(
+    shape: tuple[int, int], scale: int, octaves: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Return smooth noise in [0, 1) of shape (height, width)
+
+    Every octave interpolates random values on a lattice with a spacing of
+    `scale` cells, halved per octave.
+    """
+    height, width = shape
+    noise = np.zeros(shape, dtype=np.float32)
+    amplitude, total = 1.0, 0.0
+    for octave in range(octaves):
+        spacing = max(scale >> octave, 1)
+        lattice = amplitude * rng.random(
+            (-(-height // spacing) + 1, -(-width // spacing) + 1), dtype=np.float32
+        )
+        t = _fade(spacing)
+        # interpolate along the lattice rows, then between them; every lattice
+        # cell covers a block of spacing x spacing cells
+        rows = lattice[:, :-1, None] + np.diff(lattice, axis=1)[:, :, None] * t
+        rows = rows.reshape(len(lattice), -1)[:, :width]
+        layer = rows[:-1, None, :] + np.diff(rows, axis=0)[:, None, :] * t[:, None]
+        noise += layer.reshape(-1, width)[:height]
+        total += amplitude
+        amplitude /= 2
+    return noise / total
+
+
+def _fade(spacing: int) -> np.ndarray:
+    """Return the smoothed offsets of the cells between two lattice points"""
+    t = np.arange(spacing, dtype=np.float32) / spacing
+    return t * t * (3 - 2 * t)
+
+
+def smooth(obstacles: np.ndarray, rounds: int) -> np.ndarray:
+    """Apply cellular-automaton smoothing
+
+    A cell becomes an obstacle with 5 or more obstacle neighbours and opens up
+    with 3 or fewer. Cells outside the map count as open.
+    """
+    height, width = obstacles.shape
+    for _ in range(rounds):
+        padded = np.pad(obstacles, 1).view(np.uint8)
+        neighbours = np.zeros(obstacles.shape, dtype=np.uint8)
+        for dy in range(3):
+            for dx in range(3):
+                if dy != 1 or dx != 1:
+                    neighbours += padded[slice(dy, dy + height), slice(dx, dx + width)]
+        obstacles = (neighbours >= 5) | (obstacles & (neighbours >= 4))
+    return obstacles
+
+
+def regions(passable: np.ndarray) -> np.ndarray:
+    """Label the 4-connected regions of passable cells
+
+    Returns a label per cell, indexed `[y, x]`; blocked cells are -1. The
+    regions are found on runs of passable cells within each row, which are
+    merged with the overlapping runs in the next row.
+    """
+    height, width = passable.shape
+    # pad every row with a blocked cell so runs can't wrap into the next row
+    stride = width + 1
+    flat = np.zeros(height * stride + 1, dtype=np.int8)
+    flat[1:].reshape(height, stride)[:, :width] = passable
+    edges = np.diff(flat)
+    # run i covers cells [starts[i], ends[i]) of the padded, flattened grid
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not starts.size:
+        return np.full(passable.shape, -1, dtype=np.int32)
+
+    # the runs of the next row overlapping run i are [first[i], last[i])
+    first = np.searchsorted(ends, starts + stride, side="right")
+    last = np.searchsorted(starts, ends + stride, side="left")
+    counts = np.maximum(last - first, 0)
+    a = np.repeat(np.arange(starts.size), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    b = np.repeat(first, counts) + offsets
+
+    # merge connected runs: hook roots onto the smallest neighbouring root,
+    # then compress the paths, until nothing changes
+    root = np.arange(starts.size, dtype=np.int32)
+    while True:
+        lowest = np.minimum(root[a], root[b])
+        hooked = root.copy()
+        np.minimum.at(hooked, root[a], lowest)
+        np.minimum.at(hooked, root[b], lowest)
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, root):
+            break
+        root = hooked
+
+    # passable cells are numbered in the same order as the runs
+    labels = np.full(passable.shape, -1, dtype=np.int32)
+    labels[passable] = np.repeat(root, ends - starts)
+    return labels
+
+
+def corridor(width: int, height: int, rng: np.random.Generator) -> tuple:
+    """Return the (xs, ys) of a 4-connected path from the left to the right edge"""
+    steps = rng.integers(-1, 2, width)
+    ys = np.clip(height // 2 + np.cumsum(steps), 0, height - 1)
+    xs = np.arange(width)
+    # the cells below/above each step keep the path 4-connected
+    return np.concatenate([xs, xs[1:]]), np.concatenate([ys, ys[:-1]])
+
+
+def generate(width: int, height: int, params: TerrainParams) -> Terrain:
+    """Generate the terrain of a width x height map"""
+    rng = np.random.default_rng(params.seed)
+    shape = (height, width)
+    noise = value_noise(shape, params.scale, params.octaves, rng)
+    detail = value_noise(shape, max(params.scale // 2, 1), 1, rng)
+
+    # a subsample is plenty to estimate the threshold
+    sample = noise[::4, ::4]
+    obstacles = noise >= np.quantile(sample, 1 - params.obstacles)
+    obstacles = smooth(obstacles, params.smoothing)
+
+    xs, ys = corridor(width, height, rng)
+    obstacles[ys, xs] = False
+    labels = regions(~obstacles)
+    obstacles |= labels != labels[ys[0], xs[0]]
+
+    trees = obstacles & (detail < params.trees)
+    floor = np.minimum(detail * FLOOR_VARIANTS, FLOOR_VARIANTS - 1).astype(np.uint8)
+    return Terrain(obstacles, trees, floor)
@@ -0,0 +1,62 @@
+"""Fixed-rate ticks
+
+A `Ticker` calls a function at a fixed rate from the event loop. Deadlines lie
+on a fixed grid, so a tick which starts a little late doesn't shift the ones
+after it. A tick which runs past the next deadline is an overrun: the
+deadlines it missed are skipped rather than caught up with back-to-back ticks.
+"""
+import asyncio
+from typing import Callable
+
+
+class Ticker:
+    """Call `callback` `rate` times per second
+
+    Run `run` as a task and cancel it to stop. `on_tick` is called after every
+    tick with its lateness, the seconds it started after its deadline, and its
+    duration.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        callback: Callable[[], None],
+        on_tick: Callable[[float, float], None] | None = None,
+    ):
+        if rate <= 0:
+            raise ValueError("tick rate must be positive")
+        self.period = 1 / rate
+        self.callback = callback
+        self.on_tick = on_tick
+        self.ticks = 0
+        self.overruns = 0
+        # deadlines missed because of overruns
+        self.skipped = 0
+
+    async def run(self):
+        """Tick until cancelled"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.period
+        while True:
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            start = loop.time()
+            self.callback()
+            end = loop.time()
+            self.ticks += 1
+            if self.on_tick is not None:
+                self.on_tick(start - deadline, end - start)
+
+            deadline += self.period
+            if end > deadline:
+                self.overruns += 1
+                missed = int((end - deadline) // self.period) + 1
+                self.skipped += missed
+                deadline += missed * self.period
+
+    def __str__(self):
+        return (
+            f"{self.__class__.__name__} {1 / self.period:g} Hz ticks:{self.ticks} "
+            f"overruns:{self.overruns} skipped:{self.skipped}"
+        )
@@ -1,43 +1,169 @@
+import hashlib
+import logging
+import os
+import struct
+from collections import OrderedDict
 from itertools import cycle
+from pathlib import Path
 
 import numpy as np
 import pygame
 
+LOG = logging.getLogger(__name__)
+
+# Scaled tileset atlases are cached here, see `Tileset.cache_dir`
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"), "the_game")
+
 
 class Tileset:
-    """A tileset"""
+    """A tileset
+
+    The tileset image is only read when the tiles are first needed. The tiles
+    are subsurfaces of a single atlas surface, so they share its pixels. A
+    rescaled atlas is cached in `cache_dir`, keyed by the image's hash and the
+    scale, so later runs skip the rescaling.
+    """
 
-    def __init__(self, file, size=(16, 16), margin=1, spacing=1, offset=(0, 0)):
+    # width, height of a cached atlas
+    CACHE_HEADER = struct.Struct("!II")
+
+    def __init__(
+        self,
+        file,
+        size=(16, 16),
+        margin=1,
+        spacing=1,
+        offset=(0, 0),
+        cache_dir: Path | None = CACHE_DIR,
+    ):
         self.file = file
         self.size = size
         self.margin = margin
         self.spacing = spacing
         self.offset = (0, 0)
-        self.image = pygame.image.load(file)
-        self.scaled_image = self.image
-        self.rect = self.scaled_image.get_rect()
-        self.tiles = []
-        self.load()
+        self.scale = 1
+        self.cache_dir = cache_dir
+        self._image: pygame.Surface | None = None
+        self._digest: str | None = None
+        self._atlas: pygame.Surface | None = None
+        self._tiles: list[pygame.Surface] | None = None
+
+    @property
+    def image(self) -> pygame.Surface:
+        """The tileset image at its original scale"""
+        if self._image is None:
+            self._image = pygame.image.load(self.file)
+        return self._image
+
+    @property
+    def scaled_image(self) -> pygame.Surface:
+        """The tileset image at the current scale
+
+        Not cached, only the padded atlas built from it is, see `load`.
+        """
+        if self.scale == 1:
+            return self.image
+        return pygame.transform.rotozoom(self.image, 0, self.scale)
+
+    @property
+    def rect(self) -> pygame.Rect:
+        """The rect of the tileset atlas"""
+        return self.atlas.get_rect()
+
+    @property
+    def atlas(self) -> pygame.Surface:
+        """The surface all tiles are cut from"""
+        if self._atlas is None:
+            self.load()
+        return self._atlas
+
+    @property
+    def tiles(self) -> list[pygame.Surface]:
+        """The tiles, ordered by column"""
+        if self._tiles is None:
+            self.load()
+        return self._tiles
 
     def load(self):
         """Load the tileset"""
-        self.tiles = []
+        atlas = self._load_cached()
+        if atlas is None:
+            atlas = self._build_atlas()
+            self._save_cached(atlas)
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert()
+
+        xs, ys = self._tile_origins(atlas.get_size())
+        self._atlas = atlas
+        self._tiles = [atlas.subsurface((x, y, *self.size)) for x in xs for y in ys]
+
+    def _tile_origins(self, image_size) -> tuple[range, range]:
+        w, h = image_size
         x0 = y0 = self.margin
-        w, h = self.rect.size
         dx = self.size[0] + self.spacing + self.offset[0]
         dy = self.size[1] + self.spacing + self.offset[1]
+        return range(x0, w, dx), range(y0, h, dy)
 
-        for x in range(x0, w, dx):
-            for y in range(y0, h, dy):
-                tile = pygame.Surface(self.size)
-                tile.blit(self.scaled_image, (0, 0), (x, y, *self.size))
-                self.tiles.append(tile)
+    def _build_atlas(self) -> pygame.Surface:
+        image = self.scaled_image
+        w, h = image.get_size()
+        xs, ys = self._tile_origins((w, h))
+        # Tiles along the right and bottom edges may stick out of the image.
+        # Make the atlas big enough to hold them whole; like the rest of the
+        # atlas, the padding is opaque black.
+        atlas = pygame.Surface(
+            (
+                max(w, xs[-1] + self.size[0] if xs else 0),
+                max(h, ys[-1] + self.size[1] if ys else 0),
+            )
+        )
+        atlas.blit(image, (0, 0))
+        return atlas
 
     def rescale(self, scale):
         """Rescaled the tileset"""
-        self.scaled_image = pygame.transform.rotozoom(self.image, 0, scale)
-        self.rect = self.scaled_image.get_rect()
-        self.load()
+        self.scale = scale
+        self._atlas = self._tiles = None
+
+    def cache_path(self) -> Path | None:
+        """Return the cache file of the atlas at the current scale"""
+        if self.cache_dir is None:
+            return None
+        if self._digest is None:
+            data = Path(self.file).read_bytes()
+            self._digest = hashlib.sha256(data).hexdigest()[:16]
+        geometry = f"{self.size[0]}x{self.size[1]}-{self.margin}-{self.spacing}"
+        name = f"{Path(self.file).stem}-{self._digest}-{self.scale!r}-{geometry}.rgb"
+        return Path(self.cache_dir, name)
+
+    def _load_cached(self) -> pygame.Surface | None:
+        path = self.cache_path()
+        if path is None or not path.exists():
+            return None
+        try:
+            data = path.read_bytes()
+            size = self.CACHE_HEADER.unpack_from(data)
+            header_size = self.CACHE_HEADER.size
+            pixels = memoryview(data)[header_size:]
+            return pygame.image.frombuffer(pixels, size, "RGB")
+        except (OSError, ValueError, struct.error) as exc:
+            LOG.warning("ignoring unreadable tileset cache %s: %s", path, exc)
+            return None
+
+    def _save_cached(self, atlas: pygame.Surface):
+        path = self.cache_path()
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(
+                self.CACHE_HEADER.pack(*atlas.get_size())
+                + pygame.image.tobytes(atlas, "RGB")
+            )
+            tmp.replace(path)
+        except OSError as exc:
+            LOG.warning("could not cache tileset in %s: %s", path, exc)
 
     def __str__(self):
         return f"{self.__class__.__name__} file:{self.file} tile:{self.size}"
@@ -52,7 +178,8 @@ class Tilemap:
         self.map = np.zeros(size, dtype=int)
         self.tile_size = tile_size
 
-        self.image = pygame.Surface(tuple(map(lambda x: x * tile_size, size)))
+        # size is (rows, columns)
+        self.image = pygame.Surface((size[1] * tile_size, size[0] * tile_size))
         if rect:
             self.rect = pygame.Rect(rect)
         else:
@@ -84,3 +211,154 @@ class Tilemap:
 
     def __str__(self):
         return f"{self.__class__.__name__} {self.size}"
+
+
+# Cells along each side of a `ChunkedTilemap` chunk
+CHUNK_SIZE = 16
+# Rendered chunk surfaces kept by a `ChunkedTilemap`
+MAX_CHUNKS = 16
+
+
+class ChunkedTilemap:
+    """A tilemap for large worlds
+
+    Tile indices are stored in one compact array, `uint8` when the tileset
+    allows it. The map is rendered in square chunks of `chunk_size` cells, and
+    only the chunks intersecting the drawn view are rendered. The most recently
+    used `max_chunks` chunk surfaces are kept; the rest are evicted.
+
+    Positions and views are in world pixels, i.e. cell index * tile size.
+    """
+
+    def __init__(
+        self,
+        tileset,
+        size=(10, 20),
+        tile_size=16,
+        chunk_size=CHUNK_SIZE,
+        max_chunks=MAX_CHUNKS,
+    ):
+        self.size = size
+        self.tileset = tileset
+        self.tile_size = tile_size
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.rendered = 0
+        self.evicted = 0
+        self._map = np.zeros(size, dtype=np.uint8)
+        self._chunks: OrderedDict[tuple[int, int], pygame.Surface] = OrderedDict()
+        # size is (rows, columns)
+        self.rect = pygame.Rect(0, 0, size[1] * tile_size, size[0] * tile_size)
+
+    @property
+    def map(self) -> np.ndarray:
+        """Tile indices indexed `[row, column]`, read-only"""
+        return self._map
+
+    @map.setter
+    def map(self, tiles: np.ndarray):
+        if tiles.shape != self.size:
+            raise ValueError(f"expected a map of shape {self.size}, got {tiles.shape}")
+        dtype = np.uint8 if len(self.tileset.tiles) <= 256 else np.uint16
+        self._map = np.asarray(tiles, dtype=dtype)
+        self._map.flags.writeable = False
+        self._chunks.clear()
+
+    def set_tile(self, row: int, column: int, tile: int):
+        """Change a single tile"""
+        self._map.flags.writeable = True
+        self._map[row, column] = tile
+        self._map.flags.writeable = False
+        self._chunks.pop((row // self.chunk_size, column // self.chunk_size), None)
+
+    def chunk(self, key: tuple[int, int]) -> pygame.Surface:
+        """Return the rendered surface of the chunk at (chunk row, chunk column)"""
+        surface = self._chunks.get(key)
+        if surface is not None:
+            self._chunks.move_to_end(key)
+            return surface
+
+        size = self.tile_size
+        row, column = key[0] * self.chunk_size, key[1] * self.chunk_size
+        rows = slice(row, row + self.chunk_size)
+        columns = slice(column, column + self.chunk_size)
+        cells = self._map[rows, columns]
+        surface = pygame.Surface((cells.shape[1] * size, cells.shape[0] * size))
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        tiles = self.tileset.tiles
+        surface.blits(
+            [
+                (tiles[tile], (j * size, i * size))
+                for (i, j), tile in np.ndenumerate(cells)
+            ],
+            doreturn=False,
+        )
+        self.rendered += 1
+
+        self._chunks[key] = surface
+        if len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+            self.evicted += 1
+        return surface
+
+    def draw(
+        self,
+        target: pygame.Surface,
+        view: pygame.Rect,
+        dest: tuple[int, int] = (0, 0),
+        areas: list[pygame.Rect] | None = None,
+    ):
+        """Blit the part of the map inside `view` onto target at `dest`
+
+        With `areas`, only those parts of the view are drawn.
+        """
+        chunk_pixels = self.chunk_size * self.tile_size
+        for area in areas if areas is not None else [view]:
+            area = area.clip(view).clip(self.rect)
+            if not area:
+                continue
+            for chunk_row in range(
+                area.top // chunk_pixels, (area.bottom - 1) // chunk_pixels + 1
+            ):
+                for chunk_column in range(
+                    area.left // chunk_pixels, (area.right - 1) // chunk_pixels + 1
+                ):
+                    surface = self.chunk((chunk_row, chunk_column))
+                    origin = (chunk_column * chunk_pixels, chunk_row * chunk_pixels)
+                    part = area.clip(surface.get_rect(topleft=origin))
+                    target.blit(
+                        surface,
+                        (dest[0] + part.x - view.x, dest[1] + part.y - view.y),
+                        part.move(-origin[0], -origin[1]),
+                    )
+
+    def __str__(self):
+        return (
+            f"{self.__class__.__name__} {self.size} chunks:{len(self._chunks)} "
+            f"rendered:{self.rendered} evicted:{self.evicted}"
+        )
+
+
+class Camera:
+    """A view onto a world, in world pixels"""
+
+    def __init__(self, size: tuple[int, int], world: pygame.Rect):
+        self.rect = pygame.Rect((0, 0), size)
+        self.world = world
+
+    def follow(self, target: pygame.Rect) -> bool:
+        """Center the view on target, staying inside the world
+
+        Returns True if the view moved.
+        """
+        previous = self.rect.topleft
+        self.rect.center = target.center
+        self.rect.clamp_ip(self.world)
+        return self.rect.topleft != previous
+
+    def to_screen(
+        self, rect: pygame.Rect, dest: tuple[int, int] = (0, 0)
+    ) -> pygame.Rect:
+        """Convert a world rect to screen coordinates for a view drawn at dest"""
+        return rect.move(dest[0] - self.rect.x, dest[1] - self.rect.y)
@@ -0,0 +1,246 @@
+"""Turn scheduling
+
+A turn scheduler decides when the moves submitted by the players of a game are
+resolved:
+
+- `RoundRobin`: players move one at a time, in the order they joined.
+- `Simultaneous`: every player submits one move per round, and the round is
+  resolved in one batch once all moves are in.
+
+With a timeout, a player who doesn't move in time loses the turn, or the round
+is resolved without them, so a stalled client can't block the others. Nothing
+here runs on its own: call `expire` at the `deadline`.
+
+Schedulers return the moves to resolve as a list of turns, each a list of
+(player id, move) pairs resolved together. A turn may be empty when a player
+timed out.
+
+`snapshot` returns the state of the current turn as plain data, referring to
+players by the order they were added in, so it can be restored into a new
+scheduler with the same players.
+"""
+from abc import ABC, abstractmethod
+from enum import Enum
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+# Moves to resolve, see the module docstring
+Turns = list[list[tuple[Hashable, Any]]]
+
+
+class TurnMode(Enum):
+    """How the players of a game take turns"""
+
+    ROUND_ROBIN = "round-robin"
+    SIMULTANEOUS = "simultaneous"
+
+    def __str__(self):
+        return self.value
+
+
+class TurnScheduler(ABC):
+    """Base class for turn schedulers
+
+    The clock of the timeout runs once `start` was called.
+    """
+
+    def __init__(
+        self, timeout: float | None = None, clock: Callable[[], float] = monotonic
+    ):
+        self.timeout = timeout
+        self.clock = clock
+        # when the current turn started
+        self.started: float | None = None
+
+    @property
+    def deadline(self) -> float | None:
+        """`clock` time at which the current turn times out"""
+        if self.timeout is None or self.started is None:
+            return None
+        return self.started + self.timeout
+
+    def start(self):
+        """Start timing the turns"""
+        self.started = self.clock()
+
+    @abstractmethod
+    def add(self, player_id: Hashable):
+        """Add a player"""
+
+    @abstractmethod
+    def remove(self, player_id: Hashable) -> Turns:
+        """Remove a player and return the moves this resolves"""
+
+    @abstractmethod
+    def submit(self, player_id: Hashable, move) -> Turns:
+        """Submit a player's move and return the moves to resolve
+
+        Raises RuntimeError if the player can't move now.
+        """
+
+    @abstractmethod
+    def expects(self, player_id: Hashable) -> bool:
+        """Return True if the player can move now"""
+
+    @abstractmethod
+    def expire(self) -> Turns:
+        """Time out the current turn if overdue and return the moves to resolve"""
+
+    def snapshot(self, encode: Callable[[Any], Any] = lambda move: move) -> dict:
+        """Return the state of the current turn, see the module docstring
+
+        `encode` converts submitted moves to plain data.
+        """
+        return {}
+
+    def restore(self, state: dict, decode: Callable[[Any], Any] = lambda move: move):
+        """Resume the current turn of a `snapshot`
+
+        Add the players first. `decode` converts moves back. The turn is timed
+        from `start` on, as a new one.
+        """
+
+    def _overdue(self) -> bool:
+        deadline = self.deadline
+        return deadline is not None and self.clock() >= deadline
+
+    def _restart(self):
+        if self.started is not None:
+            self.started = self.clock()
+
+
+class RoundRobin(TurnScheduler):
+    """Players move one after the other, in the order they joined"""
+
+    def __init__(
+        self, timeout: float | None = None, clock: Callable[[], float] = monotonic
+    ):
+        super().__init__(timeout, clock)
+        self.order: list[Hashable] = []
+        # index in `order` of the player to move
+        self.current = 0
+
+    def add(self, player_id: Hashable):
+        """Add a player, who moves last in every round"""
+        self.order.append(player_id)
+
+    def remove(self, player_id: Hashable) -> Turns:
+        """Remove a player; if it was their turn, the next player's turn starts"""
+        index = self.order.index(player_id)
+        del self.order[index]
+        if index < self.current:
+            self.current -= 1
+        elif index == self.current:
+            self._restart()
+        if self.current >= len(self.order):
+            self.current = 0
+        return []
+
+    def submit(self, player_id: Hashable, move) -> Turns:
+        """Resolve the move if it's the player's turn"""
+        if not self.order or self.order[self.current] != player_id:
+            raise RuntimeError("not your turn")
+        self._advance()
+        return [[(player_id, move)]]
+
+    def expects(self, player_id: Hashable) -> bool:
+        """Return True if it's the player's turn"""
+        return bool(self.order) and self.order[self.current] == player_id
+
+    def expire(self) -> Turns:
+        """Skip the player to move if they are out of time"""
+        if not self.order or not self._overdue():
+            return []
+        self._advance()
+        return [[]]
+
+    def snapshot(self, encode: Callable[[Any], Any] = lambda move: move) -> dict:
+        """Return whose turn it is"""
+        return {"current": self.current}
+
+    def restore(self, state: dict, decode: Callable[[Any], Any] = lambda move: move):
+        """Resume the turn of the player who was to move"""
+        self.current = state["current"] if self.order else 0
+
+    def _advance(self):
+        self.current = (self.current + 1) % len(self.order)
+        self._restart()
+
+
+class Simultaneous(TurnScheduler):
+    """Every player moves once per round, all moves are resolved together"""
+
+    def __init__(
+        self, timeout: float | None = None, clock: Callable[[], float] = monotonic
+    ):
+        super().__init__(timeout, clock)
+        # insertion ordered set of the players
+        self.players: dict[Hashable, None] = {}
+        # moves of the current round
+        self.pending: dict[Hashable, Any] = {}
+
+    def add(self, player_id: Hashable):
+        """Add a player, who takes part from the current round on"""
+        self.players[player_id] = None
+
+    def remove(self, player_id: Hashable) -> Turns:
+        """Remove a player; resolves the round if everybody else has moved"""
+        del self.players[player_id]
+        self.pending.pop(player_id, None)
+        return self._complete()
+
+    def submit(self, player_id: Hashable, move) -> Turns:
+        """Record the move; resolves the round if it was the last one missing"""
+        if player_id not in self.players:
+            raise RuntimeError("not in this game")
+        if player_id in self.pending:
+            raise RuntimeError("already moved this round")
+        self.pending[player_id] = move
+        return self._complete()
+
+    def expects(self, player_id: Hashable) -> bool:
+        """Return True if the player hasn't moved this round"""
+        return player_id in self.players and player_id not in self.pending
+
+    def expire(self) -> Turns:
+        """Resolve the round without the missing moves if it is overdue"""
+        if not self.players or not self._overdue():
+            return []
+        return [self._resolve()]
+
+    def snapshot(self, encode: Callable[[Any], Any] = lambda move: move) -> dict:
+        """Return the moves of the current round"""
+        index = {player_id: i for i, player_id in enumerate(self.players)}
+        return {
+            "pending": [
+                [index[player_id], encode(move)]
+                for player_id, move in self.pending.items()
+            ]
+        }
+
+    def restore(self, state: dict, decode: Callable[[Any], Any] = lambda move: move):
+        """Resume the round with the moves already submitted"""
+        players = list(self.players)
+        self.pending = {players[i]: decode(move) for i, move in state["pending"]}
+
+    def _complete(self) -> Turns:
+        if self.pending and len(self.pending) == len(self.players):
+            return [self._resolve()]
+        return []
+
+    def _resolve(self) -> list[tuple[Hashable, Any]]:
+        moves = list(self.pending.items())
+        self.pending.clear()
+        self._restart()
+        return moves
+
+
+SCHEDULERS: dict[TurnMode, type[TurnScheduler]] = {
+    TurnMode.ROUND_ROBIN: RoundRobin,
+    TurnMode.SIMULTANEOUS: Simultaneous,
+}
+
+
+def scheduler(mode: TurnMode, timeout: float | None = None) -> TurnScheduler:
+    """Return a new scheduler for a turn mode"""
+    return SCHEDULERS[mode](timeout)
@@ -0,0 +1,178 @@
+"""Fields of view
+
+A player sees the cells within `radius` cells of its own on each axis to which
+its line of sight isn't blocked. Stones and trees block sight, like they block
+walking, so the cells which can be seen through are the passable ones of
+`Map.passable`. A blocking cell is seen itself, it only hides what lies behind
+it.
+
+The line of sight to a cell at (dx, dy) from the player, k = max(|dx|, |dy|)
+cells away, passes the cells at
+
+    (floor(dx * t / k + 1/2), floor(dy * t / k + 1/2))  for 0 < t < k
+
+Rounding halves up the same way in both directions makes the line from A to B
+the same cells as the line from B to A, so sight is symmetric: a player sees
+another exactly when the other sees it.
+
+The lines to every cell of the (2 radius + 1)^2 window around a player are
+precomputed once per radius as offsets into the window, and the fields of view
+of many players are marched at once: their windows of blocking cells are copied
+out side by side, a single gather looks up every cell of every line of every
+player, and a cell is seen if none of the cells before it on its line block
+sight. The blocking cells are padded with `radius` blocked cells on every side
+so windows never leave the grid.
+
+`Sight` caches the field of view of every player and only recomputes those of
+the players which moved, or around which a blocking cell changed.
+"""
+from functools import lru_cache
+from typing import Hashable
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Players whose fields of view are marched in one gather, to bound its memory
+BATCH = 256
+
+
+@lru_cache(maxsize=None)
+def lines(radius: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return the lines of sight to every cell of the window around a player
+
+    Returns the (dy, dx) offsets of the cells of every line, of shape
+    `(cells, radius - 1)`, window cells in row order. Shorter lines are padded
+    with the player's own cell, which players never share with a stone or tree.
+    """
+    offsets = np.arange(-radius, radius + 1)
+    dy, dx = (a.ravel() for a in np.meshgrid(offsets, offsets, indexing="ij"))
+    k = np.maximum(np.maximum(abs(dx), abs(dy)), 1)[:, None]
+    t = np.arange(1, max(radius, 1))[None, :]
+    on_line = t < k
+    # floor(d * t / k + 1/2) in integers, so halves are exact
+    ys = np.where(on_line, (2 * dy[:, None] * t + k) // (2 * k), 0).astype(np.intp)
+    xs = np.where(on_line, (2 * dx[:, None] * t + k) // (2 * k), 0).astype(np.intp)
+    for array in (ys, xs):
+        array.flags.writeable = False
+    return ys, xs
+
+
+class FieldOfView:
+    """The cells seen from (x, y)
+
+    `mask` covers the window of `radius` cells around (x, y) on each axis,
+    indexed `[y, x]` from its top left corner. Nothing outside of it is seen.
+    """
+
+    __slots__ = ("x", "y", "radius", "mask", "_rows")
+
+    def __init__(self, x: int, y: int, radius: int, mask: np.ndarray):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.mask = mask
+        self._rows: list[list[bool]] | None = None
+
+    def sees(self, x: int, y: int) -> bool:
+        """Return True if the cell at (x, y) is seen"""
+        column = x - self.x + self.radius
+        row = y - self.y + self.radius
+        size = 2 * self.radius + 1
+        if not (0 <= column < size and 0 <= row < size):
+            return False
+        if self._rows is None:
+            # faster to index one cell at a time than the array
+            self._rows = self.mask.tolist()
+        return self._rows[row][column]
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.x}, {self.y}, radius={self.radius})"
+
+
+class Sight:
+    """Cached fields of view of `radius` cells, see the module docstring"""
+
+    def __init__(self, radius: int):
+        self.radius = radius
+        self.fields: dict[Hashable, FieldOfView] = {}
+        # grid version each field was last checked against, and the blocking
+        # cells of its window then, flattened
+        self._windows: dict[Hashable, tuple[int, np.ndarray]] = {}
+        # windows of the padded blocking and inside-the-map cells of the grid
+        # `_version`, indexed by their top left corner
+        self._version: int | None = None
+        self._blocked: np.ndarray | None = None
+        self._inside: np.ndarray | None = None
+        # lines of sight as flat offsets into a window
+        dy, dx = lines(radius)
+        self._lines = (dy + radius) * (2 * radius + 1) + dx + radius
+
+    def update(
+        self, passable: np.ndarray, version: int, positions: dict[Hashable, tuple[int, int]]
+    ) -> dict[Hashable, FieldOfView]:
+        """Return the fields of view from `positions` over the `passable` cells
+
+        `version` must change whenever `passable` does, like `Map.version`.
+        Fields of players which didn't move are only recomputed if a blocking
+        cell of their window changed.
+        """
+        stale, kept = [], []
+        for key, position in positions.items():
+            field = self.fields.get(key)
+            if field is None or (field.x, field.y) != position:
+                stale.append(key)
+            elif self._windows[key][0] != version:
+                kept.append(key)
+        if version != self._version:
+            self._pad(passable, version)
+        if kept:
+            windows = self._gather(kept, positions)
+            before = np.stack([self._windows[key][1] for key in kept])
+            for key, window, changed in zip(kept, windows, (windows != before).any(1).tolist()):
+                if changed:
+                    stale.append(key)
+                else:
+                    self._windows[key] = version, window
+        for start in range(0, len(stale), BATCH):
+            self._compute(stale[start:start + BATCH], positions)
+        return {key: self.fields[key] for key in positions}
+
+    def discard(self, key: Hashable):
+        """Forget the field of view of a player"""
+        self.fields.pop(key, None)
+        self._windows.pop(key, None)
+
+    def _pad(self, passable: np.ndarray, version: int):
+        """Pad the blocking cells of a new grid version"""
+        radius = self.radius
+        size = 2 * radius + 1
+        blocked = np.pad(~passable, radius, constant_values=True)
+        inside = np.pad(np.ones_like(passable), radius, constant_values=False)
+        self._blocked = sliding_window_view(blocked, (size, size))
+        self._inside = sliding_window_view(inside, (size, size))
+        self._version = version
+
+    def _gather(self, keys: list[Hashable], positions: dict) -> np.ndarray:
+        """Return the blocking cells of the windows of players, one row each
+
+        The window of a player at (x, y) starts at (x, y) of the padded grid.
+        """
+        xs, ys = np.array([positions[key] for key in keys]).T
+        return self._blocked[ys, xs].reshape(len(keys), -1)
+
+    def _compute(self, keys: list[Hashable], positions: dict):
+        """March the fields of view of players"""
+        if not keys:
+            return
+        radius = self.radius
+        size = 2 * radius + 1
+        windows = self._gather(keys, positions)
+        # players last, so the gather copies runs of them
+        hidden = np.ascontiguousarray(windows.T)[self._lines].any(axis=1).T
+        xs, ys = np.array([positions[key] for key in keys]).T
+        masks = ~hidden & self._inside[ys, xs].reshape(len(keys), -1)
+        masks.flags.writeable = False
+        for key, mask, window in zip(keys, masks, windows):
+            x, y = positions[key]
+            self.fields[key] = FieldOfView(x, y, radius, mask.reshape(size, size))
+            self._windows[key] = self._version, window
@@ -0,0 +1,409 @@
+"""Multi-process server
+
+One server process runs every match on one event loop, so it can use one core
+at most. `main` spreads the matches over several worker processes instead,
+each running `server.main` with its own rooms:
+
+    python -m the_game.workers --workers 4 --port 8001
+
+The launcher process is the router: it accepts the connections on the public
+port and passes every socket on to a worker over a pipe, before reading a byte
+of it. The worker adopts the socket and runs the websocket handshake itself,
+so once the socket is passed on, the router has no part in the connection.
+
+A match is played within one worker, so the router does the matchmaking
+across workers: new players go to a worker with an open seat, filling rooms
+which wait for players first, and a new room is opened on the next worker in
+turn otherwise. The router counts the seats it fills and opens itself. Workers
+report how many seats they have open over the pipe whenever a client joins or
+leaves, and the router takes a report over once the worker has settled every
+connection it was passed, so a waiting player who left frees their seat.
+
+Matches restored from snapshots are on the worker which saved them. A client
+resuming a match connects with its token in the query string, so while any
+worker waits for players to resume, the router peeks at the request line of
+new connections to pass those to the right worker.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+from dataclasses import replace
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from multiprocessing.reduction import recv_handle, send_handle
+from pathlib import Path
+from time import monotonic
+from urllib.parse import parse_qs, urlsplit
+
+from websockets.server import WebSocketServer, WebSocketServerProtocol
+
+from . import server
+from .codec import SUBPROTOCOLS
+
+LOG = logging.getLogger(__name__)
+
+# Pending connections of the public port
+BACKLOG = 1024
+# Bytes of a request to peek at for the resume token, and seconds to wait
+# for its request line
+REQUEST_LINE_LIMIT = 4096
+PEEK_TIMEOUT = 5.0
+PEEK_INTERVAL = 0.005
+# Seconds the workers get to shut down, e.g. to save snapshots, before they are
+# terminated
+SHUTDOWN_TIMEOUT = 10.0
+
+
+def worker_config(config: server.ServerConfig, index: int) -> server.ServerConfig:
+    """Return the config of a worker
+
+    Workers listen on a private port, and keep snapshots and replays in a
+    directory of their own. Each serves metrics on the next port.
+    """
+    config = replace(config, host="localhost", port=0)
+    if config.snapshot_dir is not None:
+        config.snapshot_dir = str(Path(config.snapshot_dir) / f"worker{index}")
+    if config.replay_dir is not None:
+        config.replay_dir = str(Path(config.replay_dir) / f"worker{index}")
+    if config.metrics_port is not None:
+        config.metrics_port += index
+    return config
+
+
+class Worker:
+    """Serve the connections passed over `pipe` with `server.handler`
+
+    Reports `("seats", settled, open seats)` whenever a client joins, resumes,
+    watches or leaves a room, where `settled` counts the connections passed
+    which did any of that or closed. Reports `("tokens", ids)` with the ids of the
+    players of restored matches who may still resume.
+    """
+
+    def __init__(self, pipe: Connection):
+        self.pipe = pipe
+        self.settled = 0
+        # connections passed which haven't joined or resumed yet
+        self.unsettled: set[WebSocketServerProtocol] = set()
+        self.ws_server: WebSocketServer | None = None
+        self.main: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def start(self, ws_server: WebSocketServer):
+        """Start receiving connections for a running websocket server"""
+        self.ws_server = ws_server
+        self.main = asyncio.current_task()
+        server.rooms.on_change = self.settle
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.pipe.fileno(), self.receive)
+        self.report_tokens()
+        if server.rooms.vacant:
+            loop.call_later(server.config.resume_timeout, self.report_tokens)
+        self.report()
+
+    def receive(self):
+        """Adopt the next socket passed by the router"""
+        try:
+            fd = recv_handle(self.pipe)
+        except EOFError:
+            LOG.error("the router is gone, shutting down")
+            asyncio.get_running_loop().remove_reader(self.pipe.fileno())
+            self.main.cancel()
+            return
+        task = asyncio.create_task(self.adopt(socket.socket(fileno=fd)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def adopt(self, sock: socket.socket):
+        """Run the websocket protocol on an accepted socket"""
+        loop = asyncio.get_running_loop()
+        try:
+            _, protocol = await loop.connect_accepted_socket(self.protocol, sock)
+        except OSError as exc:
+            LOG.info("failed to adopt a connection: %s", exc)
+            sock.close()
+            self.settled += 1
+            self.report()
+            return
+        # a connection may close before it reaches the lobby
+        protocol.handler_task.add_done_callback(lambda _: self.settle(protocol))
+
+    def protocol(self) -> WebSocketServerProtocol:
+        """Return the protocol of a new connection"""
+        protocol = WebSocketServerProtocol(
+            server.handler, self.ws_server, subprotocols=SUBPROTOCOLS
+        )
+        self.unsettled.add(protocol)
+        return protocol
+
+    def settle(self, client):
+        """Count a passed connection as settled and report the open seats"""
+        if client in self.unsettled:
+            self.unsettled.discard(client)
+            self.settled += 1
+        self.report()
+
+    def report(self):
+        """Report the open seats to the router"""
+        self._send(("seats", self.settled, server.rooms.open_seats))
+
+    def report_tokens(self):
+        """Report the players who may resume to the router"""
+        self._send(("tokens", [str(player_id) for player_id in server.rooms.vacant]))
+
+    def _send(self, message: tuple):
+        try:
+            self.pipe.send(message)
+        except OSError:
+            # the router is gone, the clients leave while shutting down
+            pass
+
+
+def work(index: int, pipe: Connection, config: server.ServerConfig):
+    """Worker process entrypoint"""
+    worker = Worker(pipe)
+    LOG.info("worker %d started, pid %d", index, os.getpid())
+    try:
+        asyncio.run(server.main(worker_config(config, index), worker.start))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+def listen(host: str, port: int) -> list[socket.socket]:
+    """Return non-blocking sockets listening on every address of `host`
+
+    An empty host means all interfaces, as for `loop.create_server`.
+    """
+    infos = socket.getaddrinfo(
+        host or None, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE
+    )
+    listeners = []
+    for family, kind, proto, _, address in dict.fromkeys(infos):
+        sock = socket.socket(family, kind, proto)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+        sock.bind(address)
+        sock.listen(BACKLOG)
+        sock.setblocking(False)
+        listeners.append(sock)
+    return listeners
+
+
+async def request_path(sock: socket.socket) -> str | None:
+    """Peek at the path of the HTTP request on a socket without consuming it
+
+    Returns None if the request line doesn't arrive in time or isn't one.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PEEK_TIMEOUT
+    while loop.time() < deadline:
+        try:
+            data = sock.recv(REQUEST_LINE_LIMIT, socket.MSG_PEEK)
+        except BlockingIOError:
+            data = b""
+        except OSError:
+            return None
+        line, end, _ = data.partition(b"\r\n")
+        if end:
+            parts = line.split()
+            return parts[1].decode("latin-1") if len(parts) == 3 else None
+        if len(data) >= REQUEST_LINE_LIMIT:
+            return None
+        # the socket stays readable with the peeked bytes, so poll
+        await asyncio.sleep(PEEK_INTERVAL)
+    return None
+
+
+class Router:
+    """Pass the connections of the public port on to the workers
+
+    `pipes` lead to the workers, `players` is the number of players per match
+    who connect, i.e. who aren't bots.
+    See the module docstring for the matchmaking.
+    """
+
+    def __init__(self, pipes: list[Connection], pids: list[int], players: int):
+        self.pipes = pipes
+        self.pids = pids
+        self.players = players
+        # connections passed to each worker, and the seats it has open
+        self.routed = [0] * len(pipes)
+        self.seats = [0] * len(pipes)
+        # worker of each player who may resume a restored match
+        self.tokens: dict[str, int] = {}
+        self._next = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    def route(self, token: str | None = None) -> int:
+        """Return the worker to pass a new connection to"""
+        index = self.tokens.pop(token, None) if token is not None else None
+        if index is None:
+            for index, seats in enumerate(self.seats):
+                if seats:
+                    self.seats[index] -= 1
+                    break
+            else:
+                index = self._next
+                self._next = (self._next + 1) % len(self.pipes)
+                self.seats[index] += self.players - 1
+        self.routed[index] += 1
+        return index
+
+    def receive(self, index: int):
+        """Process a report of a worker"""
+        message = self.pipes[index].recv()
+        match message:
+            case ("seats", settled, seats):
+                # otherwise the seats filled by connections in flight are missing
+                if settled == self.routed[index]:
+                    self.seats[index] = seats
+            case ("tokens", tokens):
+                self.tokens = {t: i for t, i in self.tokens.items() if i != index}
+                self.tokens.update(dict.fromkeys(tokens, index))
+            case _:
+                LOG.error("invalid report from worker %d: %s", index, message)
+
+    def pass_on(self, sock: socket.socket, token: str | None = None):
+        """Pass an accepted socket on to its worker"""
+        index = self.route(token)
+        try:
+            send_handle(self.pipes[index], sock.fileno(), self.pids[index])
+        finally:
+            sock.close()
+
+    async def dispatch(self, sock: socket.socket):
+        """Pass a connection on which may resume a restored match"""
+        path = await request_path(sock)
+        token = None
+        if path is not None:
+            token = parse_qs(urlsplit(path).query).get("resume", [None])[0]
+        self.pass_on(sock, token)
+
+    async def accept(self, listener: socket.socket):
+        """Accept connections until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            sock, _ = await loop.sock_accept(listener)
+            if self.tokens:
+                task = asyncio.create_task(self.dispatch(sock))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            else:
+                self.pass_on(sock)
+
+    async def run(self, listeners: list[socket.socket]):
+        """Route connections until a worker exits"""
+        loop = asyncio.get_running_loop()
+        gone = loop.create_future()
+
+        def receive(index: int):
+            try:
+                self.receive(index)
+            except EOFError:
+                loop.remove_reader(self.pipes[index].fileno())
+                if not gone.done():
+                    gone.set_result(index)
+
+        for index, pipe in enumerate(self.pipes):
+            loop.add_reader(pipe.fileno(), receive, index)
+        accepting = [asyncio.create_task(self.accept(sock)) for sock in listeners]
+        try:
+            index = await gone
+            LOG.error("worker %d exited, shutting down", index)
+        finally:
+            for task in accepting:
+                task.cancel()
+            for pipe in self.pipes:
+                loop.remove_reader(pipe.fileno())
+
+
+def main(argv: list[str] | None = None):
+    """Multi-process server entrypoint
+
+    Options other than `--workers` are those of `the_game.server`.
+    """
+    parser = argparse.ArgumentParser(
+        description="Run The Game server in several processes",
+        epilog="Other options are passed on to the_game.server",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="worker processes, one per core by default",
+    )
+    args, rest = parser.parse_known_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    config = server.parse_args(rest)
+
+    # spawn, so no worker inherits the pipes of the others
+    context = multiprocessing.get_context("spawn")
+    pipes, processes = [], []
+    for index in range(args.workers):
+        pipe, child = context.Pipe()
+        process = context.Process(
+            target=work, args=(index, child, config), name=f"worker{index}"
+        )
+        process.start()
+        child.close()
+        pipes.append(pipe)
+        processes.append(process)
+    router = Router(
+        pipes, [process.pid for process in processes], config.players - config.bots
+    )
+    try:
+        # only accept connections once every worker serves
+        for index in range(args.workers):
+            router.receive(index)
+        listeners = listen(config.host, config.port)
+    except KeyboardInterrupt:
+        for pipe in pipes:
+            pipe.close()
+        stop(processes)
+        return
+    except (EOFError, OSError) as exc:
+        for process in processes:
+            process.terminate()
+        if isinstance(exc, EOFError):
+            raise SystemExit(f"worker {index} failed to start") from exc
+        raise
+    for sock in listeners:
+        LOG.info("routing %s to %d workers", sock.getsockname(), args.workers)
+
+    try:
+        asyncio.run(router.run(listeners))
+    except KeyboardInterrupt:
+        # the workers got the interrupt too and shut down on their own
+        pass
+    finally:
+        for sock in listeners:
+            sock.close()
+        for pipe in pipes:
+            pipe.close()
+        stop(processes)
+
+
+def stop(processes: list[BaseProcess]):
+    """Wait for the workers to exit, terminating them after SHUTDOWN_TIMEOUT
+
+    Interrupting the wait terminates them right away.
+    """
+    deadline = monotonic() + SHUTDOWN_TIMEOUT
+    try:
+        for process in processes:
+            process.join(max(deadline - monotonic(), 0))
+    except KeyboardInterrupt:
+        pass
+    for process in processes:
+        if process.is_alive():
+            LOG.warning("terminating %s", process.name)
+            process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    main()